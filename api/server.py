@@ -1,23 +1,23 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
 import pymysql
+from dbutils.pooled_db import PooledDB
 from contextlib import contextmanager
 import io
 import json
@@ -25,10 +25,156 @@ from openpyxl import load_workbook
 import math
 import random
 import string
+import orjson
+import numpy as np
+from decimal import Decimal
+import re
+import time
+import threading
+import hashlib
+import hmac
+from contextvars import ContextVar
+import weakref
+import textwrap
+import bisect
+import heapq
+from datetime import date
+from collections import OrderedDict
+import asyncio
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from urllib.parse import quote, urlsplit
+from collections import Counter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ==========================================
+# OBSERVABILITY (latency, DB time, query counts)
+# ==========================================
+
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_MS', 200)) / 1000
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-request counters, set by MetricsMiddleware and filled in by InstrumentedCursor
+_request_stats: ContextVar[Optional[dict]] = ContextVar('request_stats', default=None)
+
+_metrics_lock = threading.Lock()
+ROUTE_METRICS = {}   # (method, route) -> aggregated counters
+SLOW_QUERIES = {}    # (route, fingerprint) -> count
+
+_FP_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_FP_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_FP_SPACE = re.compile(r"\s+")
+
+def sql_fingerprint(sql: str) -> str:
+    """Normalize a SQL statement so queries differing only by literals group together"""
+    fp = _FP_STRING.sub('?', sql)
+    fp = fp.replace('%s', '?')
+    fp = _FP_NUMBER.sub('?', fp)
+    fp = _FP_LIST.sub('(?+)', fp)
+    return _FP_SPACE.sub(' ', fp).strip()
+
+class InstrumentedCursor(pymysql.cursors.DictCursor):
+    """DictCursor that records statement count, DB time and rows into the current request's stats"""
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = _request_stats.get()
+            if stats is not None:
+                stats['queries'] += 1
+                stats['db_time'] += elapsed
+                if self.description is not None:
+                    stats['rows'] += max(self.rowcount, 0)
+            if elapsed >= SLOW_QUERY_SECONDS:
+                route = route_label(stats['scope']) if stats else 'background'
+                fingerprint = sql_fingerprint(query)
+                with _metrics_lock:
+                    key = (route, fingerprint)
+                    SLOW_QUERIES[key] = SLOW_QUERIES.get(key, 0) + 1
+                logging.warning(f"SLOW QUERY {elapsed * 1000:.0f}ms [{route}]: {fingerprint}")
+
+def route_label(scope) -> str:
+    """FastAPI stores the matched APIRoute in the scope; its path template keeps label cardinality low"""
+    route = scope.get('route')
+    return getattr(route, 'path', None) or 'unmatched'
+
+def record_request_metrics(method: str, route: str, status: int, latency: float, stats: dict, payload_bytes: int):
+    with _metrics_lock:
+        m = ROUTE_METRICS.get((method, route))
+        if m is None:
+            m = ROUTE_METRICS[(method, route)] = {
+                'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'latency_sum': 0.0,
+                'queries': 0, 'db_time': 0.0, 'rows': 0, 'bytes': 0, 'errors': 0,
+            }
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                m['buckets'][i] += 1
+        m['count'] += 1
+        m['latency_sum'] += latency
+        m['queries'] += stats['queries']
+        m['db_time'] += stats['db_time']
+        m['rows'] += stats['rows']
+        m['bytes'] += payload_bytes
+        if status >= 500:
+            m['errors'] += 1
+
+def _prom_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def render_prometheus_metrics() -> str:
+    """Render the in-process registry in Prometheus text exposition format"""
+    with _metrics_lock:
+        routes = {k: dict(v, buckets=list(v['buckets'])) for k, v in ROUTE_METRICS.items()}
+        slow = dict(SLOW_QUERIES)
+
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), m in sorted(routes.items()):
+        labels = f'method="{method}",route="{_prom_label(route)}"'
+        for bound, count in zip(LATENCY_BUCKETS, m['buckets']):
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m["count"]}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {m["latency_sum"]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {m["count"]}')
+
+    counters = [
+        ('http_request_errors_total', 'Requests answered with a 5xx status', 'errors', '{}'),
+        ('db_queries_total', 'SQL statements executed', 'queries', '{}'),
+        ('db_time_seconds_total', 'Time spent waiting on the database', 'db_time', '{:.6f}'),
+        ('db_rows_returned_total', 'Rows returned by SELECT statements', 'rows', '{}'),
+        ('http_response_bytes_total', 'Response payload bytes', 'bytes', '{}'),
+    ]
+    for name, help_text, field, fmt in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (method, route), m in sorted(routes.items()):
+            lines.append(f'{name}{{method="{method}",route="{_prom_label(route)}"}} {fmt.format(m[field])}')
+
+    with _metrics_lock:
+        sweeper = dict(SWEEPER_STATS)
+    for name, help_text, field in [
+        ('session_sweeper_runs_total', 'Attendance session sweeper runs', 'runs'),
+        ('session_sweeper_archived_total', 'Expired attendance sessions moved to the archive', 'archived'),
+        ('session_sweeper_otps_released_total', 'Expired OTP reservations released', 'otps_released'),
+    ]:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {sweeper[field]}")
+
+    lines.append(f"# HELP db_slow_queries_total Statements slower than {SLOW_QUERY_SECONDS * 1000:.0f}ms by SQL fingerprint")
+    lines.append("# TYPE db_slow_queries_total counter")
+    for (route, fingerprint), count in sorted(slow.items()):
+        lines.append(f'db_slow_queries_total{{route="{_prom_label(route)}",fingerprint="{_prom_label(fingerprint)}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
 # TiDB Connection Configuration
 DB_CONFIG = {
     'host': os.environ.get('DB_HOST'),
@@ -37,15 +183,74 @@ DB_CONFIG = {
     'password': os.environ.get('DB_PASSWORD'),
     'database': os.environ.get('DB_DATABASE'),
     'ssl': {'ssl': {}},  # TiDB Cloud SSL
-    'cursorclass': pymysql.cursors.DictCursor
+    'ssl_disabled': os.environ.get('DB_SSL', 'true').lower() == 'false',  # local MySQL/MariaDB (benchmarks)
+    'cursorclass': InstrumentedCursor
 }
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default_secret_key')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRY_DAYS = 7
 
+# Fast JSON encoding for DictCursor rows
+def _orjson_default(obj):
+    """Encode the DB types orjson doesn't handle natively, matching jsonable_encoder output"""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, timedelta):  # MySQL TIME columns
+        return obj.total_seconds()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class DBJSONResponse(JSONResponse):
+    """orjson-backed response; datetime/date are serialized natively, Decimal/TIME via _orjson_default.
+
+    Routes returning raw rows should construct this directly so FastAPI skips jsonable_encoder.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+def compute_etag(*parts) -> str:
+    digest = hashlib.blake2b(orjson.dumps(parts, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+def conditional_response(request: Request, etag: str, payload) -> Response:
+    """304 when the client already holds `etag`, otherwise the payload tagged with it"""
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return DBJSONResponse(payload, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+# Per-table version counters for conditional GETs on read-mostly endpoints.
+# Write endpoints call bump_table_version(); readers derive their ETag from the versions of
+# the tables they read, so a matching If-None-Match is answered before touching the DB.
+# Counters are per process: the epoch keeps ETags from different workers/restarts apart, and
+# the time window bounds how long another worker's write can go unnoticed.
+TABLE_VERSIONS = {}
+_VERSION_EPOCH = os.urandom(4).hex()
+CONDITIONAL_WINDOW_SECONDS = 60
+
+def bump_table_version(*tables: str):
+    for table in tables:
+        TABLE_VERSIONS[table] = TABLE_VERSIONS.get(table, 0) + 1
+
+def table_etag(tables, *extra) -> str:
+    versions = [TABLE_VERSIONS.get(t, 0) for t in tables]
+    window = int(time.time() // CONDITIONAL_WINDOW_SECONDS)
+    return compute_etag(_VERSION_EPOCH, window, versions, extra)
+
 # Create the main app
-app = FastAPI(title="Jain-Edu-Hub API", version="2.0.0")
+app = FastAPI(title="Jain-Edu-Hub API", version="2.0.0", default_response_class=DBJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -65,23 +270,79 @@ def rate_limit_handler(request: Request, exc: RateLimitExceeded):
         content={"detail": "Too many login attempts. Please try again later."}
     )
 
+# Limits are applied per route with @limiter.limit. No SlowAPI middleware is installed: it is
+# only needed for default limits, and slowapi 0.1.9's ASGI responder re-sends
+# http.response.start before every body message, which breaks streamed responses.
 app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
-app.add_middleware(SlowAPIMiddleware)
 
 security = HTTPBearer()
 
 # Middleware for Security Headers
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:; connect-src 'self' http://localhost:8000 https://*.onrender.com;"
-        return response
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:; connect-src 'self' http://localhost:8000 https://*.onrender.com;",
+}
+
+class SecurityHeadersMiddleware:
+    """Pure ASGI middleware: appends the security headers to http.response.start.
+
+    Unlike BaseHTTPMiddleware this does not spawn a task or buffer the body
+    through a memory stream, so streaming responses pass straight through.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.raw_headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in SECURITY_HEADERS.items()]
+        self.header_names = {k for k, _ in self.raw_headers}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message['type'] == 'http.response.start':
+                headers = [h for h in message.get('headers', []) if h[0].lower() not in self.header_names]
+                headers.extend(self.raw_headers)
+                message['headers'] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
 
 app.add_middleware(SecurityHeadersMiddleware)
 
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, DB statements/time, rows and payload bytes per route"""
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or scope['path'] == '/metrics':
+            await self.app(scope, receive, send)
+            return
+
+        stats = {'scope': scope, 'queries': 0, 'db_time': 0.0, 'rows': 0}
+        token = _request_stats.set(stats)
+        status = 500
+        payload_bytes = 0
+        start = time.perf_counter()
+
+        async def send_with_metrics(message: Message):
+            nonlocal status, payload_bytes
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                payload_bytes += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _request_stats.reset(token)
+            record_request_metrics(scope['method'], route_label(scope), status,
+                                   time.perf_counter() - start, stats, payload_bytes)
+
 # CORS Configuration - Allow all origins for Vercel deployment
 # Note: With credentials=False, we can use wildcard. Auth is via Bearer token in header.
 app.add_middleware(
@@ -92,14 +353,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
+# Tables added after the initial deployment. Each section registers its DDL here and it is
+# applied once per process on the first connection; re-running it is harmless.
+SCHEMA_STATEMENTS: List[str] = []
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def ensure_schema(connection):
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with connection.cursor() as cursor:
+            for statement in SCHEMA_STATEMENTS:
+                try:
+                    cursor.execute(statement)
+                except pymysql.err.OperationalError as e:
+                    # 1060 duplicate column / 1061 duplicate key name: already migrated
+                    if e.args[0] not in (1060, 1061):
+                        raise
+        connection.commit()
+        _schema_ready = True
+
+# Connections are pooled per process so concurrent work (see /bootstrap) reuses warm TLS
+# sessions instead of handshaking for every query group. A pooled connection is pinged when
+# taken out and rolled back when returned. Transparent reconnect-and-retry is limited to
+# InterfaceError (connection already closed): retrying after an OperationalError such as a
+# deadlock would replay one statement outside the transaction it belonged to.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+_db_pool: Optional[PooledDB] = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool() -> PooledDB:
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = PooledDB(pymysql, maxcached=DB_POOL_SIZE, ping=1,
+                                    failures=(pymysql.err.InterfaceError,), **DB_CONFIG)
+    return _db_pool
+
+# Per-statement time limit (ms) for connections checked out in this context; the server
+# aborts a SELECT that runs longer. Set by callers that prefer an error to a slow answer.
+_statement_time_limit: ContextVar[Optional[int]] = ContextVar('statement_time_limit', default=None)
+QUERY_TIMEOUT_ERRORS = (1317, 3024)  # TiDB / MySQL: query interrupted, max execution time exceeded
+
 # Database connection helper
 @contextmanager
 def get_db_connection():
-    connection = pymysql.connect(**DB_CONFIG)
+    connection = get_db_pool().connection()
+    limit_ms = _statement_time_limit.get()
     try:
+        if not _schema_ready:
+            ensure_schema(connection)
+        if limit_ms:
+            with connection.cursor() as cursor:
+                cursor.execute("SET SESSION max_execution_time = %s", (limit_ms,))
         yield connection
     finally:
-        connection.close()
+        try:
+            if limit_ms:
+                # Pooled connections are shared: never hand one back with the limit still set
+                with connection.cursor() as cursor:
+                    cursor.execute("SET SESSION max_execution_time = DEFAULT")
+        finally:
+            connection.close()
 
 def resolve_department_identifiers(dept_id: str, cursor) -> List[str]:
     """Given a department name or code, return a list containing both [name, code]"""
@@ -113,6 +433,118 @@ def resolve_department_identifiers(dept_id: str, cursor) -> List[str]:
     return [dept_id]
 
 
+# ==========================================
+# KPI ROLLUPS
+# ==========================================
+
+# Per-department counters behind the Admin and HOD dashboards. Write paths adjust them in
+# the same transaction as the row they touch; reconcile_kpi_rollups() rebuilds them from the
+# base tables every ROLLUP_RECONCILE_SECONDS to correct any drift (manual SQL, failed deploys).
+# Metrics: 'users:<role>', 'courses', 'departments', 'leaves:<status>'. Users without a
+# department (parents, admins) are counted under ''.
+SCHEMA_STATEMENTS.append("""
+    CREATE TABLE IF NOT EXISTS kpi_rollups (
+        department VARCHAR(100) NOT NULL DEFAULT '',
+        metric VARCHAR(50) NOT NULL,
+        value INT NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (department, metric)
+    )
+""")
+
+ROLLUP_RECONCILE_SECONDS = int(os.environ.get('ROLLUP_RECONCILE_SECONDS', 3600))
+ROLLUP_META_DEPARTMENT = '__meta__'  # holds the 'reconciled_at' epoch timestamp
+
+def bump_rollups(cursor, deltas):
+    """Apply {(department, metric): delta} to kpi_rollups. Call before conn.commit()."""
+    rows = [(dept or '', metric, delta) for (dept, metric), delta in deltas.items() if delta]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO kpi_rollups (department, metric, value) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+        """, rows)
+
+def leave_status_deltas(department, old_status, new_status):
+    if old_status == new_status:
+        return {}
+    return {(department, f"leaves:{old_status}"): -1, (department, f"leaves:{new_status}"): 1}
+
+_rollup_reconcile_lock = threading.Lock()
+
+def reconcile_kpi_rollups(conn, max_age: Optional[int] = None) -> dict:
+    """Recompute every rollup from the base tables; returns the rows that had drifted.
+
+    The rollup rows are locked before anything is counted: a write path's bump either committed
+    before the counts are taken or waits and lands on top of the rebuilt values. With `max_age`,
+    the rebuild is skipped when another caller finished one less than that many seconds ago.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT department, metric, value FROM kpi_rollups FOR UPDATE")
+        locked = {(r['department'], r['metric']): r['value'] for r in cursor.fetchall()}
+        if max_age is not None and time.time() - locked.get((ROLLUP_META_DEPARTMENT, 'reconciled_at'), 0) < max_age:
+            conn.rollback()
+            return {}
+        current = {key: value for key, value in locked.items() if key[0] != ROLLUP_META_DEPARTMENT}
+
+        expected = Counter()
+        cursor.execute("SELECT department, role, COUNT(*) as count FROM users GROUP BY department, role")
+        for r in cursor.fetchall():
+            expected[(r['department'] or '', f"users:{r['role']}")] += r['count']
+        cursor.execute("SELECT department, COUNT(*) as count FROM courses GROUP BY department")
+        for r in cursor.fetchall():
+            expected[(r['department'] or '', 'courses')] += r['count']
+        cursor.execute("SELECT department, status, COUNT(*) as count FROM leave_requests GROUP BY department, status")
+        for r in cursor.fetchall():
+            expected[(r['department'] or '', f"leaves:{r['status']}")] += r['count']
+        cursor.execute("SELECT COUNT(*) as count FROM departments")
+        expected[('', 'departments')] = cursor.fetchone()['count']
+
+        drift = {f"{dept}/{metric}": {"stored": current.get((dept, metric), 0), "actual": expected.get((dept, metric), 0)}
+                 for dept, metric in set(current) | set(expected)
+                 if current.get((dept, metric), 0) != expected.get((dept, metric), 0)}
+
+        # Only rows this run locked are rewritten; a counter created meanwhile is left to its writer
+        gone = [key for key in current if key not in expected]
+        if gone:
+            cursor.executemany("DELETE FROM kpi_rollups WHERE department = %s AND metric = %s", gone)
+        rows = [(dept, metric, value) for (dept, metric), value in expected.items()]
+        rows.append((ROLLUP_META_DEPARTMENT, 'reconciled_at', int(time.time())))
+        cursor.executemany("""
+            INSERT INTO kpi_rollups (department, metric, value) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+        """, rows)
+    conn.commit()
+    if drift and current:
+        logger.warning(f"KPI rollups drifted on {len(drift)} rows; reconciled")
+    return drift
+
+def read_kpi_rollups(conn) -> Counter:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT department, metric, value FROM kpi_rollups")
+        return Counter({(r['department'], r['metric']): r['value'] for r in cursor.fetchall()})
+
+def load_kpi_rollups(conn) -> Counter:
+    """All rollup rows as {(department, metric): value}, reconciling first if the last run is stale.
+
+    Only one request per process runs the rebuild; others meanwhile serve the current counters.
+    """
+    rollups = read_kpi_rollups(conn)
+    stale = time.time() - rollups.get((ROLLUP_META_DEPARTMENT, 'reconciled_at'), 0) > ROLLUP_RECONCILE_SECONDS
+    if stale and _rollup_reconcile_lock.acquire(blocking=False):
+        try:
+            reconcile_kpi_rollups(conn, max_age=ROLLUP_RECONCILE_SECONDS)
+        finally:
+            _rollup_reconcile_lock.release()
+        rollups = read_kpi_rollups(conn)
+    return rollups
+
+def rollup_total(rollups, metric, departments=None) -> int:
+    """Sum a metric over the given department identifiers (all departments when None)"""
+    if departments is None:
+        return sum(v for (dept, m), v in rollups.items() if m == metric)
+    return sum(rollups.get((dept, metric), 0) for dept in set(departments))
+
+
 # Pydantic Models
 class LoginRequest(BaseModel):
     identifier: str
@@ -163,6 +595,17 @@ class GradeCreate(BaseModel):
     marks: int
     max_marks: int = 100
 
+class GradeSheetEntry(BaseModel):
+    student_id: Optional[int] = None
+    usn: Optional[str] = None
+    marks: Optional[float] = None
+
+class GradeSheet(BaseModel):
+    course_id: int
+    title: str
+    max_marks: int = 100
+    entries: List[GradeSheetEntry]
+
 class AttendanceRecord(BaseModel):
     student_id: int
     status: str
@@ -185,9 +628,14 @@ class ClassworkCreate(BaseModel):
     due_date: Optional[str] = None
     max_marks: int = 100
 
+class SubmissionAttachment(BaseModel):
+    sha256: str      # from a completed /uploads session
+    filename: str
+
 class SubmissionCreate(BaseModel):
     classwork_id: int
     content: Optional[str] = None
+    attachments: Optional[List[SubmissionAttachment]] = None  # replaces the previous set when given
 
 class ParentLinkRequest(BaseModel):
     parent_id: int
@@ -205,14 +653,42 @@ def create_token(user_data: dict) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+# Set by /batch so its sub-requests reuse the batch's already verified token
+_shared_auth: ContextVar[Optional[tuple]] = ContextVar('shared_auth', default=None)
+
+# Deactivated accounts, so tokens issued before deactivation stop working. Lifecycle jobs in this
+# process reset it right away; other workers pick the change up within the TTL.
+INACTIVE_USERS_TTL = 60
+_inactive_users = None  # (frozenset of user ids, loaded_at)
+
+def get_inactive_user_ids() -> frozenset:
+    global _inactive_users
+    if _inactive_users and time.monotonic() - _inactive_users[1] < INACTIVE_USERS_TTL:
+        return _inactive_users[0]
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM users WHERE role = %s", (INACTIVE_ROLE,))
+            ids = frozenset(r['id'] for r in cursor.fetchall())
+    _inactive_users = (ids, time.monotonic())
+    return ids
+
+def invalidate_inactive_users():
+    global _inactive_users
+    _inactive_users = None
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    shared = _shared_auth.get()
+    if shared and shared[0] == credentials.credentials:
+        return shared[1]
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get('user_id') in get_inactive_user_ids():
+        raise HTTPException(status_code=401, detail="This account has been deactivated")
+    return payload
 
 def require_role(*roles):
     def role_checker(token: dict = Depends(verify_token)):
@@ -251,6 +727,9 @@ async def login(request: Request, login_data: LoginRequest):
                 if not bcrypt.checkpw(login_data.password.encode('utf-8'), stored_password.encode('utf-8')):
                     raise HTTPException(status_code=401, detail="Invalid credentials")
                 
+                if user['role'] == INACTIVE_ROLE:
+                    raise HTTPException(status_code=403, detail="This account has been deactivated")
+                
                 user_email = user.get('email', '')
                 if user['role'] in ['Student', 'Teacher']:
                     if user_email and not user_email.endswith('@jainuniversity.ac.in'):
@@ -278,27 +757,30 @@ async def login(request: Request, login_data: LoginRequest):
         raise HTTPException(status_code=500, detail=detailed_error)
 
 
+def fetch_current_user(cursor, user_id: int) -> dict:
+    cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return {
+        'id': user['id'],
+        'username': user['username'],
+        'email': user.get('email', ''),
+        'role': user['role'],
+        'full_name': user.get('name', ''),
+        'usn': user.get('idno'),
+        'department': user.get('department'),
+        'year': user.get('year'),
+        'section': user.get('section', 'A'),
+        'linked_student_id': user.get('parent_id')
+    }
+
 @api_router.get("/auth/me")
 async def get_current_user(token: dict = Depends(verify_token)):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM users WHERE id = %s", (token['user_id'],))
-            user = cursor.fetchone()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            return {
-                'id': user['id'],
-                'username': user['username'],
-                'email': user.get('email', ''),
-                'role': user['role'],
-                'full_name': user.get('name', ''),
-                'usn': user.get('idno'),
-                'department': user.get('department'),
-                'year': user.get('year'),
-                'section': user.get('section', 'A'),
-                'linked_student_id': user.get('parent_id')
-            }
+            return fetch_current_user(cursor, token['user_id'])
 
 # Password Reset Models
 class ForgotPasswordRequest(BaseModel):
@@ -451,7 +933,23 @@ async def get_users(token: dict = Depends(require_role('Admin'))):
                 FROM users u
                 LEFT JOIN class_teachers ct ON u.id = ct.teacher_id
             """)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
+
+# Registered ahead of /users/{user_id}, which would otherwise claim "search"; index in STUDENT SEARCH below
+@api_router.get("/users/search")
+async def search_students(
+    q: str,
+    limit: int = 20,
+    token: dict = Depends(require_role('Admin'))
+):
+    """Typo-tolerant student search over name, username, USN and email"""
+    if len(q.strip()) < 2:
+        raise HTTPException(status_code=400, detail="Search needs at least 2 characters")
+    results = get_student_index().search(q, min(max(limit, 1), 100))
+    return DBJSONResponse([{
+        "id": r['id'], "full_name": r['name'], "username": r['username'], "usn": r['idno'], "email": r['email'],
+        "department": r['department'], "year": r['year'], "section": r['section'], "score": r['score'],
+    } for r in results])
 
 @api_router.get("/users/students")
 async def get_students(
@@ -478,7 +976,7 @@ async def get_students(
             
             query += " ORDER BY name"
             cursor.execute(query, params)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 
 @api_router.get("/users/teachers")
@@ -502,7 +1000,7 @@ async def get_teachers(
             
             query += " ORDER BY name"
             cursor.execute(query, params)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 
 @api_router.get("/users/{user_id}")
@@ -547,6 +1045,7 @@ async def create_user(user: UserCreate, token: dict = Depends(require_role('Admi
             """, (user.username, user.email, hashed, user.role, user.name, 
                   user.idno, user.department, user.year, user.section, user.parent_id))
             user_id = cursor.lastrowid
+            rollup_deltas = Counter({(user.department, f"users:{user.role}"): 1})
             
             # AUTOMATION: If Student, auto-create Parent Account
             if user.role == 'Student':
@@ -562,21 +1061,169 @@ async def create_user(user: UserCreate, token: dict = Depends(require_role('Admi
                         INSERT INTO users (username, email, password, role, name, parent_id)
                         VALUES (%s, %s, %s, 'Parent', %s, %s)
                     """, (parent_username, parent_email, hashed, f"Parent of {user.name}", user_id))
+                    cursor.execute("INSERT INTO parent_students (parent_id, student_id) VALUES (%s, %s)",
+                                   (cursor.lastrowid, user_id))
+                    rollup_deltas[('', 'users:Parent')] += 1
             
+            bump_rollups(cursor, rollup_deltas)
             conn.commit()
+            if user.role == 'Student':
+                index_student({"id": user_id, "name": user.name, "username": user.username, "idno": user.idno,
+                               "email": user.email, "department": user.department, "year": user.year,
+                               "section": user.section, "parent_id": user.parent_id})
+            invalidate_grade_analytics()
             return {"id": user_id, "message": "User and linked accounts created successfully"}
 
+# ==========================================
+# STUDENT SEARCH
+# ==========================================
+
+# In-memory trigram index over student name, username, USN and email. Tokens are padded so
+# leading trigrams double as prefix matches; scoring is the share of query trigrams a student
+# matches, so one or two typos still rank the right student near the top. Kept current by the
+# user write paths and reloaded after SEARCH_INDEX_TTL for other workers' writes.
+SEARCH_INDEX_TTL = 900
+SEARCH_MIN_SCORE = 0.35
+SEARCH_MAX_CANDIDATES = 2000
+_SEARCH_TOKEN = re.compile(r"[a-z0-9]+")
+
+def search_tokens(text) -> List[str]:
+    return _SEARCH_TOKEN.findall(str(text or '').lower())
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class StudentSearchIndex:
+    def __init__(self):
+        self.docs = {}      # student id -> row
+        self.grams = {}     # trigram -> set of student ids
+        self.doc_grams = {} # student id -> set of trigrams (for removal)
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def _fields(doc: dict) -> List[str]:
+        email_local = str(doc.get('email') or '').split('@')[0]
+        return [doc.get('name'), doc.get('username'), doc.get('idno'), email_local]
+
+    def add(self, doc: dict):
+        self.remove(doc['id'])
+        grams = set()
+        for field in self._fields(doc):
+            for token in search_tokens(field):
+                grams |= trigrams(token)
+        self.docs[doc['id']] = doc
+        self.doc_grams[doc['id']] = grams
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(doc['id'])
+
+    def remove(self, student_id: int):
+        for gram in self.doc_grams.pop(student_id, ()):
+            postings = self.grams.get(gram)
+            if postings:
+                postings.discard(student_id)
+                if not postings:
+                    del self.grams[gram]
+        self.docs.pop(student_id, None)
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        tokens = search_tokens(query)
+        query_grams = set().union(*(trigrams(t) for t in tokens)) if tokens else set()
+        present = [g for g in query_grams if g in self.grams]
+        if not present:
+            return []
+
+        # IDF weights: grams shared by every USN ("ju2", "bt2", ...) count for almost nothing
+        n = len(self.docs)
+        weights = {g: math.log(1 + n / len(self.grams[g])) for g in present}
+        missing = len(query_grams) - len(present)  # typo grams; weighted like an average present gram
+        total = sum(weights.values()) * (1 + missing / len(present))
+        needed = SEARCH_MIN_SCORE * total
+
+        # A student reaching `needed` must appear in one of the heaviest postings whose
+        # remaining (lighter) grams could not reach it on their own
+        ranked = sorted(present, key=weights.get, reverse=True)
+        remaining = sum(weights.values())
+        candidates, used = set(), []
+        for gram in ranked:
+            if remaining < needed:
+                break
+            candidates |= self.grams[gram]
+            used.append(gram)
+            remaining -= weights[gram]
+        if len(candidates) > SEARCH_MAX_CANDIDATES:
+            # Unspecific query: keep the students that appear in the most of those postings
+            hits = Counter()
+            for gram in used:
+                hits.update(self.grams[gram])
+            candidates = [student_id for student_id, _ in hits.most_common(SEARCH_MAX_CANDIDATES)]
+
+        scored = []
+        for student_id in candidates:
+            matched = sum(weights[g] for g in self.doc_grams[student_id] & weights.keys())
+            if matched >= needed:
+                scored.append((matched / total, student_id))
+        top = heapq.nlargest(limit * 5, scored)
+
+        # Rerank the shortlist: whole-field, prefix and substring matches first
+        needle = ' '.join(tokens)
+        results = []
+        for score, student_id in top:
+            fields = [' '.join(search_tokens(f)) for f in self._fields(self.docs[student_id])]
+            if needle in fields:
+                score += 1.0
+            elif any(f.startswith(needle) for f in fields):
+                score += 0.5
+            elif any(needle in f for f in fields):
+                score += 0.25
+            results.append((score, student_id))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return [dict(self.docs[i], score=round(score, 3)) for score, i in results[:limit]]
+
+_student_index: Optional[StudentSearchIndex] = None
+
+def get_student_index() -> StudentSearchIndex:
+    global _student_index
+    if _student_index and time.monotonic() - _student_index.loaded_at < SEARCH_INDEX_TTL:
+        return _student_index
+    index = StudentSearchIndex()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, name, username, idno, email, department, year, section, parent_id
+                FROM users WHERE role = 'Student'
+            """)
+            for row in cursor.fetchall():
+                index.add(row)
+    _student_index = index
+    return index
+
+def index_student(doc: dict):
+    """Add or refresh a student in the search index if it has been loaded in this process"""
+    if _student_index:
+        _student_index.add(doc)
+
+def unindex_student(student_id: int):
+    if _student_index:
+        _student_index.remove(student_id)
+
 # ==========================================
 # DEPARTMENT MANAGEMENT
 # ==========================================
 
+def fetch_departments(cursor) -> List[dict]:
+    cursor.execute("SELECT * FROM departments ORDER BY name ASC")
+    return cursor.fetchall()
+
 @api_router.get("/departments")
-async def get_departments(token: dict = Depends(verify_token)):
+async def get_departments(request: Request, token: dict = Depends(verify_token)):
     """List all departments"""
+    etag = table_etag(('departments',))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM departments ORDER BY name ASC")
-            return cursor.fetchall()
+            return conditional_response(request, etag, fetch_departments(cursor))
 
 @api_router.post("/departments")
 async def add_department(dept: DepartmentCreate, token: dict = Depends(require_role('Admin'))):
@@ -585,7 +1232,9 @@ async def add_department(dept: DepartmentCreate, token: dict = Depends(require_r
         with conn.cursor() as cursor:
             try:
                 cursor.execute("INSERT INTO departments (name, code) VALUES (%s, %s)", (dept.name, dept.code))
+                bump_rollups(cursor, {('', 'departments'): 1})
                 conn.commit()
+                bump_table_version('departments')
                 return {"message": f"Department {dept.name} added"}
             except pymysql.err.IntegrityError:
                 raise HTTPException(status_code=400, detail="Department or code already exists")
@@ -596,15 +1245,27 @@ async def delete_department(dept_id: int, token: dict = Depends(require_role('Ad
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("DELETE FROM departments WHERE id = %s", (dept_id,))
+            bump_rollups(cursor, {('', 'departments'): -cursor.rowcount})
             conn.commit()
+            bump_table_version('departments')
             return {"message": "Department deleted"}
 
 @api_router.delete("/users/{user_id}")
 async def delete_user(user_id: int, token: dict = Depends(require_role('Admin'))):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            cursor.execute("SELECT role, department FROM users WHERE id = %s", (user_id,))
+            existing = cursor.fetchone()
+            cursor.execute("SELECT parent_id FROM parent_students WHERE student_id = %s", (user_id,))
+            parent_ids = [r['parent_id'] for r in cursor.fetchall()]
             cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            if existing and cursor.rowcount:
+                bump_rollups(cursor, {(existing['department'], f"users:{existing['role']}"): -1})
+            cursor.execute("DELETE FROM parent_students WHERE parent_id = %s OR student_id = %s", (user_id, user_id))
             conn.commit()
+            unindex_student(user_id)
+            invalidate_parent(user_id, *parent_ids)
+            invalidate_grade_analytics()
             return {"message": "User deleted successfully"}
 
 @api_router.post("/users/bulk-upload")
@@ -631,6 +1292,8 @@ async def bulk_upload_students(
     
     students_created = 0
     parents_created = 0
+    rollup_deltas = Counter()
+    new_students = []
     errors = []
     default_password = "123456789"
     hashed = bcrypt.hashpw(default_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -666,6 +1329,10 @@ async def bulk_upload_students(
                           row_dict['student_name'], usn, final_dept, final_year, final_section))
                     student_id = cursor.lastrowid
                     students_created += 1
+                    rollup_deltas[(final_dept, 'users:Student')] += 1
+                    new_students.append({"id": student_id, "name": row_dict['student_name'], "username": username,
+                                         "idno": usn, "email": email, "department": final_dept, "year": final_year,
+                                         "section": final_section, "parent_id": None})
                     
                     # Auto-create Parent Account
                     parent_username = f"{username}{usn_digits}"
@@ -676,12 +1343,19 @@ async def bulk_upload_students(
                         VALUES (%s, %s, %s, %s, %s, %s)
                     """, (parent_username, parent_email, hashed, 'Parent', 
                           f"Parent of {row_dict['student_name']}", student_id))
+                    cursor.execute("INSERT INTO parent_students (parent_id, student_id) VALUES (%s, %s)",
+                                   (cursor.lastrowid, student_id))
                     parents_created += 1
+                    rollup_deltas[('', 'users:Parent')] += 1
                     
                 except Exception as e:
                     errors.append(f"Row {row_idx}: {str(e)}")
             
+            bump_rollups(cursor, rollup_deltas)
             conn.commit()
+    for student in new_students:
+        index_student(student)
+    invalidate_grade_analytics()
     
     return {
         "message": f"Successfully created {students_created} students and {parents_created} parent accounts",
@@ -693,37 +1367,458 @@ async def bulk_upload_students(
 
 @api_router.post("/users/link-parent")
 async def link_parent_to_student(request: ParentLinkRequest, token: dict = Depends(require_role('Admin'))):
+    # Candidates must match both the username and the USN digits; refuse to guess between several
+    digits = ''.join(filter(str.isdigit, request.student_idno_digits))
+    username = request.student_username.strip().lower()
+    candidates = [
+        r for r in get_student_index().search(f"{request.student_username} {request.student_idno_digits}", 50)
+        if username in str(r['username'] or '').lower() and digits and digits in str(r['idno'] or '')
+    ]
+    if not candidates and digits:
+        # The search index can be up to SEARCH_INDEX_TTL old: a student added since is found through
+        # the unique username key
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, username, idno, name FROM users WHERE role = 'Student' AND username = %s
+                """, (request.student_username.strip(),))
+                candidates = [r for r in cursor.fetchall() if digits in str(r['idno'] or '')]
+    if not candidates:
+        raise HTTPException(status_code=404, detail="Student not found")
+    exact = [r for r in candidates if str(r['username'] or '').lower() == username]
+    if len(exact) == 1:
+        candidates = exact
+    if len(candidates) > 1:
+        raise HTTPException(status_code=409, detail={
+            "message": "Several students match; refine the username or USN digits",
+            "candidates": [{"id": r['id'], "username": r['username'], "usn": r['idno'], "name": r['name']}
+                           for r in candidates[:10]],
+        })
+    student = candidates[0]
+
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, idno FROM users 
-                WHERE role = 'Student' 
-                AND (username LIKE %s OR idno LIKE %s)
-            """, (f"%{request.student_username}%", f"%{request.student_idno_digits}%"))
-            student = cursor.fetchone()
-            
-            if not student:
+            cursor.execute("SELECT id FROM users WHERE id = %s AND role = 'Parent'", (request.parent_id,))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail="Parent account not found")
+            # A stale index hit may name a student deleted or deactivated since
+            cursor.execute("SELECT id FROM users WHERE id = %s AND role = 'Student'", (student['id'],))
+            if not cursor.fetchone():
                 raise HTTPException(status_code=404, detail="Student not found")
-            
             cursor.execute("""
-                UPDATE users SET parent_id = %s WHERE id = %s
+                INSERT IGNORE INTO parent_students (parent_id, student_id) VALUES (%s, %s)
+            """, (request.parent_id, student['id']))
+            # users.parent_id keeps the first linked child for older clients
+            cursor.execute("""
+                UPDATE users SET parent_id = COALESCE(parent_id, %s) WHERE id = %s
             """, (student['id'], request.parent_id))
             conn.commit()
+            invalidate_parent(request.parent_id)
             
             return {"message": "Parent linked to student successfully", "student_id": student['id']}
 
-# Courses
-@api_router.get("/courses")
-async def get_courses(token: dict = Depends(verify_token)):
+@api_router.delete("/users/link-parent/{parent_id}/{student_id}")
+async def unlink_parent_from_student(parent_id: int, student_id: int, token: dict = Depends(require_role('Admin'))):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            if token['role'] == 'Teacher':
+            cursor.execute("DELETE FROM parent_students WHERE parent_id = %s AND student_id = %s", (parent_id, student_id))
+            if not cursor.rowcount:
+                raise HTTPException(status_code=404, detail="Link not found")
+            cursor.execute("""
+                UPDATE users SET parent_id = (
+                    SELECT MIN(student_id) FROM parent_students WHERE parent_id = %s
+                ) WHERE id = %s AND parent_id = %s
+            """, (parent_id, parent_id, student_id))
+            conn.commit()
+            invalidate_parent(parent_id)
+            return {"message": "Parent unlinked from student"}
+
+# ==========================================
+# PARENT ACCOUNTS
+# ==========================================
+
+# parent_students links a parent account to any number of children. users.parent_id (on the
+# parent row) predates it and still holds the first child; the backfill below copies those
+# links once and is a no-op afterwards.
+# A parent's children and dashboard are cached per parent: children for PARENT_CACHE_SECONDS,
+# the dashboard until the grades/exam/link versions change or the same window passes (attendance
+# marks do not bump a version, so the window bounds how stale attendance rates can be).
+PARENT_CACHE_SECONDS = 60
+PARENT_RECENT_GRADES = 10
+
+SCHEMA_STATEMENTS.extend([
+    """
+    CREATE TABLE IF NOT EXISTS parent_students (
+        parent_id INT NOT NULL,
+        student_id INT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (parent_id, student_id),
+        INDEX idx_parent_students_student (student_id)
+    )
+    """,
+    """
+    INSERT IGNORE INTO parent_students (parent_id, student_id)
+    SELECT id, parent_id FROM users WHERE role = 'Parent' AND parent_id IS NOT NULL
+    """,
+])
+
+_parent_children = {}    # parent_id -> (loaded_at, [child rows])
+_parent_dashboards = {}  # parent_id -> (etag, loaded_at, payload)
+
+def invalidate_parent(*parent_ids: int):
+    for parent_id in parent_ids:
+        _parent_children.pop(parent_id, None)
+        _parent_dashboards.pop(parent_id, None)
+    bump_table_version('parent_students')
+
+def get_parent_children(cursor, parent_id: int) -> List[dict]:
+    """Active students linked to a parent, cached briefly"""
+    cached = _parent_children.get(parent_id)
+    if cached and time.time() - cached[0] < PARENT_CACHE_SECONDS:
+        return cached[1]
+    cursor.execute("""
+        SELECT u.id, u.name, u.idno as usn, u.department, u.year, u.section
+        FROM parent_students ps
+        JOIN users u ON u.id = ps.student_id
+        WHERE ps.parent_id = %s AND u.role = 'Student'
+        ORDER BY u.id
+    """, (parent_id,))
+    children = cursor.fetchall()
+    _parent_children[parent_id] = (time.time(), children)
+    return children
+
+def build_parent_dashboard(cursor, children: List[dict]) -> dict:
+    """Grades, attendance and upcoming exams for every child in three queries"""
+    ids = tuple(c['id'] for c in children)
+    summary = {c['id']: dict(c, average_grade=0, recent_grades=[], attendance_rate=None,
+                             attendance_by_course=[], upcoming_exams=[]) for c in children}
+
+    cursor.execute("""
+        SELECT student_id, course_id, course_name, title as assignment_name,
+               marks as score, max_marks as max_score, date as graded_at
+        FROM grades
+        WHERE student_id IN %s
+        ORDER BY date DESC
+    """, (ids,))
+    percents = {}
+    for g in cursor.fetchall():
+        child = summary[g['student_id']]
+        if len(child['recent_grades']) < PARENT_RECENT_GRADES:
+            child['recent_grades'].append(g)
+        if g['max_score'] and g['score'] is not None:
+            percents.setdefault(g['student_id'], []).append(g['score'] / g['max_score'] * 100)
+    for student_id, values in percents.items():
+        summary[student_id]['average_grade'] = round(sum(values) / len(values), 1)
+
+    # Closed current-term sessions only: the roster says who was expected, the log whether they came
+    cursor.execute("""
+        SELECT r.student_id, s.course_id, c.name as course_name,
+               COUNT(*) as total_sessions,
+               COALESCE(SUM(l.status IN ('present', 'late')), 0) as attended_sessions
+        FROM attendance_rosters r
+        JOIN attendance_sessions s ON s.id = r.session_id
+        JOIN courses c ON c.id = s.course_id
+        LEFT JOIN attendance_logs l ON l.session_id = r.session_id AND l.student_id = r.student_id
+        WHERE r.student_id IN %s AND s.expires_at < %s
+        GROUP BY r.student_id, s.course_id, c.name
+    """, (ids, datetime.now()))
+    totals = {}
+    for row in cursor.fetchall():
+        row['total_sessions'], row['attended_sessions'] = int(row['total_sessions']), int(row['attended_sessions'])
+        summary[row['student_id']]['attendance_by_course'].append(row)
+        held, attended = totals.get(row['student_id'], (0, 0))
+        totals[row['student_id']] = (held + row['total_sessions'], attended + row['attended_sessions'])
+    for student_id, (held, attended) in totals.items():
+        summary[student_id]['attendance_rate'] = round(attended / held * 100, 1) if held else None
+
+    classes = tuple({(c['department'], c['year']) for c in children if c['department'] and c['year']})
+    if classes:
+        cursor.execute("""
+            SELECT e.id, e.name, e.exam_date, e.start_time, e.end_time,
+                   c.name as course_name, c.code as course_code, c.department, c.year
+            FROM exam_schedules e
+            JOIN courses c ON e.course_id = c.id
+            WHERE e.is_visible = TRUE AND e.exam_date >= CURDATE() AND (c.department, c.year) IN %s
+            ORDER BY e.exam_date, e.start_time
+        """, (classes,))
+        for exam in cursor.fetchall():
+            for child in summary.values():
+                if (child['department'], child['year']) == (exam['department'], exam['year']):
+                    child['upcoming_exams'].append(exam)
+
+    return {"children": list(summary.values())}
+
+def parent_dashboard_etag(parent_id: int) -> str:
+    # CURDATE() decides which exams are upcoming: the date is part of the ETag
+    return table_etag(('grades', 'exam_schedules', 'courses', 'parent_students'), parent_id, datetime.now().date())
+
+def get_parent_dashboard(cursor, parent_id: int):
+    """(etag, payload) for a parent's dashboard, rebuilt only when its inputs may have changed"""
+    etag = parent_dashboard_etag(parent_id)
+    cached = _parent_dashboards.get(parent_id)
+    if cached and cached[0] == etag and time.time() - cached[1] < PARENT_CACHE_SECONDS:
+        return etag, cached[2]
+    children = get_parent_children(cursor, parent_id)
+    payload = build_parent_dashboard(cursor, children) if children else {"children": []}
+    _parent_dashboards[parent_id] = (etag, time.time(), payload)
+    return etag, payload
+
+@api_router.get("/parent/dashboard")
+async def parent_dashboard(request: Request, token: dict = Depends(require_role('Parent'))):
+    """Every linked child's grades, attendance rate and upcoming exams in one call"""
+    etag = parent_dashboard_etag(token['user_id'])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            etag, payload = get_parent_dashboard(cursor, token['user_id'])
+    return conditional_response(request, etag, payload)
+
+# ==========================================
+# USER LIFECYCLE (year rollover)
+# ==========================================
+
+# Bulk promote / move / deactivate run as background jobs: the target students are selected
+# once, then updated in LIFECYCLE_CHUNK_SIZE chunks, each in its own transaction, with progress
+# stored in lifecycle_jobs. Every UPDATE is guarded by the state it moves from, so a rerun (or a
+# resumed failed or stale job) only touches rows that have not moved yet; a repeated idempotency key
+# returns the existing job instead of starting a new one. Without an explicit key the request
+# and the day form the key, so a double submit is caught but next year's identical rollover runs.
+# Deactivation is a soft delete: role becomes 'Inactive' (previous_role keeps the old one), so
+# grades, attendance and leave history stay attached, and parents with no other active child follow.
+INACTIVE_ROLE = 'Inactive'
+LIFECYCLE_CHUNK_SIZE = 500
+# A queued/running job whose row has not been touched for this long lost its worker (restart,
+# frozen instance) and may be resumed like a failed one; workers touch the row after every chunk
+LIFECYCLE_STALE_SECONDS = int(os.environ.get('LIFECYCLE_STALE_SECONDS', 300))
+LIFECYCLE_OPERATIONS = ('promote', 'move_section', 'deactivate')
+
+SCHEMA_STATEMENTS.extend([
+    "ALTER TABLE users ADD COLUMN previous_role VARCHAR(20)",
+    "ALTER TABLE users ADD COLUMN deactivated_at DATETIME",
+    """
+    CREATE TABLE IF NOT EXISTS lifecycle_jobs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        idempotency_key VARCHAR(64) NOT NULL UNIQUE,
+        operation VARCHAR(20) NOT NULL,
+        params JSON,
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        total INT DEFAULT 0,
+        processed INT DEFAULT 0,
+        parents_processed INT DEFAULT 0,
+        error TEXT,
+        created_by INT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+])
+
+class LifecycleRequest(BaseModel):
+    operation: str                    # promote, move_section, deactivate
+    department: str
+    year: str
+    section: Optional[str] = None     # all sections when omitted (required for move_section)
+    to_year: Optional[str] = None     # promote: defaults to year + 1
+    to_section: Optional[str] = None  # move_section
+    student_ids: Optional[List[int]] = None  # restrict to these students
+    idempotency_key: Optional[str] = None
+
+def lifecycle_params(req: LifecycleRequest) -> dict:
+    if req.operation not in LIFECYCLE_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"operation must be one of {list(LIFECYCLE_OPERATIONS)}")
+    params = {"department": req.department, "year": req.year, "section": req.section,
+              "student_ids": sorted(set(req.student_ids)) if req.student_ids else None}
+    if req.operation == 'promote':
+        to_year = req.to_year
+        if not to_year:
+            if not req.year.isdigit():
+                raise HTTPException(status_code=400, detail="to_year is required when year is not numeric")
+            to_year = str(int(req.year) + 1)
+        if to_year == req.year:
+            raise HTTPException(status_code=400, detail="to_year must differ from year")
+        params["to_year"] = to_year
+    elif req.operation == 'move_section':
+        if not req.section or not req.to_section or req.section == req.to_section:
+            raise HTTPException(status_code=400, detail="section and a different to_section are required")
+        params["to_section"] = req.to_section
+    return params
+
+def run_lifecycle_job(job_id: int, operation: str, params: dict):
+    """Worker body: select targets, then apply chunk by chunk, committing progress after each"""
+    global _leave_calendar
+
+    def set_job(cursor, conn, **fields):
+        assignments = "".join(f"{k} = %s, " for k in fields)
+        cursor.execute(f"UPDATE lifecycle_jobs SET {assignments}updated_at = NOW() WHERE id = %s",
+                       (*fields.values(), job_id))
+        conn.commit()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                query = """
+                    SELECT id, department FROM users
+                    WHERE role = 'Student' AND department = %s AND year = %s
+                """
+                args = [params['department'], params['year']]
+                if params.get('section'):
+                    query += " AND section = %s"
+                    args.append(params['section'])
+                if params.get('student_ids'):
+                    query += " AND id IN %s"
+                    args.append(tuple(params['student_ids']))
+                cursor.execute(query + " ORDER BY id", args)
+                targets = cursor.fetchall()
+                set_job(cursor, conn, status='running', total=len(targets))
+
+                processed = parents = 0
+                for start in range(0, len(targets), LIFECYCLE_CHUNK_SIZE):
+                    chunk = targets[start:start + LIFECYCLE_CHUNK_SIZE]
+                    ids = tuple(t['id'] for t in chunk)
+                    if operation == 'promote':
+                        cursor.execute("UPDATE users SET year = %s WHERE id IN %s AND year = %s",
+                                       (params['to_year'], ids, params['year']))
+                    elif operation == 'move_section':
+                        cursor.execute("UPDATE users SET section = %s WHERE id IN %s AND section = %s",
+                                       (params['to_section'], ids, params['section']))
+                    else:
+                        cursor.execute("""
+                            UPDATE users SET previous_role = role, role = %s, deactivated_at = NOW()
+                            WHERE id IN %s AND role = 'Student'
+                        """, (INACTIVE_ROLE, ids))
+                        students_done = cursor.rowcount
+                        # Parents follow once none of their linked children is still active
+                        cursor.execute("""
+                            SELECT ps.parent_id
+                            FROM parent_students ps
+                            JOIN users s ON s.id = ps.student_id
+                            WHERE ps.parent_id IN (SELECT parent_id FROM parent_students WHERE student_id IN %s)
+                            GROUP BY ps.parent_id
+                            HAVING SUM(s.role = 'Student') = 0
+                        """, (ids,))
+                        parent_ids = tuple(r['parent_id'] for r in cursor.fetchall())
+                        parents_done = 0
+                        if parent_ids:
+                            cursor.execute("""
+                                UPDATE users SET previous_role = role, role = %s, deactivated_at = NOW()
+                                WHERE id IN %s AND role = 'Parent'
+                            """, (INACTIVE_ROLE, parent_ids))
+                            parents_done = cursor.rowcount
+                        parents += parents_done
+                        bump_rollups(cursor, {
+                            (params['department'], 'users:Student'): -students_done,
+                            (params['department'], f"users:{INACTIVE_ROLE}"): students_done,
+                            ('', 'users:Parent'): -parents_done,
+                            ('', f"users:{INACTIVE_ROLE}"): parents_done,
+                        })
+                    processed += len(chunk)
+                    set_job(cursor, conn, processed=processed, parents_processed=parents)
+
+                    # Keep this process's in-memory indexes in step with the chunk
+                    for student_id in ids:
+                        doc = _student_index.docs.get(student_id) if _student_index else None
+                        if operation == 'deactivate':
+                            unindex_student(student_id)
+                        elif doc and operation == 'promote':
+                            doc['year'] = params['to_year']
+                        elif doc:
+                            doc['section'] = params['to_section']
+
+                set_job(cursor, conn, status='completed')
+                logger.info(f"Lifecycle job {job_id} ({operation}) completed: {processed} students, {parents} parents")
+            except Exception as e:
+                logger.error(f"Lifecycle job {job_id} failed: {e}")
+                try:
+                    conn.rollback()
+                    set_job(cursor, conn, status='failed', error=str(e))
+                except Exception:
+                    # The connection itself may be gone: record the failure on a fresh one
+                    try:
+                        with get_db_connection() as retry_conn:
+                            with retry_conn.cursor() as retry_cursor:
+                                set_job(retry_cursor, retry_conn, status='failed', error=str(e))
+                    except Exception as inner:
+                        # Left queued/running, so it becomes resumable once stale
+                        logger.error(f"Lifecycle job {job_id} could not be marked failed: {inner}")
+            finally:
+                # Class membership changed: drop caches keyed by class
+                _leave_calendar = None
+                _user_classes.clear()
+                _parent_children.clear()
+                _parent_dashboards.clear()
+                invalidate_grade_analytics()
+                invalidate_inactive_users()
+
+@api_router.post("/admin/lifecycle")
+async def start_lifecycle_job(req: LifecycleRequest, token: dict = Depends(require_role('Admin'))):
+    """Start a bulk promote / move-section / deactivate job; poll /admin/lifecycle/{job_id} for progress"""
+    params = lifecycle_params(req)
+    key = req.idempotency_key or compute_etag(req.operation, params, date.today().isoformat())[3:-1]
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM lifecycle_jobs WHERE idempotency_key = %s", (key,))
+            job = cursor.fetchone()
+            if job:
+                # Resume a failed or stale job; rows it already moved are skipped by the update guards.
+                # The guard also lets only one of two concurrent retries take the job over.
                 cursor.execute("""
-                    SELECT * FROM courses WHERE teacher_id = %s
-                """, (token['user_id'],))
+                    UPDATE lifecycle_jobs SET status = 'queued', error = NULL, updated_at = NOW()
+                    WHERE id = %s AND (status = 'failed'
+                        OR (status IN ('queued', 'running') AND updated_at < NOW() - INTERVAL %s SECOND))
+                """, (job['id'], LIFECYCLE_STALE_SECONDS))
+                if not cursor.rowcount:
+                    return DBJSONResponse(dict(job, message="Job already exists for this request"))
+                job_id = job['id']
             else:
-                cursor.execute("SELECT * FROM courses")
-            return cursor.fetchall()
+                try:
+                    cursor.execute("""
+                        INSERT INTO lifecycle_jobs (idempotency_key, operation, params, created_by)
+                        VALUES (%s, %s, %s, %s)
+                    """, (key, req.operation, json.dumps(params), token['user_id']))
+                except pymysql.err.IntegrityError:
+                    raise HTTPException(status_code=409, detail="A job with this idempotency key was just started")
+                job_id = cursor.lastrowid
+            conn.commit()
+
+    threading.Thread(target=run_lifecycle_job, args=(job_id, req.operation, params),
+                     name=f"lifecycle-{job_id}", daemon=True).start()
+    return {"job_id": job_id, "idempotency_key": key, "status": "queued"}
+
+@api_router.get("/admin/lifecycle/{job_id}")
+async def get_lifecycle_job(job_id: int, token: dict = Depends(require_role('Admin'))):
+    """Progress of a lifecycle job; `stale` means its worker is gone and a retry will resume it"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT *, (status IN ('queued', 'running') AND updated_at < NOW() - INTERVAL %s SECOND) as stale
+                FROM lifecycle_jobs WHERE id = %s
+            """, (LIFECYCLE_STALE_SECONDS, job_id))
+            job = cursor.fetchone()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job['percent'] = round(100 * job['processed'] / job['total'], 1) if job['total'] else (100.0 if job['status'] == 'completed' else 0.0)
+    job['stale'] = bool(job['stale'])
+    return DBJSONResponse(job)
+
+# Courses
+def fetch_courses(cursor, token: dict) -> List[dict]:
+    if token['role'] == 'Teacher':
+        cursor.execute("""
+            SELECT * FROM courses WHERE teacher_id = %s
+        """, (token['user_id'],))
+    else:
+        cursor.execute("SELECT * FROM courses")
+    return cursor.fetchall()
+
+@api_router.get("/courses")
+async def get_courses(request: Request, token: dict = Depends(verify_token)):
+    etag = table_etag(('courses',), token['user_id'] if token['role'] == 'Teacher' else None)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            return conditional_response(request, etag, fetch_courses(cursor, token))
 
 @api_router.post("/courses")
 async def create_course(course: CourseCreate, token: dict = Depends(require_role('Admin', 'Teacher'))):
@@ -742,9 +1837,12 @@ async def create_course(course: CourseCreate, token: dict = Depends(require_role
                 INSERT INTO courses (name, code, department, year, teacher_id, teacher_name)
                 VALUES (%s, %s, %s, %s, %s, %s)
             """, (course.name, course.code, course.department, course.year, teacher_id, teacher_name))
+            course_id = cursor.lastrowid
+            bump_rollups(cursor, {(course.department, 'courses'): 1})
             conn.commit()
+            bump_table_version('courses')
             
-            return {"id": cursor.lastrowid, "message": "Course created successfully"}
+            return {"id": course_id, "message": "Course created successfully"}
 
 @api_router.get("/courses/{course_id}/students")
 async def get_course_students(course_id: int, token: dict = Depends(require_role('Admin', 'Teacher'))):
@@ -761,56 +1859,58 @@ async def get_course_students(course_id: int, token: dict = Depends(require_role
                 SELECT id, username, email, name as full_name, idno as usn, department
                 FROM users WHERE role = 'Student' AND department = %s
             """, (course.get('department'),))
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 # Grades
+def fetch_grades(cursor, token: dict) -> List[dict]:
+    if token['role'] == 'Student':
+        cursor.execute("""
+            SELECT g.id, g.student_id, g.course_id, g.course_name, 
+                   g.title as assignment_name, g.marks as score, g.max_marks as max_score,
+                   g.date as graded_at, 'Assignment' as grade_type
+            FROM grades g
+            WHERE g.student_id = %s
+            ORDER BY g.date DESC
+        """, (token['user_id'],))
+    elif token['role'] == 'Parent':
+        children = get_parent_children(cursor, token['user_id'])
+        if not children:
+            return []
+        cursor.execute("""
+            SELECT g.id, g.student_id, g.course_id, g.course_name, 
+                   g.title as assignment_name, g.marks as score, g.max_marks as max_score,
+                   g.date as graded_at, u.name as student_name
+            FROM grades g
+            JOIN users u ON g.student_id = u.id
+            WHERE g.student_id IN %s
+            ORDER BY g.date DESC
+        """, (tuple(c['id'] for c in children),))
+    elif token['role'] == 'Teacher':
+        cursor.execute("""
+            SELECT g.id, g.student_id, g.course_id, g.course_name, 
+                   g.title as assignment_name, g.marks as score, g.max_marks as max_score,
+                   g.date as graded_at, u.name as student_name, u.idno as usn
+            FROM grades g
+            JOIN users u ON g.student_id = u.id
+            WHERE g.graded_by = %s
+            ORDER BY g.date DESC
+        """, (token['user_id'],))
+    else:
+        cursor.execute("""
+            SELECT g.id, g.student_id, g.course_id, g.course_name, 
+                   g.title as assignment_name, g.marks as score, g.max_marks as max_score,
+                   g.date as graded_at, u.name as student_name
+            FROM grades g
+            JOIN users u ON g.student_id = u.id
+            ORDER BY g.date DESC
+        """)
+    return cursor.fetchall()
+
 @api_router.get("/grades")
 async def get_grades(token: dict = Depends(verify_token)):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            if token['role'] == 'Student':
-                cursor.execute("""
-                    SELECT g.id, g.student_id, g.course_id, g.course_name, 
-                           g.title as assignment_name, g.marks as score, g.max_marks as max_score,
-                           g.date as graded_at, 'Assignment' as grade_type
-                    FROM grades g
-                    WHERE g.student_id = %s
-                    ORDER BY g.date DESC
-                """, (token['user_id'],))
-            elif token['role'] == 'Parent':
-                cursor.execute("SELECT parent_id FROM users WHERE id = %s", (token['user_id'],))
-                parent = cursor.fetchone()
-                if not parent or not parent.get('parent_id'):
-                    return []
-                cursor.execute("""
-                    SELECT g.id, g.student_id, g.course_id, g.course_name, 
-                           g.title as assignment_name, g.marks as score, g.max_marks as max_score,
-                           g.date as graded_at, u.name as student_name
-                    FROM grades g
-                    JOIN users u ON g.student_id = u.id
-                    WHERE g.student_id = %s
-                    ORDER BY g.date DESC
-                """, (parent['parent_id'],))
-            elif token['role'] == 'Teacher':
-                cursor.execute("""
-                    SELECT g.id, g.student_id, g.course_id, g.course_name, 
-                           g.title as assignment_name, g.marks as score, g.max_marks as max_score,
-                           g.date as graded_at, u.name as student_name, u.idno as usn
-                    FROM grades g
-                    JOIN users u ON g.student_id = u.id
-                    WHERE g.graded_by = %s
-                    ORDER BY g.date DESC
-                """, (token['user_id'],))
-            else:
-                cursor.execute("""
-                    SELECT g.id, g.student_id, g.course_id, g.course_name, 
-                           g.title as assignment_name, g.marks as score, g.max_marks as max_score,
-                           g.date as graded_at, u.name as student_name
-                    FROM grades g
-                    JOIN users u ON g.student_id = u.id
-                    ORDER BY g.date DESC
-                """)
-            return cursor.fetchall()
+            return DBJSONResponse(fetch_grades(cursor, token))
 
 @api_router.post("/grades")
 async def create_grade(grade: GradeCreate, token: dict = Depends(require_role('Admin', 'Teacher'))):
@@ -822,8 +1922,309 @@ async def create_grade(grade: GradeCreate, token: dict = Depends(require_role('A
             """, (grade.student_id, grade.course_id, grade.course_name, grade.title,
                   grade.marks, grade.max_marks, token['user_id']))
             conn.commit()
+            bump_table_version('grades')
             return {"id": cursor.lastrowid, "message": "Grade posted successfully"}
 
+def apply_grade_sheet(course_id: int, title: str, max_marks: int, entries: List[dict], token: dict) -> dict:
+    """Validate a mark sheet in one query and upsert it in one transaction.
+
+    Entries identify the student by `student_id` or `usn`. A (student, course, title) that
+    already has a grade is updated in place; rows that fail validation are reported and skipped.
+    """
+    if not title or not title.strip():
+        raise HTTPException(status_code=400, detail="Title is required")
+    if max_marks <= 0:
+        raise HTTPException(status_code=400, detail="max_marks must be positive")
+    if not entries:
+        raise HTTPException(status_code=400, detail="Mark sheet has no rows")
+    non_finite = [e.get('row', row) for row, e in enumerate(entries, start=1)
+                  if isinstance(e.get('marks'), float) and not math.isfinite(e['marks'])]
+    if non_finite:
+        raise HTTPException(status_code=400, detail={"message": "Marks must be finite numbers", "rows": non_finite})
+
+    ids = tuple({e['student_id'] for e in entries if e.get('student_id')}) or (0,)
+    usns = tuple({str(e['usn']).strip().upper() for e in entries if e.get('usn')}) or ('',)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            # Course, matching students and their existing grade for this title in one round-trip
+            cursor.execute("""
+                SELECT c.name as course_name, c.teacher_id, u.id as student_id, u.idno as usn,
+                       MIN(g.id) as grade_id
+                FROM courses c
+                LEFT JOIN users u ON u.role = 'Student' AND (u.id IN %s OR UPPER(u.idno) IN %s)
+                LEFT JOIN grades g ON g.student_id = u.id AND g.course_id = c.id AND g.title = %s
+                WHERE c.id = %s
+                GROUP BY c.name, c.teacher_id, u.id, u.idno
+            """, (ids, usns, title, course_id))
+            matches = cursor.fetchall()
+            if not matches:
+                raise HTTPException(status_code=404, detail="Course not found")
+            course = matches[0]
+            if token['role'] == 'Teacher' and course['teacher_id'] != token['user_id']:
+                raise HTTPException(status_code=403, detail="Unauthorized for this course")
+
+            by_id = {m['student_id']: m for m in matches if m['student_id']}
+            by_usn = {m['usn'].upper(): m for m in matches if m['student_id'] and m['usn']}
+
+            results, inserts, updates, seen = [], [], [], set()
+            for row, entry in enumerate(entries, start=1):
+                student = by_id.get(entry.get('student_id')) or by_usn.get(str(entry.get('usn') or '').strip().upper())
+                result = {"row": entry.get('row', row), "student_id": entry.get('student_id'), "usn": entry.get('usn')}
+                results.append(result)
+                marks = entry.get('marks')
+                if not student:
+                    result.update(status="error", detail="Student not found")
+                    continue
+                result.update(student_id=student['student_id'], usn=student['usn'])
+                if student['student_id'] in seen:
+                    result.update(status="error", detail="Duplicate row for this student")
+                    continue
+                if marks is None or not isinstance(marks, (int, float)) or marks != int(marks):
+                    result.update(status="error", detail="Marks must be a whole number")
+                    continue
+                if not 0 <= marks <= max_marks:
+                    result.update(status="error", detail=f"Marks must be between 0 and {max_marks}")
+                    continue
+                seen.add(student['student_id'])
+                if student['grade_id']:
+                    updates.append((int(marks), max_marks, token['user_id'], student['grade_id']))
+                    result.update(status="updated")
+                else:
+                    inserts.append((student['student_id'], course_id, course['course_name'], title,
+                                    int(marks), max_marks, token['user_id']))
+                    result.update(status="created")
+
+            try:
+                if inserts:
+                    cursor.executemany("""
+                        INSERT INTO grades (student_id, course_id, course_name, title, marks, max_marks, graded_by)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """, inserts)
+                if updates:
+                    cursor.executemany("""
+                        UPDATE grades SET marks = %s, max_marks = %s, graded_by = %s, date = NOW() WHERE id = %s
+                    """, updates)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    if inserts or updates:
+        bump_table_version('grades')
+
+    return {
+        "message": f"{len(inserts)} grades created, {len(updates)} updated",
+        "created": len(inserts),
+        "updated": len(updates),
+        "errors": sum(1 for r in results if r['status'] == 'error'),
+        "results": results,
+    }
+
+@api_router.post("/grades/bulk")
+async def create_grades_bulk(sheet: GradeSheet, token: dict = Depends(require_role('Admin', 'Teacher'))):
+    """Post marks for a whole class for one assessment"""
+    entries = [e.dict() for e in sheet.entries]
+    return apply_grade_sheet(sheet.course_id, sheet.title, sheet.max_marks, entries, token)
+
+@api_router.post("/grades/bulk-upload")
+async def upload_grade_sheet(
+    file: UploadFile = File(...),
+    course_id: int = Form(...),
+    title: str = Form(...),
+    max_marks: int = Form(100),
+    token: dict = Depends(require_role('Admin', 'Teacher'))
+):
+    """Post marks from an Excel sheet with a `usn` (or `student_id`) column and a `marks` column"""
+    if not file.filename.endswith('.xlsx'):
+        raise HTTPException(status_code=400, detail="Only Excel files (.xlsx) are supported")
+
+    content = await file.read()
+    workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    sheet = workbook.active
+    rows = sheet.iter_rows(values_only=True)
+    headers = [str(h).strip().lower().replace(' ', '_') if h else '' for h in next(rows, ())]
+    if 'marks' not in headers or not ({'usn', 'student_id'} & set(headers)):
+        raise HTTPException(status_code=400, detail="Sheet needs a 'marks' column and a 'usn' or 'student_id' column")
+
+    entries = []
+    for row_idx, row in enumerate(rows, start=2):
+        row_dict = dict(zip(headers, row))
+        if not any(v is not None for v in row_dict.values()):
+            continue
+        student_id = row_dict.get('student_id')
+        entries.append({
+            "row": row_idx,
+            "student_id": int(student_id) if isinstance(student_id, (int, float)) else None,
+            "usn": str(row_dict['usn']).strip() if row_dict.get('usn') else None,
+            "marks": row_dict.get('marks'),
+        })
+    workbook.close()
+    return apply_grade_sheet(course_id, title, max_marks, entries, token)
+
+# ==========================================
+# GRADE ANALYTICS
+# ==========================================
+
+AT_RISK_THRESHOLD = float(os.environ.get('AT_RISK_THRESHOLD', 40))  # average percentage
+ANALYTICS_CACHE_SIZE = 256
+# The key catches new grades and this process's writes; the TTL bounds staleness from grade
+# edits made by other workers. User changes (lifecycle moves, deletes) clear it outright.
+ANALYTICS_CACHE_TTL = 300
+_grade_analytics_cache = {}  # (scope key, last grade id, grades version) -> (loaded_at, result)
+
+def invalidate_grade_analytics():
+    _grade_analytics_cache.clear()
+
+def compute_grade_analytics(rows: List[dict]) -> dict:
+    """Distribution, at-risk list, per-course breakdown and weekly trend, computed with NumPy.
+
+    Stats are over per-student average percentages; `entries` counts the raw grade rows.
+    """
+    rows = [r for r in rows if r['max_marks']]
+    if not rows:
+        return {"entries": 0, "students": 0, "mean": None, "median": None, "std": None,
+                "percentiles": {}, "histogram": [], "at_risk": [], "by_course": [], "trend": []}
+
+    pct = np.fromiter((r['marks'] for r in rows), dtype=np.float64, count=len(rows))
+    pct /= np.fromiter((r['max_marks'] for r in rows), dtype=np.float64, count=len(rows))
+    pct *= 100
+    student_ids = np.fromiter((r['student_id'] for r in rows), dtype=np.int64, count=len(rows))
+    course_ids = np.fromiter((r['course_id'] or 0 for r in rows), dtype=np.int64, count=len(rows))
+    days = np.array([r['date'] for r in rows], dtype='datetime64[D]')
+
+    # Per-student averages
+    students, student_idx = np.unique(student_ids, return_inverse=True)
+    per_student_count = np.bincount(student_idx)
+    per_student_avg = np.bincount(student_idx, weights=pct) / per_student_count
+
+    p10, p25, p75, p90 = np.percentile(per_student_avg, [10, 25, 75, 90])
+    counts, edges = np.histogram(per_student_avg, bins=10, range=(0, 100))
+
+    at_risk_idx = np.nonzero(per_student_avg < AT_RISK_THRESHOLD)[0]
+    at_risk_idx = at_risk_idx[np.argsort(per_student_avg[at_risk_idx])]
+    first_row = {}
+    for r in rows:
+        first_row.setdefault(r['student_id'], r)
+    at_risk = [{
+        "student_id": int(students[i]),
+        "name": first_row[int(students[i])].get('student_name'),
+        "usn": first_row[int(students[i])].get('usn'),
+        "average": round(float(per_student_avg[i]), 1),
+        "graded_items": int(per_student_count[i]),
+    } for i in at_risk_idx[:100]]
+
+    courses, course_idx = np.unique(course_ids, return_inverse=True)
+    course_count = np.bincount(course_idx)
+    course_avg = np.bincount(course_idx, weights=pct) / course_count
+    course_names = {}
+    for r in rows:
+        course_names.setdefault(r['course_id'] or 0, r.get('course_name'))
+    by_course = sorted(({
+        "course_id": int(c) or None,
+        "course_name": course_names.get(int(c)),
+        "mean": round(float(course_avg[i]), 1),
+        "entries": int(course_count[i]),
+    } for i, c in enumerate(courses)), key=lambda c: c['mean'])
+
+    # Weekly trend (weeks start on Monday; 1970-01-01 was a Thursday)
+    week_start = days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    weeks, week_idx = np.unique(week_start, return_inverse=True)
+    week_count = np.bincount(week_idx)
+    week_avg = np.bincount(week_idx, weights=pct) / week_count
+    trend = [{"week": str(w), "mean": round(float(week_avg[i]), 1), "entries": int(week_count[i])}
+             for i, w in enumerate(weeks)]
+
+    return {
+        "entries": len(rows),
+        "students": int(students.size),
+        "mean": round(float(per_student_avg.mean()), 2),
+        "median": round(float(np.median(per_student_avg)), 2),
+        "std": round(float(per_student_avg.std()), 2),
+        "percentiles": {"p10": round(float(p10), 2), "p25": round(float(p25), 2),
+                        "p75": round(float(p75), 2), "p90": round(float(p90), 2)},
+        "histogram": [{"range": f"{int(edges[i])}-{int(edges[i + 1])}", "count": int(n)} for i, n in enumerate(counts)],
+        "at_risk_threshold": AT_RISK_THRESHOLD,
+        "at_risk": at_risk,
+        "by_course": by_course,
+        "trend": trend,
+    }
+
+@api_router.get("/analytics/grades")
+async def get_grade_analytics(
+    scope: str = 'department',
+    course_id: Optional[int] = None,
+    department: Optional[str] = None,
+    year: Optional[str] = None,
+    token: dict = Depends(require_role('Admin', 'Teacher'))
+):
+    """Grade distribution for a course, department or year (optionally department + year).
+
+    Admins can query any scope. HODs are limited to their department; other teachers to
+    courses they teach.
+    """
+    if scope not in ('course', 'department', 'year'):
+        raise HTTPException(status_code=400, detail="scope must be course, department or year")
+    if scope == 'course' and not course_id:
+        raise HTTPException(status_code=400, detail="course_id is required for course scope")
+    if scope == 'department' and not department:
+        raise HTTPException(status_code=400, detail="department is required for department scope")
+    if scope == 'year' and not year:
+        raise HTTPException(status_code=400, detail="year is required for year scope")
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            dept_ids = []
+            if token['role'] == 'Teacher':
+                cursor.execute("SELECT is_hod, hod_department FROM users WHERE id = %s", (token['user_id'],))
+                user = cursor.fetchone()
+                if user and user.get('is_hod'):
+                    hod_ids = resolve_department_identifiers(user['hod_department'], cursor)
+                    if department and department not in hod_ids:
+                        raise HTTPException(status_code=403, detail="HODs can only view their own department")
+                    dept_ids = hod_ids
+                elif scope != 'course':
+                    raise HTTPException(status_code=403, detail="Teachers can only view course analytics")
+                else:
+                    cursor.execute("SELECT id FROM courses WHERE id = %s AND teacher_id = %s", (course_id, token['user_id']))
+                    if not cursor.fetchone():
+                        raise HTTPException(status_code=403, detail="Unauthorized for this course")
+            elif department:
+                dept_ids = resolve_department_identifiers(department, cursor)
+
+            cursor.execute("SELECT MAX(id) as last_id FROM grades")
+            last_id = cursor.fetchone()['last_id']
+            cache_key = (scope, course_id, tuple(sorted(dept_ids)), year, last_id, TABLE_VERSIONS.get('grades', 0))
+            cached = _grade_analytics_cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < ANALYTICS_CACHE_TTL:
+                return DBJSONResponse(cached[1])
+
+            query = """
+                SELECT g.student_id, g.course_id, g.course_name, g.marks, g.max_marks, g.date,
+                       u.name as student_name, u.idno as usn
+                FROM grades g
+                JOIN users u ON g.student_id = u.id
+                WHERE 1=1
+            """
+            params = []
+            if scope == 'course':
+                query += " AND g.course_id = %s"
+                params.append(course_id)
+            if dept_ids:
+                query += " AND u.department IN %s"
+                params.append(tuple(dept_ids))
+            if year:
+                query += " AND u.year = %s"
+                params.append(year)
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+    result = compute_grade_analytics(rows)
+    result["scope"] = {"scope": scope, "course_id": course_id, "department": department, "year": year}
+    if len(_grade_analytics_cache) >= ANALYTICS_CACHE_SIZE:
+        _grade_analytics_cache.pop(next(iter(_grade_analytics_cache)))
+    _grade_analytics_cache[cache_key] = (time.monotonic(), result)
+    return DBJSONResponse(result)
+
 # Attendance
 @api_router.get("/attendance")
 async def get_attendance(token: dict = Depends(verify_token)):
@@ -854,14 +2255,10 @@ async def get_attendance(token: dict = Depends(verify_token)):
                                 })
                 return student_attendance
             elif token['role'] == 'Parent':
-                cursor.execute("SELECT parent_id FROM users WHERE id = %s", (token['user_id'],))
-                parent = cursor.fetchone()
-                if not parent or not parent.get('parent_id'):
+                children = get_parent_children(cursor, token['user_id'])
+                if not children:
                     return []
-                student_id = parent['parent_id']
-                cursor.execute("SELECT name FROM users WHERE id = %s", (student_id,))
-                student = cursor.fetchone()
-                student_name = student['name'] if student else 'Student'
+                names = {c['id']: c['name'] or 'Student' for c in children}
                 
                 cursor.execute("""
                     SELECT a.id, a.course_id, a.course_name, a.date, a.records
@@ -876,14 +2273,15 @@ async def get_attendance(token: dict = Depends(verify_token)):
                         records = json.loads(records)
                     if records:
                         for r in records:
-                            if r.get('student_id') == student_id:
+                            if r.get('student_id') in names:
                                 student_attendance.append({
                                     'id': record['id'],
                                     'course_id': record['course_id'],
                                     'course_name': record['course_name'],
                                     'date': record['date'],
                                     'status': r.get('status', 'Present'),
-                                    'student_name': student_name
+                                    'student_id': r['student_id'],
+                                    'student_name': names[r['student_id']]
                                 })
                 return student_attendance
             elif token['role'] == 'Teacher':
@@ -894,7 +2292,7 @@ async def get_attendance(token: dict = Depends(verify_token)):
                     WHERE a.taken_by = %s
                     ORDER BY a.date DESC
                 """, (token['user_id'],))
-                return cursor.fetchall()
+                return DBJSONResponse(cursor.fetchall())
             else:
                 cursor.execute("""
                     SELECT a.*, c.name as course_display_name
@@ -902,7 +2300,7 @@ async def get_attendance(token: dict = Depends(verify_token)):
                     LEFT JOIN courses c ON a.course_id = c.id
                     ORDER BY a.date DESC
                 """)
-                return cursor.fetchall()
+                return DBJSONResponse(cursor.fetchall())
 
 @api_router.post("/attendance")
 async def mark_attendance(attendance: AttendanceCreate, token: dict = Depends(require_role('Admin', 'Teacher'))):
@@ -923,24 +2321,125 @@ async def bulk_mark_attendance(attendance: AttendanceCreate, token: dict = Depen
     return await mark_attendance(attendance, token)
 
 # Classwork
+# Students read a per-department feed: the newest CLASSWORK_FEED_WINDOW rows for the department
+# (plus department-less classwork) are cached and paged with a (created_at, id) keyset cursor;
+# older pages fall through to the same keyset query against the DB. create_classwork drops the
+# affected feeds and the TTL bounds staleness across workers. The student's own submission
+# status is merged in with one query on (student_id, classwork_id).
+CLASSWORK_FEED_WINDOW = 500
+CLASSWORK_FEED_TTL = 300
+CLASSWORK_PAGE_MAX = 100
+
+SCHEMA_STATEMENTS.extend([
+    "CREATE INDEX idx_classwork_feed ON classwork (department, created_at, id)",
+    "CREATE INDEX idx_submissions_student_classwork ON submissions (student_id, classwork_id)",
+])
+
+_classwork_feeds = {}  # department -> (loaded_at, rows newest first, sort keys ascending)
+
+def classwork_feed_key(row: dict) -> tuple:
+    # Ascending order of this key is newest-first order of the feed
+    return (-row['created_at'].timestamp(), -row['id']) if row['created_at'] else (math.inf, -row['id'])
+
+def encode_classwork_cursor(row: dict) -> str:
+    return f"{row['created_at'].isoformat() if row['created_at'] else ''}~{row['id']}"
+
+def decode_classwork_cursor(cursor_value: str) -> tuple:
+    created_at, _, row_id = cursor_value.rpartition('~')
+    try:
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def fetch_classwork_feed(cursor, dept: Optional[str], after: Optional[tuple], limit: Optional[int]) -> List[dict]:
+    query = """
+        SELECT cw.*, c.name as course_name
+        FROM classwork cw
+        LEFT JOIN courses c ON cw.course_id = c.id
+        WHERE (cw.department = %s OR cw.department IS NULL)
+    """
+    args = [dept]
+    if after:
+        created_at, row_id = after
+        if created_at is None:
+            query += " AND cw.created_at IS NULL AND cw.id < %s"
+            args.append(row_id)
+        else:
+            query += " AND (cw.created_at < %s OR (cw.created_at = %s AND cw.id < %s) OR cw.created_at IS NULL)"
+            args.extend([created_at, created_at, row_id])
+    query += " ORDER BY cw.created_at IS NULL, cw.created_at DESC, cw.id DESC"
+    if limit is not None:
+        query += " LIMIT %s"
+        args.append(limit)
+    cursor.execute(query, args)
+    return cursor.fetchall()
+
+def get_classwork_feed(cursor, dept: Optional[str]):
+    cached = _classwork_feeds.get(dept)
+    if cached and time.monotonic() - cached[0] < CLASSWORK_FEED_TTL:
+        return cached
+    rows = fetch_classwork_feed(cursor, dept, None, CLASSWORK_FEED_WINDOW)
+    feed = (time.monotonic(), rows, [classwork_feed_key(r) for r in rows])
+    _classwork_feeds[dept] = feed
+    return feed
+
+def invalidate_classwork_feed(dept: Optional[str]):
+    if dept:
+        _classwork_feeds.pop(dept, None)
+    else:
+        _classwork_feeds.clear()  # department-less classwork shows up in every feed
+    bump_table_version('classwork')
+
+def student_classwork_page(cursor, student_id: int, dept: Optional[str], after: Optional[tuple], limit: Optional[int]):
+    """(page rows with submission status merged in, next cursor or None)"""
+    _, rows, keys = get_classwork_feed(cursor, dept)
+    start = 0
+    if after:
+        created_at, row_id = after
+        start = bisect.bisect_right(keys, classwork_feed_key({'created_at': created_at, 'id': row_id}))
+    page = rows[start:start + limit] if limit else rows[start:]
+    if len(rows) == CLASSWORK_FEED_WINDOW and (not limit or len(page) < limit):
+        # The cache only holds the newest rows: continue past its end from the DB
+        resume = (page[-1]['created_at'], page[-1]['id']) if page else after
+        page = page + fetch_classwork_feed(cursor, dept, resume, limit - len(page) if limit else None)
+
+    if page:
+        cursor.execute("""
+            SELECT classwork_id, status, submitted_at FROM submissions
+            WHERE student_id = %s AND classwork_id IN %s
+        """, (student_id, tuple(r['id'] for r in page)))
+        submitted = {s['classwork_id']: s for s in cursor.fetchall()}
+        page = [dict(r, submission_status=submitted.get(r['id'], {}).get('status'),
+                     submitted_at=submitted.get(r['id'], {}).get('submitted_at')) for r in page]
+
+    next_cursor = encode_classwork_cursor(page[-1]) if limit and len(page) == limit else None
+    return page, next_cursor
+
 @api_router.get("/classwork")
-async def get_classwork(token: dict = Depends(verify_token)):
+async def get_classwork(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    token: dict = Depends(verify_token)
+):
+    """Students get their department feed; with `limit`, one page and an X-Next-Cursor header"""
+    if limit is not None and not 1 <= limit <= CLASSWORK_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {CLASSWORK_PAGE_MAX}")
+    after = decode_classwork_cursor(cursor) if cursor else None
     with get_db_connection() as conn:
-        with conn.cursor() as cursor:
+        with conn.cursor() as db_cursor:
             if token['role'] == 'Student':
-                cursor.execute("SELECT department FROM users WHERE id = %s", (token['user_id'],))
-                user = cursor.fetchone()
-                dept = user.get('department') if user else None
-                
-                cursor.execute("""
-                    SELECT cw.*, c.name as course_name
-                    FROM classwork cw
-                    LEFT JOIN courses c ON cw.course_id = c.id
-                    WHERE cw.department = %s OR cw.department IS NULL
-                    ORDER BY cw.created_at DESC
-                """, (dept,))
+                user_class = get_user_class(token['user_id'])
+                if user_class:
+                    dept = user_class[0]
+                else:
+                    db_cursor.execute("SELECT department FROM users WHERE id = %s", (token['user_id'],))
+                    user = db_cursor.fetchone()
+                    dept = user.get('department') if user else None
+                page, next_cursor = student_classwork_page(db_cursor, token['user_id'], dept, after, limit)
+                headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+                return DBJSONResponse(page, headers=headers)
             elif token['role'] == 'Teacher':
-                cursor.execute("""
+                db_cursor.execute("""
                     SELECT cw.*, c.name as course_name
                     FROM classwork cw
                     LEFT JOIN courses c ON cw.course_id = c.id
@@ -948,13 +2447,13 @@ async def get_classwork(token: dict = Depends(verify_token)):
                     ORDER BY cw.created_at DESC
                 """, (token['user_id'],))
             else:
-                cursor.execute("""
+                db_cursor.execute("""
                     SELECT cw.*, c.name as course_name
                     FROM classwork cw
                     LEFT JOIN courses c ON cw.course_id = c.id
                     ORDER BY cw.created_at DESC
                 """)
-            return cursor.fetchall()
+            return DBJSONResponse(db_cursor.fetchall())
 
 @api_router.post("/classwork")
 async def create_classwork(classwork: ClassworkCreate, token: dict = Depends(require_role('Admin', 'Teacher'))):
@@ -966,25 +2465,347 @@ async def create_classwork(classwork: ClassworkCreate, token: dict = Depends(req
             """, (classwork.course_id, classwork.department, classwork.year, classwork.type,
                   classwork.title, classwork.description, classwork.due_date, classwork.max_marks, token['user_id']))
             conn.commit()
+            invalidate_classwork_feed(classwork.department)
             return {"id": cursor.lastrowid, "message": "Classwork created successfully"}
 
-# Submissions
-@api_router.get("/submissions")
-async def get_submissions(token: dict = Depends(verify_token)):
+# ==========================================
+# SUBMISSION STORAGE (content-addressed blobs)
+# ==========================================
+
+# Submission bodies and attachments live in a local blob store keyed by SHA-256, so identical
+# files are stored once and a resubmission only rewrites the hash in the submissions row.
+# Large files arrive through resumable upload sessions: the client appends chunks at the offset
+# the server reports, can ask for that offset again after a dropped connection, and completes
+# the session to get the blob's hash. Reads stream from disk and honour single byte ranges.
+# blob_owners records who has supplied each blob's bytes: only they may attach it or skip its
+# transfer, so a known hash alone neither grants access to a file nor reveals that it exists.
+# Rows written before this keep their inline `content`, which is served the same way.
+# The store needs a persistent, writable BLOB_STORE_DIR (serverless bundles are read-only):
+# without one, submission text stays inline in the row and uploads and attachments are refused.
+BLOB_STORE_DIR = Path(os.environ['BLOB_STORE_DIR']) if os.environ.get('BLOB_STORE_DIR') else None
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_MB', 100)) * 1024 * 1024
+UPLOAD_CHUNK_MAX = 8 * 1024 * 1024
+UPLOAD_EXPIRY_HOURS = 24
+BLOB_READ_SIZE = 64 * 1024
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+SCHEMA_STATEMENTS.extend([
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        sha256 CHAR(64) PRIMARY KEY,
+        size BIGINT NOT NULL,
+        content_type VARCHAR(100),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS blob_uploads (
+        id CHAR(32) PRIMARY KEY,
+        user_id INT NOT NULL,
+        size BIGINT NOT NULL,
+        filename VARCHAR(255),
+        content_type VARCHAR(100),
+        sha256 CHAR(64),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_blob_uploads_created (created_at)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS submission_attachments (
+        submission_id INT NOT NULL,
+        sha256 CHAR(64) NOT NULL,
+        filename VARCHAR(255),
+        PRIMARY KEY (submission_id, sha256)
+    )
+    """,
+    "ALTER TABLE submissions ADD COLUMN content_sha256 CHAR(64)",
+    "ALTER TABLE submissions ADD COLUMN content_size INT",
+    """
+    CREATE TABLE IF NOT EXISTS blob_owners (
+        sha256 CHAR(64) NOT NULL,
+        user_id INT NOT NULL,
+        PRIMARY KEY (sha256, user_id)
+    )
+    """,
+    """
+    INSERT IGNORE INTO blob_owners (sha256, user_id)
+    SELECT a.sha256, s.student_id FROM submission_attachments a JOIN submissions s ON s.id = a.submission_id
+    """,
+])
+
+_upload_lock = threading.Lock()
+
+class UploadStart(BaseModel):
+    size: int
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    sha256: Optional[str] = None  # when known up front, an existing blob skips the transfer
+
+def require_blob_store():
+    if BLOB_STORE_DIR is None:
+        raise HTTPException(status_code=503, detail="File uploads are disabled: BLOB_STORE_DIR is not configured")
+    try:
+        BLOB_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        pass
+    if not os.access(BLOB_STORE_DIR, os.W_OK):
+        logger.error(f"Blob store {BLOB_STORE_DIR} is not writable")
+        raise HTTPException(status_code=503, detail="File uploads are unavailable: the blob store is not writable")
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_STORE_DIR / sha256[:2] / sha256[2:4] / sha256
+
+def upload_path(upload_id: str) -> Path:
+    return BLOB_STORE_DIR / 'uploads' / upload_id
+
+def store_blob_file(temp_path: Path, sha256: str) -> bool:
+    """Move a finished temp file into the store; False (and the temp file dropped) if it was already there"""
+    target = blob_path(sha256)
+    if target.exists():
+        temp_path.unlink(missing_ok=True)
+        return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temp_path, target)
+    return True
+
+def put_blob(data: bytes) -> tuple:
+    """Store bytes; returns (sha256, newly_stored)"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    if blob_path(sha256).exists():
+        return sha256, False
+    temp_path = upload_path(f"{uuid.uuid4().hex}.tmp")
+    temp_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path.write_bytes(data)
+    return sha256, store_blob_file(temp_path, sha256)
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def register_blob(cursor, sha256: str, size: int, content_type: Optional[str], owner_id: int):
+    cursor.execute("INSERT IGNORE INTO blobs (sha256, size, content_type) VALUES (%s, %s, %s)",
+                   (sha256, size, content_type))
+    cursor.execute("INSERT IGNORE INTO blob_owners (sha256, user_id) VALUES (%s, %s)", (sha256, owner_id))
+
+def append_upload_chunk(upload_id: str, offset: int, data: bytes, limit: int) -> int:
+    """Append a chunk if it starts where the file ends; returns the bytes received so far"""
+    path = upload_path(upload_id)
+    with _upload_lock:
+        received = path.stat().st_size if path.exists() else 0
+        if offset != received:
+            raise HTTPException(status_code=409, detail={"message": "Offset does not match received bytes",
+                                                         "received": received})
+        if received + len(data) > limit:
+            raise HTTPException(status_code=413, detail="Chunk goes past the declared size")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'ab') as f:
+            f.write(data)
+        return received + len(data)
+
+def purge_stale_uploads(cursor):
+    cursor.execute("""
+        SELECT id FROM blob_uploads WHERE created_at < NOW() - INTERVAL %s HOUR LIMIT 100
+    """, (UPLOAD_EXPIRY_HOURS,))
+    stale = [r['id'] for r in cursor.fetchall()]
+    if stale:
+        cursor.execute("DELETE FROM blob_uploads WHERE id IN %s", (tuple(stale),))
+        for upload_id in stale:
+            upload_path(upload_id).unlink(missing_ok=True)
+
+def get_owned_upload(cursor, upload_id: str, user_id: int) -> dict:
+    cursor.execute("SELECT * FROM blob_uploads WHERE id = %s", (upload_id,))
+    upload = cursor.fetchone()
+    if not upload or upload['user_id'] != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+def parse_range(header: str, size: int) -> Optional[tuple]:
+    """Inclusive (start, end) for a single `bytes=` range; None means serve the whole body"""
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None  # multiple or malformed ranges: the full body is a valid answer
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        start, end = max(size - int(match.group(2)), 0), size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={'Content-Range': f"bytes */{size}"})
+    return start, end
+
+def content_disposition(filename: str) -> str:
+    """Latin-1-safe header: an ASCII fallback name plus the RFC 5987 UTF-8 form; control characters are dropped"""
+    filename = ''.join(c for c in filename if c.isprintable())
+    fallback = ''.join(c if ' ' <= c <= '~' and c not in '"\\' else '_' for c in filename) or 'download'
+    return f"inline; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+def range_response(request: Request, size: int, etag: str, open_body, media_type: str,
+                   filename: Optional[str] = None) -> Response:
+    """Stream a body with ETag / If-None-Match, Range and If-Range handling"""
+    headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Cache-Control': 'private, max-age=300'}
+    if filename:
+        headers['Content-Disposition'] = content_disposition(filename)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if request.headers.get('range') and request.headers.get('if-range', etag) == etag:
+        byte_range = parse_range(request.headers['range'], size)
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+    headers['Content-Length'] = str(length)
+    if byte_range:
+        headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+    def body():
+        with open_body() as f:
+            f.seek(start)
+            remaining = length
+            while remaining:
+                chunk = f.read(min(BLOB_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    return StreamingResponse(body(), status_code=206 if byte_range else 200, media_type=media_type, headers=headers)
+
+def blob_response(request: Request, sha256: str, media_type: str, filename: Optional[str] = None) -> Response:
+    if BLOB_STORE_DIR is None:
+        raise HTTPException(status_code=503, detail="Blob store is not configured")
+    path = blob_path(sha256)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Content missing from the blob store")
+    return range_response(request, path.stat().st_size, f'"{sha256}"', lambda: open(path, 'rb'), media_type, filename)
+
+def get_visible_submission(cursor, submission_id: int, token: dict) -> dict:
+    """Submission row if the caller may read it: its student, the classwork's teacher, a linked parent or an admin"""
+    cursor.execute("""
+        SELECT s.id, s.student_id, s.content, s.content_sha256, cw.uploaded_by
+        FROM submissions s
+        JOIN classwork cw ON s.classwork_id = cw.id
+        WHERE s.id = %s
+    """, (submission_id,))
+    submission = cursor.fetchone()
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    allowed = (
+        token['role'] == 'Admin'
+        or (token['role'] == 'Student' and submission['student_id'] == token['user_id'])
+        or (token['role'] == 'Teacher' and submission['uploaded_by'] == token['user_id'])
+        or (token['role'] == 'Parent'
+            and any(c['id'] == submission['student_id'] for c in get_parent_children(cursor, token['user_id'])))
+    )
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Not allowed to view this submission")
+    return submission
+
+@api_router.post("/uploads")
+async def start_upload(upload: UploadStart, token: dict = Depends(verify_token)):
+    """Open a resumable upload; when `sha256` names a blob the caller already uploaded, no transfer is needed"""
+    if not 0 < upload.size <= UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Uploads must be between 1 byte and {UPLOAD_MAX_BYTES} bytes")
+    sha256 = upload.sha256.lower() if upload.sha256 else None
+    if sha256 and not SHA256_PATTERN.match(sha256):
+        raise HTTPException(status_code=400, detail="sha256 must be 64 hex characters")
+    require_blob_store()
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            if token['role'] == 'Student':
+            if sha256:
                 cursor.execute("""
-                    SELECT s.*, cw.title as classwork_title, c.name as course_name
-                    FROM submissions s
-                    JOIN classwork cw ON s.classwork_id = cw.id
-                    LEFT JOIN courses c ON cw.course_id = c.id
-                    WHERE s.student_id = %s
-                    ORDER BY s.submitted_at DESC
-                """, (token['user_id'],))
-            elif token['role'] == 'Teacher':
-                cursor.execute("""
-                    SELECT s.*, cw.title as classwork_title, u.idno as usn
+                    SELECT b.size FROM blobs b
+                    JOIN blob_owners o ON o.sha256 = b.sha256 AND o.user_id = %s
+                    WHERE b.sha256 = %s
+                """, (token['user_id'], sha256))
+                existing = cursor.fetchone()
+                if existing and existing['size'] == upload.size and blob_path(sha256).exists():
+                    return {"sha256": sha256, "size": upload.size, "complete": True, "deduplicated": True}
+            purge_stale_uploads(cursor)
+            upload_id = uuid.uuid4().hex
+            cursor.execute("""
+                INSERT INTO blob_uploads (id, user_id, size, filename, content_type, sha256)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (upload_id, token['user_id'], upload.size, upload.filename, upload.content_type, sha256))
+            conn.commit()
+    return {"upload_id": upload_id, "received": 0, "size": upload.size, "chunk_size": UPLOAD_CHUNK_MAX,
+            "complete": False}
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str, token: dict = Depends(verify_token)):
+    """Bytes received so far: where a resumed upload should continue"""
+    require_blob_store()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            upload = get_owned_upload(cursor, upload_id, token['user_id'])
+    path = upload_path(upload_id)
+    return {"upload_id": upload_id, "received": path.stat().st_size if path.exists() else 0,
+            "size": upload['size'], "complete": False}
+
+@api_router.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request, token: dict = Depends(verify_token)):
+    """Append the raw request body at `offset`; a mismatched offset returns 409 with the current position"""
+    if int(request.headers.get('content-length') or 0) > UPLOAD_CHUNK_MAX:
+        raise HTTPException(status_code=413, detail=f"Chunks are limited to {UPLOAD_CHUNK_MAX} bytes")
+    require_blob_store()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            upload = get_owned_upload(cursor, upload_id, token['user_id'])
+    data = await request.body()
+    if not data or len(data) > UPLOAD_CHUNK_MAX:
+        raise HTTPException(status_code=400, detail=f"Chunks must be between 1 and {UPLOAD_CHUNK_MAX} bytes")
+    received = await run_in_threadpool(append_upload_chunk, upload_id, offset, data, upload['size'])
+    return {"upload_id": upload_id, "received": received, "size": upload['size']}
+
+@api_router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, token: dict = Depends(verify_token)):
+    """Verify and move a fully received upload into the blob store"""
+    require_blob_store()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            upload = get_owned_upload(cursor, upload_id, token['user_id'])
+            path = upload_path(upload_id)
+            received = path.stat().st_size if path.exists() else 0
+            if received != upload['size']:
+                raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "received": received})
+            sha256 = await run_in_threadpool(hash_file, path)
+            if upload['sha256'] and upload['sha256'] != sha256:
+                path.unlink(missing_ok=True)
+                cursor.execute("DELETE FROM blob_uploads WHERE id = %s", (upload_id,))
+                conn.commit()
+                raise HTTPException(status_code=422, detail="Uploaded data does not match the declared sha256")
+            stored = store_blob_file(path, sha256)
+            register_blob(cursor, sha256, upload['size'], upload['content_type'], token['user_id'])
+            cursor.execute("DELETE FROM blob_uploads WHERE id = %s", (upload_id,))
+            conn.commit()
+    return {"sha256": sha256, "size": upload['size'], "complete": True, "deduplicated": not stored}
+
+# Submissions
+@api_router.get("/submissions")
+async def get_submissions(token: dict = Depends(verify_token)):
+    """Submission metadata only; bodies come from /submissions/{id}/content"""
+    columns = """
+        s.id, s.classwork_id, s.student_id, s.student_name, s.status, s.submitted_at, s.content_sha256,
+        COALESCE(s.content_size, LENGTH(s.content)) as content_size,
+        (SELECT COUNT(*) FROM submission_attachments a WHERE a.submission_id = s.id) as attachment_count
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if token['role'] == 'Student':
+                cursor.execute(f"""
+                    SELECT {columns}, cw.title as classwork_title, c.name as course_name
+                    FROM submissions s
+                    JOIN classwork cw ON s.classwork_id = cw.id
+                    LEFT JOIN courses c ON cw.course_id = c.id
+                    WHERE s.student_id = %s
+                    ORDER BY s.submitted_at DESC
+                """, (token['user_id'],))
+            elif token['role'] == 'Teacher':
+                cursor.execute(f"""
+                    SELECT {columns}, cw.title as classwork_title, u.idno as usn
                     FROM submissions s
                     JOIN classwork cw ON s.classwork_id = cw.id
                     JOIN users u ON s.student_id = u.id
@@ -992,89 +2813,169 @@ async def get_submissions(token: dict = Depends(verify_token)):
                     ORDER BY s.submitted_at DESC
                 """, (token['user_id'],))
             else:
-                cursor.execute("""
-                    SELECT s.*, cw.title as classwork_title
+                cursor.execute(f"""
+                    SELECT {columns}, cw.title as classwork_title
                     FROM submissions s
                     JOIN classwork cw ON s.classwork_id = cw.id
                     ORDER BY s.submitted_at DESC
                 """)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.post("/submissions")
 async def create_submission(submission: SubmissionCreate, token: dict = Depends(require_role('Student'))):
+    content_sha256 = content_size = None
+    inline_content = None
+    if submission.content is not None:
+        data = submission.content.encode('utf-8')
+        content_size = len(data)
+        if BLOB_STORE_DIR is None:
+            inline_content = submission.content
+        else:
+            require_blob_store()
+            content_sha256, _ = await run_in_threadpool(put_blob, data)
+    attachments = {a.sha256.lower(): a.filename for a in submission.attachments or []}
+    if attachments:
+        require_blob_store()
+
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            if attachments:
+                cursor.execute("SELECT sha256 FROM blob_owners WHERE user_id = %s AND sha256 IN %s",
+                               (token['user_id'], tuple(attachments)))
+                missing = set(attachments) - {r['sha256'] for r in cursor.fetchall()}
+                if missing:
+                    raise HTTPException(status_code=400, detail={"message": "Unknown attachments; finish their uploads first",
+                                                                 "missing": sorted(missing)})
             # Get student name
             cursor.execute("SELECT name FROM users WHERE id = %s", (token['user_id'],))
             user = cursor.fetchone()
             student_name = user['name'] if user else 'Student'
             
+            if content_sha256:
+                register_blob(cursor, content_sha256, content_size, 'text/plain; charset=utf-8', token['user_id'])
+            # LAST_INSERT_ID(id) makes lastrowid the submission id on updates too
             cursor.execute("""
-                INSERT INTO submissions (classwork_id, student_id, student_name, content, status)
-                VALUES (%s, %s, %s, %s, 'Submitted')
-                ON DUPLICATE KEY UPDATE content = %s, submitted_at = CURRENT_TIMESTAMP
-            """, (submission.classwork_id, token['user_id'], student_name,
-                  submission.content, submission.content))
+                INSERT INTO submissions (classwork_id, student_id, student_name, content, content_sha256, content_size, status)
+                VALUES (%s, %s, %s, %s, %s, %s, 'Submitted')
+                ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), content = VALUES(content),
+                    content_sha256 = VALUES(content_sha256), content_size = VALUES(content_size),
+                    submitted_at = CURRENT_TIMESTAMP
+            """, (submission.classwork_id, token['user_id'], student_name, inline_content, content_sha256, content_size))
+            submission_id = cursor.lastrowid
+            if submission.attachments is not None:
+                cursor.execute("DELETE FROM submission_attachments WHERE submission_id = %s", (submission_id,))
+                if attachments:
+                    cursor.executemany("""
+                        INSERT INTO submission_attachments (submission_id, sha256, filename) VALUES (%s, %s, %s)
+                    """, [(submission_id, sha256, filename) for sha256, filename in attachments.items()])
             conn.commit()
-            return {"message": "Submission created successfully"}
+            return {"id": submission_id, "content_sha256": content_sha256, "message": "Submission created successfully"}
+
+@api_router.get("/submissions/{submission_id}/content")
+async def get_submission_content(submission_id: int, request: Request, token: dict = Depends(verify_token)):
+    """The submission body, streamed with Range support"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            submission = get_visible_submission(cursor, submission_id, token)
+    media_type = 'text/plain; charset=utf-8'
+    if submission['content_sha256']:
+        return blob_response(request, submission['content_sha256'], media_type)
+    data = (submission['content'] or '').encode('utf-8')
+    etag = f'"{hashlib.sha256(data).hexdigest()}"'
+    return range_response(request, len(data), etag, lambda: io.BytesIO(data), media_type)
+
+@api_router.get("/submissions/{submission_id}/attachments")
+async def get_submission_attachments(submission_id: int, token: dict = Depends(verify_token)):
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            get_visible_submission(cursor, submission_id, token)
+            cursor.execute("""
+                SELECT a.sha256, a.filename, b.size, b.content_type
+                FROM submission_attachments a
+                LEFT JOIN blobs b ON b.sha256 = a.sha256
+                WHERE a.submission_id = %s
+                ORDER BY a.filename
+            """, (submission_id,))
+            return DBJSONResponse(cursor.fetchall())
+
+@api_router.get("/submissions/{submission_id}/attachments/{sha256}")
+async def download_submission_attachment(submission_id: int, sha256: str, request: Request,
+                                         token: dict = Depends(verify_token)):
+    """One attachment, streamed with Range support"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            get_visible_submission(cursor, submission_id, token)
+            cursor.execute("""
+                SELECT a.filename, b.content_type
+                FROM submission_attachments a
+                LEFT JOIN blobs b ON b.sha256 = a.sha256
+                WHERE a.submission_id = %s AND a.sha256 = %s
+            """, (submission_id, sha256.lower()))
+            attachment = cursor.fetchone()
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return blob_response(request, sha256.lower(), attachment['content_type'] or 'application/octet-stream',
+                         attachment['filename'])
 
 # Dashboard Stats
+def fetch_dashboard_stats(cursor, token: dict) -> dict:
+    stats = {}
+    
+    if token['role'] == 'Admin':
+        rollups = load_kpi_rollups(cursor.connection)
+        stats['total_students'] = rollup_total(rollups, 'users:Student')
+        stats['total_teachers'] = rollup_total(rollups, 'users:Teacher')
+        stats['total_courses'] = rollup_total(rollups, 'courses')
+        stats['total_parents'] = rollup_total(rollups, 'users:Parent')
+        stats['total_departments'] = rollup_total(rollups, 'departments')
+    
+    elif token['role'] == 'Teacher':
+        cursor.execute("SELECT COUNT(*) as count FROM courses WHERE teacher_id = %s", (token['user_id'],))
+        stats['my_courses'] = cursor.fetchone()['count']
+        stats['my_students'] = rollup_total(load_kpi_rollups(cursor.connection), 'users:Student')
+        cursor.execute("SELECT COUNT(*) as count FROM classwork WHERE uploaded_by = %s", (token['user_id'],))
+        stats['total_classwork'] = cursor.fetchone()['count']
+    
+    elif token['role'] == 'Student':
+        stats['enrolled_courses'] = rollup_total(load_kpi_rollups(cursor.connection), 'courses')
+        cursor.execute("""
+            SELECT AVG(marks/max_marks * 100) as avg FROM grades WHERE student_id = %s AND max_marks > 0
+        """, (token['user_id'],))
+        result = cursor.fetchone()
+        avg = result['avg'] if result and result['avg'] else 0
+        stats['average_grade'] = round(float(avg), 1) if avg else 0
+        stats['attendance_rate'] = 100  # Default, would need to calculate from JSON
+    
+    elif token['role'] == 'Parent':
+        # Served from the cached parent dashboard; the student_* keys describe the first child
+        _, dashboard = get_parent_dashboard(cursor, token['user_id'])
+        children = dashboard['children']
+        stats['children'] = [{'student_id': c['id'], 'name': c['name'], 'average_grade': c['average_grade'],
+                              'attendance_rate': c['attendance_rate']} for c in children]
+        if children:
+            first = children[0]
+            stats['student_name'] = first['name']
+            stats['student_average'] = first['average_grade']
+            stats['student_attendance'] = first['attendance_rate'] if first['attendance_rate'] is not None else 100
+        else:
+            stats['student_name'] = 'Not linked'
+            stats['student_average'] = 0
+            stats['student_attendance'] = 100
+    
+    return stats
+
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(token: dict = Depends(verify_token)):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            stats = {}
-            
-            if token['role'] == 'Admin':
-                cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'Student'")
-                stats['total_students'] = cursor.fetchone()['count']
-                cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'Teacher'")
-                stats['total_teachers'] = cursor.fetchone()['count']
-                cursor.execute("SELECT COUNT(*) as count FROM courses")
-                stats['total_courses'] = cursor.fetchone()['count']
-                cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'Parent'")
-                stats['total_parents'] = cursor.fetchone()['count']
-            
-            elif token['role'] == 'Teacher':
-                cursor.execute("SELECT COUNT(*) as count FROM courses WHERE teacher_id = %s", (token['user_id'],))
-                stats['my_courses'] = cursor.fetchone()['count']
-                cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'Student'")
-                stats['my_students'] = cursor.fetchone()['count']
-                cursor.execute("SELECT COUNT(*) as count FROM classwork WHERE uploaded_by = %s", (token['user_id'],))
-                stats['total_classwork'] = cursor.fetchone()['count']
-            
-            elif token['role'] == 'Student':
-                cursor.execute("SELECT COUNT(*) as count FROM courses")
-                stats['enrolled_courses'] = cursor.fetchone()['count']
-                cursor.execute("""
-                    SELECT AVG(marks/max_marks * 100) as avg FROM grades WHERE student_id = %s AND max_marks > 0
-                """, (token['user_id'],))
-                result = cursor.fetchone()
-                avg = result['avg'] if result and result['avg'] else 0
-                stats['average_grade'] = round(float(avg), 1) if avg else 0
-                stats['attendance_rate'] = 100  # Default, would need to calculate from JSON
-            
-            elif token['role'] == 'Parent':
-                cursor.execute("SELECT parent_id FROM users WHERE id = %s", (token['user_id'],))
-                parent = cursor.fetchone()
-                if parent and parent.get('parent_id'):
-                    student_id = parent['parent_id']
-                    cursor.execute("SELECT name FROM users WHERE id = %s", (student_id,))
-                    student = cursor.fetchone()
-                    stats['student_name'] = student['name'] if student else 'Not linked'
-                    cursor.execute("""
-                        SELECT AVG(marks/max_marks * 100) as avg FROM grades WHERE student_id = %s AND max_marks > 0
-                    """, (student_id,))
-                    result = cursor.fetchone()
-                    avg = result['avg'] if result and result['avg'] else 0
-                    stats['student_average'] = round(float(avg), 1) if avg else 0
-                    stats['student_attendance'] = 100
-                else:
-                    stats['student_name'] = 'Not linked'
-                    stats['student_average'] = 0
-                    stats['student_attendance'] = 100
-            
-            return stats
+            return fetch_dashboard_stats(cursor, token)
+
+@api_router.post("/admin/rollups/reconcile")
+async def reconcile_rollups(token: dict = Depends(require_role('Admin'))):
+    """Rebuild the dashboard KPI rollups now and report any counters that had drifted"""
+    with get_db_connection() as conn:
+        drift = reconcile_kpi_rollups(conn)
+    return {"message": "KPI rollups reconciled", "drifted": drift}
 
 # Students list for dropdowns
 @api_router.get("/students")
@@ -1085,7 +2986,7 @@ async def get_students(token: dict = Depends(require_role('Admin', 'Teacher'))):
                 SELECT id, username, email, name as full_name, idno as usn, department, section 
                 FROM users WHERE role = 'Student'
             """)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 # ==========================================
 # TIMETABLE GENERATION
@@ -1102,6 +3003,195 @@ TIME_SLOTS = [
 ]
 
 DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+TIME_SLOT_BY_NUMBER = {s['slot']: s for s in TIME_SLOTS}
+
+# Materialized weekly timetables per (department, year, section), with slot times pre-joined.
+# Invalidated by the timetable write endpoints; the TTL only guards against edits made
+# outside this process (other workers, direct DB changes).
+TIMETABLE_CACHE_TTL = 300
+_class_timetables = {}   # (department, year, section) -> {'slots', 'by_day', 'class_teacher', 'etag', 'loaded_at'}
+_user_classes = {}       # user_id -> ((department, year, section) or None, loaded_at)
+
+def get_class_timetable(department: str, year: str, section: str) -> dict:
+    key = (department, year, section)
+    entry = _class_timetables.get(key)
+    if entry and time.monotonic() - entry['loaded_at'] < TIMETABLE_CACHE_TTL:
+        return entry
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT ts.*, c.name as course_name, c.code as course_code,
+                       u.name as teacher_name
+                FROM timetable_slots ts
+                LEFT JOIN courses c ON ts.course_id = c.id
+                LEFT JOIN users u ON ts.teacher_id = u.id
+                WHERE ts.department = %s AND ts.year = %s AND ts.section = %s
+                ORDER BY ts.day_of_week, ts.slot_number
+            """, key)
+            slots = cursor.fetchall()
+            cursor.execute("""
+                SELECT ct.*, u.name as teacher_name 
+                FROM class_teachers ct
+                JOIN users u ON ct.teacher_id = u.id
+                WHERE ct.department = %s AND ct.year = %s AND ct.section = %s
+            """, key)
+            class_teacher = cursor.fetchone()
+
+    by_day = {}
+    for slot in slots:
+        slot_config = TIME_SLOT_BY_NUMBER.get(slot['slot_number'])
+        if slot_config:
+            slot['start_time'] = slot_config['start']
+            slot['end_time'] = slot_config['end']
+        by_day.setdefault(slot['day_of_week'], []).append(slot)
+
+    entry = {
+        'slots': slots,
+        'by_day': by_day,
+        'class_teacher': class_teacher,
+        'etag': compute_etag(slots, class_teacher),
+        'loaded_at': time.monotonic(),
+    }
+    _class_timetables[key] = entry
+    return entry
+
+def get_user_class(user_id: int):
+    """(department, year, section) for a user, or None if the profile is incomplete"""
+    cached = _user_classes.get(user_id)
+    if cached and time.monotonic() - cached[1] < TIMETABLE_CACHE_TTL:
+        return cached[0]
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT department, year, section FROM users WHERE id = %s", (user_id,))
+            user = cursor.fetchone()
+    user_class = None
+    if user and user.get('department') and user.get('year'):
+        user_class = (user['department'], user['year'], user.get('section', 'A'))
+    _user_classes[user_id] = (user_class, time.monotonic())
+    return user_class
+
+def invalidate_class_timetable(department: Optional[str] = None, year: Optional[str] = None, section: Optional[str] = None):
+    """Drop one class's cached timetable, or all of them when called without arguments"""
+    if department is None:
+        _class_timetables.clear()
+    else:
+        _class_timetables.pop((department, year, section), None)
+
+MAX_SLOTS_PER_DAY = 8       # the generator fills up to 8 slots per day
+MAX_CLASSES_PER_DAY = 2     # per teacher
+
+class TeacherOccupancy:
+    """Institution-wide teacher x day x slot occupancy bitmap.
+
+    Each teacher has one int; bit (day_index * MAX_SLOTS_PER_DAY + slot - 1) is set when
+    they teach in that cell. Cell owners are kept alongside so a class can overwrite its
+    own cell and so deletes/regenerations can clear exactly what they replace.
+    """
+    DAY_MASK = (1 << MAX_SLOTS_PER_DAY) - 1
+
+    def __init__(self):
+        self.masks = {}          # teacher_id -> bitmap
+        self.class_cells = {}    # (class_key, day_index, slot) -> teacher_id
+        self.teacher_cells = {}  # (teacher_id, day_index, slot) -> class_key
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def cell(day: str, slot_number: int):
+        if day not in DAYS_OF_WEEK or not 1 <= slot_number <= MAX_SLOTS_PER_DAY:
+            raise HTTPException(status_code=400, detail=f"Invalid day/slot: {day} {slot_number}")
+        return DAYS_OF_WEEK.index(day), slot_number
+
+    @staticmethod
+    def bit(day_index: int, slot_number: int) -> int:
+        return 1 << (day_index * MAX_SLOTS_PER_DAY + slot_number - 1)
+
+    def day_count(self, mask: int, day_index: int) -> int:
+        return bin((mask >> (day_index * MAX_SLOTS_PER_DAY)) & self.DAY_MASK).count('1')
+
+    def assign(self, class_key, day_index: int, slot_number: int, teacher_id: int):
+        self.clear_cell(class_key, day_index, slot_number)
+        self.class_cells[(class_key, day_index, slot_number)] = teacher_id
+        self.teacher_cells[(teacher_id, day_index, slot_number)] = class_key
+        self.masks[teacher_id] = self.masks.get(teacher_id, 0) | self.bit(day_index, slot_number)
+
+    def clear_cell(self, class_key, day_index: int, slot_number: int):
+        teacher_id = self.class_cells.pop((class_key, day_index, slot_number), None)
+        if teacher_id is None:
+            return
+        if self.teacher_cells.get((teacher_id, day_index, slot_number)) == class_key:
+            del self.teacher_cells[(teacher_id, day_index, slot_number)]
+            self.masks[teacher_id] &= ~self.bit(day_index, slot_number)
+
+    def clear_class(self, class_key):
+        for (key, day_index, slot_number) in [c for c in self.class_cells if c[0] == class_key]:
+            self.clear_cell(key, day_index, slot_number)
+
+    def mask_excluding_class(self, teacher_id: int, class_key) -> int:
+        """The teacher's bitmap with the cells of `class_key` treated as free"""
+        mask = self.masks.get(teacher_id, 0)
+        for (t, day_index, slot_number), key in self.teacher_cells.items():
+            if t == teacher_id and key == class_key:
+                mask &= ~self.bit(day_index, slot_number)
+        return mask
+
+    def conflict(self, teacher_id: int, day: str, slot_number: int, class_key) -> Optional[str]:
+        """O(1) replacement for the collision and daily-cap queries; None when the teacher is free"""
+        day_index, slot_number = self.cell(day, slot_number)
+        mask = self.masks.get(teacher_id, 0)
+        bit = self.bit(day_index, slot_number)
+        occupant = self.teacher_cells.get((teacher_id, day_index, slot_number))
+        if occupant is not None and occupant != class_key:
+            return f"Teacher already has a class on {day} at slot {slot_number}"
+        if mask & bit:
+            mask &= ~bit  # overwriting their own cell in this class doesn't count towards the cap
+        if self.day_count(mask, day_index) >= MAX_CLASSES_PER_DAY:
+            return f"Teacher already has maximum {MAX_CLASSES_PER_DAY} classes on {day}"
+        return None
+
+    def load(self, rows):
+        for row in rows:
+            if row['day_of_week'] in DAYS_OF_WEEK and 1 <= row['slot_number'] <= MAX_SLOTS_PER_DAY:
+                self.assign((row['department'], row['year'], row['section']),
+                            DAYS_OF_WEEK.index(row['day_of_week']), row['slot_number'], row['teacher_id'])
+        return self
+
+SCHEMA_STATEMENTS.append("ALTER TABLE timetable_slots ADD INDEX idx_timetable_slots_teacher (teacher_id, day_of_week)")
+
+_teacher_occupancy: Optional[TeacherOccupancy] = None
+
+def get_teacher_occupancy() -> TeacherOccupancy:
+    """Load the bitmap once per process (refreshed after TIMETABLE_CACHE_TTL for other workers' writes).
+
+    Good for the availability view and a fast first check; writes re-check with lock_teacher_occupancy().
+    """
+    global _teacher_occupancy
+    if _teacher_occupancy and time.monotonic() - _teacher_occupancy.loaded_at < TIMETABLE_CACHE_TTL:
+        return _teacher_occupancy
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT department, year, section, day_of_week, slot_number, teacher_id
+                FROM timetable_slots WHERE teacher_id IS NOT NULL
+            """)
+            _teacher_occupancy = TeacherOccupancy().load(cursor.fetchall())
+    return _teacher_occupancy
+
+def lock_teacher_occupancy(cursor, teacher_ids) -> TeacherOccupancy:
+    """Current occupancy of some teachers, read inside the caller's write transaction.
+
+    The teachers' user rows are locked first (in id order), so writers in other workers or
+    instances booking the same teacher wait here until this transaction ends.
+    """
+    ids = tuple(sorted(set(teacher_ids)))
+    if not ids:
+        return TeacherOccupancy()
+    cursor.execute("SELECT id FROM users WHERE id IN %s ORDER BY id FOR UPDATE", (ids,))
+    cursor.execute("""
+        SELECT department, year, section, day_of_week, slot_number, teacher_id
+        FROM timetable_slots WHERE teacher_id IN %s
+    """, (ids,))
+    return TeacherOccupancy().load(cursor.fetchall())
 
 class TimetableSlotCreate(BaseModel):
     department: str
@@ -1119,19 +3209,31 @@ class ClassTeacherAssign(BaseModel):
     section: str
     teacher_id: int
 
+SLOTS_CONFIG_ETAG = compute_etag(TIME_SLOTS, DAYS_OF_WEEK)
+
 @api_router.get("/timetable/slots-config")
-async def get_slots_config(token: dict = Depends(verify_token)):
+async def get_slots_config(request: Request, token: dict = Depends(verify_token)):
     """Get the time slot configuration"""
-    return {"slots": TIME_SLOTS, "days": DAYS_OF_WEEK}
+    return conditional_response(request, SLOTS_CONFIG_ETAG, {"slots": TIME_SLOTS, "days": DAYS_OF_WEEK})
 
 @api_router.get("/timetable")
 async def get_timetable(
+    request: Request,
     department: Optional[str] = None,
     year: Optional[str] = None,
     section: Optional[str] = None,
     token: dict = Depends(verify_token)
 ):
     """Get timetable for a specific class or all classes"""
+    if department and year and section:
+        entry = get_class_timetable(department, year, section)
+        return conditional_response(request, entry['etag'], {
+            "slots": entry['slots'], "class_teacher": entry['class_teacher'], "config": TIME_SLOTS
+        })
+
+    etag = table_etag(('timetable_slots', 'courses'), department, year, section)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             query = """
@@ -1158,59 +3260,77 @@ async def get_timetable(
             cursor.execute(query, params)
             slots = cursor.fetchall()
             
-            # Also get class teacher if filtering by specific class
-            class_teacher = None
-            if department and year and section:
-                cursor.execute("""
-                    SELECT ct.*, u.name as teacher_name 
-                    FROM class_teachers ct
-                    JOIN users u ON ct.teacher_id = u.id
-                    WHERE ct.department = %s AND ct.year = %s AND ct.section = %s
-                """, (department, year, section))
-                class_teacher = cursor.fetchone()
-            
-            return {"slots": slots, "class_teacher": class_teacher, "config": TIME_SLOTS}
+            return conditional_response(request, etag, {"slots": slots, "class_teacher": None, "config": TIME_SLOTS})
+
+def today_timetable(user_id: int) -> tuple:
+    """(etag, payload) for the user's classes today; etag is None when the profile has no class"""
+    user_class = get_user_class(user_id)
+    if not user_class:
+        return None, {"slots": [], "message": "User profile incomplete"}
+    
+    entry = get_class_timetable(*user_class)
+    
+    now = datetime.now()
+    today = now.strftime("%A")
+    current_time = now.strftime("%H:%M")
+    
+    # Mark current and next class
+    slots = [dict(slot) for slot in entry['by_day'].get(today, [])]
+    for i, slot in enumerate(slots):
+        if 'start_time' in slot:
+            slot['is_current'] = slot['start_time'] <= current_time <= slot['end_time']
+            slot['is_next'] = i > 0 and slots[i-1].get('is_current', False) == False and current_time < slot['start_time']
+    
+    # The representation only changes when the timetable, the day or the current/next flags change
+    flags = [(s.get('is_current'), s.get('is_next')) for s in slots]
+    etag = compute_etag(entry['etag'], today, flags)
+    return etag, {"slots": slots, "today": today, "current_time": current_time}
 
 @api_router.get("/timetable/today")
-async def get_today_timetable(token: dict = Depends(verify_token)):
+async def get_today_timetable(request: Request, token: dict = Depends(verify_token)):
     """Get today's timetable for the logged-in student"""
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            # Get user details
-            cursor.execute("SELECT department, year, section FROM users WHERE id = %s", (token['user_id'],))
-            user = cursor.fetchone()
-            
-            if not user or not user.get('department') or not user.get('year'):
-                return {"slots": [], "message": "User profile incomplete"}
-            
-            # Get current day
-            from datetime import datetime
-            today = datetime.now().strftime("%A")
-            
-            section = user.get('section', 'A')
-            
-            cursor.execute("""
-                SELECT ts.*, c.name as course_name, c.code as course_code,
-                       u.name as teacher_name
-                FROM timetable_slots ts
-                LEFT JOIN courses c ON ts.course_id = c.id
-                LEFT JOIN users u ON ts.teacher_id = u.id
-                WHERE ts.department = %s AND ts.year = %s AND ts.section = %s AND ts.day_of_week = %s
-                ORDER BY ts.slot_number
-            """, (user['department'], user['year'], section, today))
-            slots = cursor.fetchall()
-            
-            # Mark current and next class
-            current_time = datetime.now().strftime("%H:%M")
-            for i, slot in enumerate(slots):
-                slot_config = next((s for s in TIME_SLOTS if s['slot'] == slot['slot_number']), None)
-                if slot_config:
-                    slot['start_time'] = slot_config['start']
-                    slot['end_time'] = slot_config['end']
-                    slot['is_current'] = slot_config['start'] <= current_time <= slot_config['end']
-                    slot['is_next'] = i > 0 and slots[i-1].get('is_current', False) == False and current_time < slot_config['start']
-            
-            return {"slots": slots, "today": today, "current_time": current_time}
+    etag, payload = today_timetable(token['user_id'])
+    if etag is None:
+        return payload
+    return conditional_response(request, etag, payload)
+
+@api_router.get("/timetable/teacher-availability")
+async def get_teacher_availability(
+    request: Request,
+    department: Optional[str] = None,
+    year: Optional[str] = None,
+    section: Optional[str] = None,
+    token: dict = Depends(require_role('Admin'))
+):
+    """Teacher x day occupancy matrix for the timetable editor.
+
+    matrix[teacher_id][day_index] is a bitmask of busy slots (bit slot-1). When a class is
+    given, its own cells are reported free, since editing them is allowed.
+    """
+    etag = table_etag(('timetable_slots',), department, year, section)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    occupancy = get_teacher_occupancy()
+    class_key = (department, year, section) if department and year and section else None
+    matrix = {}
+    at_daily_limit = {}
+    for teacher_id in occupancy.masks:
+        mask = occupancy.mask_excluding_class(teacher_id, class_key) if class_key else occupancy.masks[teacher_id]
+        if not mask:
+            continue
+        matrix[teacher_id] = [(mask >> (d * MAX_SLOTS_PER_DAY)) & TeacherOccupancy.DAY_MASK for d in range(len(DAYS_OF_WEEK))]
+        full = [DAYS_OF_WEEK[d] for d in range(len(DAYS_OF_WEEK)) if occupancy.day_count(mask, d) >= MAX_CLASSES_PER_DAY]
+        if full:
+            at_daily_limit[teacher_id] = full
+    
+    return conditional_response(request, etag, {
+        "days": DAYS_OF_WEEK,
+        "slots_per_day": MAX_SLOTS_PER_DAY,
+        "max_classes_per_day": MAX_CLASSES_PER_DAY,
+        "matrix": matrix,
+        "at_daily_limit": at_daily_limit
+    })
 
 @api_router.post("/timetable/slot")
 async def create_timetable_slot(
@@ -1218,33 +3338,20 @@ async def create_timetable_slot(
     token: dict = Depends(require_role('Admin'))
 ):
     """Create or update a single timetable slot"""
+    class_key = (slot.department, slot.year, slot.section)
+    occupancy = get_teacher_occupancy()
+    conflict = occupancy.conflict(slot.teacher_id, slot.day_of_week, slot.slot_number, class_key)
+    if conflict:
+        raise HTTPException(status_code=400, detail=conflict)
+    
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # Check for teacher collision (same teacher, same day, same slot)
-            cursor.execute("""
-                SELECT id FROM timetable_slots 
-                WHERE teacher_id = %s AND day_of_week = %s AND slot_number = %s
-                AND NOT (department = %s AND year = %s AND section = %s)
-            """, (slot.teacher_id, slot.day_of_week, slot.slot_number,
-                  slot.department, slot.year, slot.section))
-            
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, 
-                    detail=f"Teacher already has a class on {slot.day_of_week} at slot {slot.slot_number}")
-            
-            # Check teacher's daily limit (max 2 classes per day)
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM timetable_slots 
-                WHERE teacher_id = %s AND day_of_week = %s
-                AND NOT (department = %s AND year = %s AND section = %s AND slot_number = %s)
-            """, (slot.teacher_id, slot.day_of_week, 
-                  slot.department, slot.year, slot.section, slot.slot_number))
-            count = cursor.fetchone()['count']
-            
-            if count >= 2:
-                raise HTTPException(status_code=400, 
-                    detail=f"Teacher already has maximum 2 classes on {slot.day_of_week}")
-            
+            # The cached bitmap may miss bookings made elsewhere in the last few minutes
+            conflict = lock_teacher_occupancy(cursor, [slot.teacher_id]).conflict(
+                slot.teacher_id, slot.day_of_week, slot.slot_number, class_key)
+            if conflict:
+                conn.rollback()
+                raise HTTPException(status_code=400, detail=conflict)
             # Insert or update
             cursor.execute("""
                 INSERT INTO timetable_slots 
@@ -1255,6 +3362,9 @@ async def create_timetable_slot(
             """, (slot.department, slot.year, slot.section, slot.day_of_week,
                   slot.slot_number, slot.course_id, slot.teacher_id, slot.room))
             conn.commit()
+            occupancy.assign(class_key, *occupancy.cell(slot.day_of_week, slot.slot_number), slot.teacher_id)
+            invalidate_class_timetable(slot.department, slot.year, slot.section)
+            bump_table_version('timetable_slots')
             return {"message": "Slot updated successfully"}
 
 @api_router.get("/users/teachers/subjects")
@@ -1292,61 +3402,59 @@ async def generate_timetable(req: TimetableGenerateRequest, token: dict = Depend
        - Hasn't hit their daily limit of 2 classes.
        - Still needs more slots to meet their weekly target.
     """
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    all_slots = range(1, 9) # 8 slots per day
+    class_key = (req.department, req.year, req.section)
+    occupancy = get_teacher_occupancy()
+    
+    # requirements: {(course_id, teacher_id): slots_remaining}
+    requirements = {(p.course_id, p.teacher_id): p.slots_per_week for p in req.pairings}
     
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # 1. Clear existing timetable for this specific section
-            cursor.execute("""
-                DELETE FROM timetable_slots 
-                WHERE department = %s AND year = %s AND section = %s
-            """, (req.department, req.year, req.section))
-            
-            # 2. Track assignments for THIS generation
-            # requirements: {(course_id, teacher_id): slots_remaining}
-            requirements = {(p.course_id, p.teacher_id): p.slots_per_week for p in req.pairings}
+            # Plan against the teachers' locked, current bookings rather than the cached bitmap
+            current = lock_teacher_occupancy(cursor, [teacher_id for _, teacher_id in requirements])
+            # Working copy of each teacher's bitmap; this section's current slots are about to be replaced
+            masks = {teacher_id: current.mask_excluding_class(teacher_id, class_key) for _, teacher_id in requirements}
+            assignments = []
             
-            # 3. Greedy assignment with collision checks
-            for day in days:
-                for slot_num in all_slots:
+            # Greedy assignment with O(1) collision checks against the occupancy bitmap
+            for day_index, day in enumerate(DAYS_OF_WEEK):
+                for slot_num in range(1, MAX_SLOTS_PER_DAY + 1):
                     # Randomize pairings order to avoid bias
                     pairing_items = list(requirements.items())
                     random.shuffle(pairing_items)
-                    
+                    bit = occupancy.bit(day_index, slot_num)
+            
                     for (course_id, teacher_id), remaining in pairing_items:
                         if remaining <= 0:
                             continue
-                            
-                        # Check teacher availability (global collision)
-                        cursor.execute("""
-                            SELECT id FROM timetable_slots 
-                            WHERE teacher_id = %s AND day_of_week = %s AND slot_number = %s
-                        """, (teacher_id, day, slot_num))
-                        if cursor.fetchone():
+                        if masks[teacher_id] & bit:
                             continue # Teacher is busy elsewhere
-                            
-                        # Check teacher daily limit (max 2)
-                        cursor.execute("""
-                            SELECT COUNT(*) as count FROM timetable_slots 
-                            WHERE teacher_id = %s AND day_of_week = %s
-                        """, (teacher_id, day))
-                        daily_count = cursor.fetchone()['count']
-                        if daily_count >= 2:
+                        if occupancy.day_count(masks[teacher_id], day_index) >= MAX_CLASSES_PER_DAY:
                             continue
-                            
-                        # Assign slot
-                        cursor.execute("""
-                            INSERT INTO timetable_slots 
-                            (department, year, section, day_of_week, slot_number, course_id, teacher_id)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """, (req.department, req.year, req.section, day, slot_num, course_id, teacher_id))
-                        
+                
+                        masks[teacher_id] |= bit
+                        assignments.append((day_index, slot_num, course_id, teacher_id))
                         requirements[(course_id, teacher_id)] -= 1
                         break # Found a teacher for this slot, move to next slot
-            
+
+            # Clear existing timetable for this specific section
+            cursor.execute("""
+                DELETE FROM timetable_slots 
+                WHERE department = %s AND year = %s AND section = %s
+            """, class_key)
+            cursor.executemany("""
+                INSERT INTO timetable_slots 
+                (department, year, section, day_of_week, slot_number, course_id, teacher_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, [class_key + (DAYS_OF_WEEK[d], n, c, t) for d, n, c, t in assignments])
             conn.commit()
             
+            occupancy.clear_class(class_key)
+            for day_index, slot_num, _, teacher_id in assignments:
+                occupancy.assign(class_key, day_index, slot_num, teacher_id)
+            invalidate_class_timetable(req.department, req.year, req.section)
+            bump_table_version('timetable_slots')
+            
             # Check for unassigned slots
             total_remaining = sum(requirements.values())
             if total_remaining > 0:
@@ -1356,9 +3464,6 @@ async def generate_timetable(req: TimetableGenerateRequest, token: dict = Depend
                 }
                 
             return {"message": "Timetable generated successfully!", "status": "success"}
-            conn.commit()
-            
-            return {"message": "Slot created/updated successfully"}
 
 @api_router.delete("/timetable/slot/{slot_id}")
 async def delete_timetable_slot(
@@ -1368,8 +3473,18 @@ async def delete_timetable_slot(
     """Delete a timetable slot"""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT department, year, section, day_of_week, slot_number FROM timetable_slots WHERE id = %s
+            """, (slot_id,))
+            existing = cursor.fetchone()
             cursor.execute("DELETE FROM timetable_slots WHERE id = %s", (slot_id,))
             conn.commit()
+            if existing:
+                class_key = (existing['department'], existing['year'], existing['section'])
+                if existing['day_of_week'] in DAYS_OF_WEEK and _teacher_occupancy:
+                    _teacher_occupancy.clear_cell(class_key, DAYS_OF_WEEK.index(existing['day_of_week']), existing['slot_number'])
+                invalidate_class_timetable(*class_key)
+            bump_table_version('timetable_slots')
             return {"message": "Slot deleted successfully"}
 
 @api_router.post("/timetable/class-teacher")
@@ -1392,14 +3507,20 @@ async def assign_class_teacher(
                 ON DUPLICATE KEY UPDATE teacher_id = VALUES(teacher_id)
             """, (assignment.department, assignment.year, assignment.section, assignment.teacher_id))
             conn.commit()
+            invalidate_class_timetable(assignment.department, assignment.year, assignment.section)
+            bump_table_version('class_teachers')
             return {"message": "Class teacher assigned successfully"}
 
 @api_router.get("/timetable/class-teachers")
 async def get_class_teachers(
+    request: Request,
     department: Optional[str] = None,
     token: dict = Depends(require_role('Admin', 'Teacher'))
 ):
     """Get all class teacher assignments"""
+    etag = table_etag(('class_teachers',), department)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             query = """
@@ -1414,7 +3535,7 @@ async def get_class_teachers(
             
             query += " ORDER BY ct.department, ct.year, ct.section"
             cursor.execute(query, params)
-            return cursor.fetchall()
+            return conditional_response(request, etag, cursor.fetchall())
 
 @api_router.get("/timetable/class-teacher/check")
 async def check_class_teacher(
@@ -1449,20 +3570,144 @@ class LeaveApproval(BaseModel):
     status: str  # approved, rejected
     remarks: Optional[str] = None
 
+# ---- Leave calendar ----
+# In-memory interval index over live (not rejected) leaves ending on or after
+# today - LEAVE_CALENDAR_WINDOW_DAYS, sorted per class (department, year, section) for
+# "who is on leave on day D". Loaded with one range query on end_date, kept current by the
+# leave write paths and reloaded after LEAVE_CALENDAR_TTL. A student's own overlap check runs
+# against the database inside the insert (idx_leave_student_dates), so it never trusts a stale copy.
+SCHEMA_STATEMENTS.extend([
+    "ALTER TABLE leave_requests ADD INDEX idx_leave_end_date (end_date, start_date)",
+    "ALTER TABLE leave_requests ADD INDEX idx_leave_student_dates (student_id, start_date, end_date)",
+    "ALTER TABLE leave_requests ADD COLUMN has_exam_conflict BOOLEAN DEFAULT FALSE",
+    "ALTER TABLE exam_schedules ADD INDEX idx_exam_schedules_date (exam_date)",
+])
+
+LEAVE_CALENDAR_TTL = 300
+LEAVE_CALENDAR_WINDOW_DAYS = 60
+INACTIVE_LEAVE_STATUSES = ('rejected', 'hod_rejected')
+
+def parse_leave_date(value: str, field: str) -> date:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} must be a date (YYYY-MM-DD)")
+
+class LeaveCalendar:
+    def __init__(self, window_start: date):
+        self.window_start = window_start
+        self.entries = {}      # leave id -> entry
+        self.by_class = {}     # (department, year, section) -> [(start, id)] sorted
+        self.loaded_at = time.monotonic()
+
+    def add(self, entry: dict):
+        if entry['status'] in INACTIVE_LEAVE_STATUSES or entry['end'] < self.window_start:
+            return
+        self.remove(entry['id'])
+        self.entries[entry['id']] = entry
+        bisect.insort(self.by_class.setdefault(entry['class_key'], []), (entry['start'], entry['id']))
+
+    def remove(self, leave_id: int):
+        entry = self.entries.pop(leave_id, None)
+        if entry:
+            self.by_class[entry['class_key']].remove((entry['start'], leave_id))
+
+    def set_status(self, leave_id: int, status: str):
+        entry = self.entries.get(leave_id)
+        if entry:
+            if status in INACTIVE_LEAVE_STATUSES:
+                self.remove(leave_id)
+            else:
+                entry['status'] = status
+
+    def _overlapping(self, index: List[tuple], start: date, end: date) -> List[dict]:
+        # Entries starting after `end` cannot overlap; of the rest keep those ending on/after `start`
+        cut = bisect.bisect_right(index, (end, float('inf')))
+        return [self.entries[i] for _, i in index[:cut] if self.entries[i]['end'] >= start]
+
+    def on_leave(self, class_key: tuple, day: date) -> List[dict]:
+        return self._overlapping(self.by_class.get(class_key, []), day, day)
+
+_leave_calendar: Optional[LeaveCalendar] = None
+
+def leave_calendar_entry(row: dict) -> dict:
+    return {
+        "id": row['id'], "student_id": row['student_id'], "student_name": row.get('student_name'),
+        "class_key": (row['department'], row['year'], row['section']),
+        "start": parse_leave_date(row['start_date'], 'start_date'), "end": parse_leave_date(row['end_date'], 'end_date'),
+        "status": row['status'], "leave_type": row.get('leave_type'),
+    }
+
+def get_leave_calendar() -> LeaveCalendar:
+    global _leave_calendar
+    if _leave_calendar and time.monotonic() - _leave_calendar.loaded_at < LEAVE_CALENDAR_TTL:
+        return _leave_calendar
+    calendar = LeaveCalendar(datetime.now().date() - timedelta(days=LEAVE_CALENDAR_WINDOW_DAYS))
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, student_id, student_name, department, year, section, start_date, end_date, status, leave_type
+                FROM leave_requests
+                WHERE end_date >= %s AND status NOT IN %s
+            """, (calendar.window_start, INACTIVE_LEAVE_STATUSES))
+            for row in cursor.fetchall():
+                calendar.add(leave_calendar_entry(row))
+    _leave_calendar = calendar
+    return calendar
+
+def find_exam_conflicts(cursor, department: str, year: str, start: date, end: date) -> List[dict]:
+    """Exams for the class in the range; unpublished ones are included so approvers still see the flag"""
+    cursor.execute("""
+        SELECT e.id, e.name, e.exam_date, e.start_time, c.name as course_name, e.is_visible
+        FROM exam_schedules e
+        JOIN courses c ON e.course_id = c.id
+        WHERE e.exam_date BETWEEN %s AND %s AND c.department = %s AND c.year = %s
+        ORDER BY e.exam_date
+    """, (start, end, department, year))
+    return cursor.fetchall()
+
+def count_missed_classes(department: str, year: str, section: str, start: date, end: date) -> int:
+    by_day = get_class_timetable(department, year, section)['by_day']
+    per_weekday = [len(by_day.get(day, [])) for day in DAYS_OF_WEEK] + [0]  # Sunday has no classes
+    days = (end - start).days + 1
+    full_weeks, remainder = divmod(days, 7)
+    missed = full_weeks * sum(per_weekday)
+    for offset in range(remainder):
+        missed += per_weekday[(start + timedelta(days=offset)).weekday()]
+    return missed
+
 @api_router.post("/leave/request")
 async def create_leave_request(
     request: LeaveRequestCreate,
     token: dict = Depends(verify_token)
 ):
     """Student submits a leave request"""
+    start = parse_leave_date(request.start_date, 'start_date')
+    end = parse_leave_date(request.end_date, 'end_date')
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # Get student info
-            cursor.execute("SELECT id, name, department, year, section FROM users WHERE id = %s", (token['user_id'],))
+            # Get student info; the row lock serializes this student's concurrent submissions
+            cursor.execute("SELECT id, name, department, year, section FROM users WHERE id = %s FOR UPDATE", (token['user_id'],))
             student = cursor.fetchone()
             
             if not student:
+                conn.rollback()
                 raise HTTPException(status_code=404, detail="User not found")
+
+            cursor.execute("""
+                SELECT start_date, end_date, status FROM leave_requests
+                WHERE student_id = %s AND start_date <= %s AND end_date >= %s AND status NOT IN %s
+                ORDER BY start_date LIMIT 1
+            """, (token['user_id'], end, start, INACTIVE_LEAVE_STATUSES))
+            existing = cursor.fetchone()
+            if existing:
+                conn.rollback()
+                raise HTTPException(status_code=409, detail=f"Overlaps your {existing['status'].replace('_', ' ')} leave "
+                                                            f"from {parse_leave_date(existing['start_date'], 'start_date')} "
+                                                            f"to {parse_leave_date(existing['end_date'], 'end_date')}")
             
             # Find class teacher for this student's specific class (Dept + Year + Section)
             cursor.execute("""
@@ -1472,18 +3717,74 @@ async def create_leave_request(
                 WHERE ct.department = %s AND ct.year = %s AND ct.section = %s
             """, (student['department'], student['year'], student['section']))
             class_teacher = cursor.fetchone()
+
+            exam_conflicts = find_exam_conflicts(cursor, student['department'], student['year'], start, end)
             
             cursor.execute("""
                 INSERT INTO leave_requests 
                 (student_id, student_name, department, year, section, leave_type, start_date, end_date, reason, 
-                 status, class_teacher_id, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', %s, NOW())
+                 status, class_teacher_id, has_exam_conflict, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', %s, %s, NOW())
             """, (token['user_id'], student['name'], student['department'], student['year'], student['section'],
-                  request.leave_type, request.start_date, request.end_date, request.reason,
-                  class_teacher['teacher_id'] if class_teacher else None))
+                  request.leave_type, start, end, request.reason,
+                  class_teacher['teacher_id'] if class_teacher else None, bool(exam_conflicts)))
+            leave_id = cursor.lastrowid
+            bump_rollups(cursor, {(student['department'], 'leaves:pending'): 1})
             conn.commit()
-            
-            return {"message": "Leave request submitted successfully"}
+            invalidate_leave_inbox(class_teacher['teacher_id'] if class_teacher else None, student['department'])
+
+    get_leave_calendar().add(leave_calendar_entry(dict(student, id=leave_id, student_id=token['user_id'], student_name=student['name'],
+                                           start_date=start, end_date=end, status='pending',
+                                           leave_type=request.leave_type)))
+    response = {"message": "Leave request submitted successfully", "id": leave_id,
+                "classes_missed": count_missed_classes(student['department'], student['year'], student['section'], start, end)}
+    # Students only hear about published exams; hidden ones just set has_exam_conflict for approvers
+    visible_conflicts = [{k: v for k, v in e.items() if k != 'is_visible'} for e in exam_conflicts if e['is_visible']]
+    if visible_conflicts:
+        response["exam_conflicts"] = visible_conflicts
+        response["message"] += f" (note: overlaps {len(visible_conflicts)} scheduled exam(s))"
+    return DBJSONResponse(response)
+
+@api_router.get("/leave/on-leave")
+async def get_students_on_leave(
+    department: str,
+    year: str,
+    section: str,
+    day: Optional[str] = None,
+    token: dict = Depends(require_role('Admin', 'Teacher'))
+):
+    """Students of a class who are on (approved or pending) leave on a given day (default today)"""
+    target = parse_leave_date(day, 'day') if day else datetime.now().date()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if token['role'] == 'Teacher':
+                actor = get_leave_actor(cursor, token['user_id'])
+                if not (actor['is_hod'] and department in actor['departments']):
+                    cursor.execute("""
+                        SELECT id FROM class_teachers WHERE teacher_id = %s AND department = %s AND year = %s AND section = %s
+                    """, (token['user_id'], department, year, section))
+                    if not cursor.fetchone():
+                        raise HTTPException(status_code=403, detail="Only the class teacher or HOD can view this class")
+
+            calendar = get_leave_calendar()
+            if target >= calendar.window_start:
+                entries = calendar.on_leave((department, year, section), target)
+            else:
+                # Older than the in-memory window: ask the date index directly
+                cursor.execute("""
+                    SELECT id, student_id, student_name, department, year, section, start_date, end_date, status, leave_type
+                    FROM leave_requests
+                    WHERE end_date >= %s AND start_date <= %s AND department = %s AND year = %s AND section = %s
+                      AND status NOT IN %s
+                """, (target, target, department, year, section, INACTIVE_LEAVE_STATUSES))
+                entries = [leave_calendar_entry(r) for r in cursor.fetchall()]
+
+    students = sorted(({
+        "leave_id": e['id'], "student_id": e['student_id'], "student_name": e['student_name'],
+        "leave_type": e['leave_type'], "status": e['status'],
+        "start_date": e['start'], "end_date": e['end'],
+    } for e in entries), key=lambda s: s['student_name'] or '')
+    return DBJSONResponse({"day": target, "count": len(students), "students": students})
 
 @api_router.get("/leave/my-requests")
 async def get_my_leave_requests(token: dict = Depends(verify_token)):
@@ -1493,7 +3794,7 @@ async def get_my_leave_requests(token: dict = Depends(verify_token)):
             cursor.execute("""
                 SELECT * FROM leave_requests WHERE student_id = %s ORDER BY created_at DESC
             """, (token['user_id'],))
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.get("/leave/requests")
 async def get_leave_requests_for_teacher(
@@ -1517,7 +3818,34 @@ async def get_leave_requests_for_teacher(
             
             query += " ORDER BY lr.created_at DESC"
             cursor.execute(query, params)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
+
+def fetch_hod_leave_requests(cursor, user_id: int, status: Optional[str] = None) -> List[dict]:
+    # Verify user is HOD
+    cursor.execute("SELECT is_hod, hod_department FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    
+    if not user or not user.get('is_hod'):
+        raise HTTPException(status_code=403, detail="Only HODs can access this")
+    
+    dept_ids = resolve_department_identifiers(user['hod_department'], cursor)
+    query = """
+        SELECT lr.*, u.name as student_name, t.name as teacher_name
+        FROM leave_requests lr
+        JOIN users u ON lr.student_id = u.id
+        LEFT JOIN users t ON lr.class_teacher_id = t.id
+        WHERE lr.department IN %s AND lr.status = 'forwarded_to_hod'
+    """
+    params = [tuple(dept_ids)]
+
+    
+    if status and status != 'forwarded_to_hod':
+        query += " AND lr.status = %s"
+        params.append(status)
+    
+    query += " ORDER BY lr.created_at DESC"
+    cursor.execute(query, params)
+    return cursor.fetchall()
 
 @api_router.get("/leave/hod-requests")
 async def get_leave_requests_for_hod(
@@ -1527,31 +3855,153 @@ async def get_leave_requests_for_hod(
     """HOD gets forwarded leave requests"""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # Verify user is HOD
-            cursor.execute("SELECT is_hod, hod_department FROM users WHERE id = %s", (token['user_id'],))
-            user = cursor.fetchone()
-            
-            if not user or not user.get('is_hod'):
-                raise HTTPException(status_code=403, detail="Only HODs can access this")
-            
-            dept_ids = resolve_department_identifiers(user['hod_department'], cursor)
-            query = """
-                SELECT lr.*, u.name as student_name, t.name as teacher_name
-                FROM leave_requests lr
-                JOIN users u ON lr.student_id = u.id
-                LEFT JOIN users t ON lr.class_teacher_id = t.id
-                WHERE lr.department IN %s AND lr.status = 'forwarded_to_hod'
-            """
-            params = [tuple(dept_ids)]
+            return DBJSONResponse(fetch_hod_leave_requests(cursor, token['user_id'], status))
+
+# ---- Leave workflow ----
+# Every status change goes through apply_leave_transitions(): an explicit transition table,
+# row locks on the affected requests, one executemany per statement and an audit row per change.
+# (state, action) -> (new state, who may perform it)
+LEAVE_TRANSITIONS = {
+    ('pending', 'approve'): ('approved', 'class_teacher'),
+    ('pending', 'reject'): ('rejected', 'class_teacher'),
+    ('pending', 'forward'): ('forwarded_to_hod', 'class_teacher'),
+    ('forwarded_to_hod', 'hod_approve'): ('hod_approved', 'hod'),
+    ('forwarded_to_hod', 'hod_reject'): ('hod_rejected', 'hod'),
+}
+LEAVE_ACTION_STAGE = {action: stage for (_, action), (_, stage) in LEAVE_TRANSITIONS.items()}
 
-            
-            if status and status != 'forwarded_to_hod':
-                query += " AND lr.status = %s"
-                params.append(status)
-            
-            query += " ORDER BY lr.created_at DESC"
-            cursor.execute(query, params)
-            return cursor.fetchall()
+# Columns each action stamps besides the status
+LEAVE_ACTION_UPDATES = {
+    'class_teacher': "teacher_remarks = %s, approved_by = %s, approved_at = NOW()",
+    'hod': "hod_remarks = %s, hod_approved_by = %s, hod_approved_at = NOW()",
+}
+
+SCHEMA_STATEMENTS.extend([
+    """
+    CREATE TABLE IF NOT EXISTS leave_request_events (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        leave_id INT NOT NULL,
+        from_status VARCHAR(30),
+        to_status VARCHAR(30) NOT NULL,
+        action VARCHAR(20) NOT NULL,
+        actor_id INT NOT NULL,
+        actor_name VARCHAR(255),
+        remarks TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_leave_events_leave (leave_id, created_at)
+    )
+    """,
+    "ALTER TABLE leave_requests ADD INDEX idx_leave_teacher_inbox (class_teacher_id, status, created_at)",
+    "ALTER TABLE leave_requests ADD INDEX idx_leave_department_inbox (department, status, created_at)",
+])
+
+LEAVE_ACTOR_TTL = 60
+_leave_actors = {}  # user_id -> (loaded_at, {'name', 'is_hod', 'departments'})
+LEAVE_INBOX_TTL = 30
+_leave_inbox_counts = {}  # ('teacher', id) | ('department', ids) -> (loaded_at, {status: count})
+
+def get_leave_actor(cursor, user_id: int) -> dict:
+    """Name and HOD scope of the approving user, cached briefly (assign_hod clears it)"""
+    cached = _leave_actors.get(user_id)
+    if cached and time.time() - cached[0] < LEAVE_ACTOR_TTL:
+        return cached[1]
+    cursor.execute("SELECT name, is_hod, hod_department FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    actor = {
+        "name": user['name'],
+        "is_hod": bool(user.get('is_hod')),
+        "departments": resolve_department_identifiers(user['hod_department'], cursor) if user.get('is_hod') else [],
+    }
+    _leave_actors[user_id] = (time.time(), actor)
+    return actor
+
+def invalidate_leave_inbox(class_teacher_id=None, department=None):
+    for key in list(_leave_inbox_counts):
+        if key == ('teacher', class_teacher_id) or (key[0] == 'department' and department in key[1]):
+            _leave_inbox_counts.pop(key, None)
+
+def apply_leave_transitions(conn, user_id: int, action: str, leave_ids: List[int], remarks: Optional[str]) -> List[dict]:
+    """Apply one action to many leave requests in a single transaction; returns a result per id"""
+    stage = LEAVE_ACTION_STAGE.get(action)
+    if not stage:
+        raise HTTPException(status_code=400, detail=f"Unknown action '{action}'")
+    leave_ids = list(dict.fromkeys(leave_ids))
+    if not leave_ids:
+        raise HTTPException(status_code=400, detail="No leave requests given")
+
+    with conn.cursor() as cursor:
+        actor = get_leave_actor(cursor, user_id)
+        if stage == 'hod' and not actor['is_hod']:
+            raise HTTPException(status_code=403, detail="Only HODs can approve")
+        cursor.execute("""
+            SELECT id, status, department, class_teacher_id FROM leave_requests WHERE id IN %s FOR UPDATE
+        """, (tuple(leave_ids),))
+        requests = {r['id']: r for r in cursor.fetchall()}
+
+        results, updates, events, rollup_deltas, touched = [], [], [], Counter(), []
+        for leave_id in leave_ids:
+            leave_req = requests.get(leave_id)
+            if leave_req and stage == 'class_teacher':
+                permitted = leave_req['class_teacher_id'] == user_id
+            else:
+                permitted = leave_req and leave_req['department'] in actor['departments']
+            if not permitted:
+                results.append({"id": leave_id, "status": "error", "code": 404, "detail": "Leave request not found"})
+                continue
+            transition = LEAVE_TRANSITIONS.get((leave_req['status'], action))
+            if not transition:
+                results.append({"id": leave_id, "status": "error", "code": 409,
+                                "detail": f"Cannot {action.replace('_', ' ')} a request that is {leave_req['status']}"})
+                continue
+            new_status = transition[0]
+            if action == 'forward':
+                updates.append((new_status, leave_id, leave_req['status']))
+            else:
+                updates.append((new_status, remarks, actor['name'], leave_id, leave_req['status']))
+            events.append((leave_id, leave_req['status'], new_status, action, user_id, actor['name'], remarks))
+            rollup_deltas.update(leave_status_deltas(leave_req['department'], leave_req['status'], new_status))
+            touched.append(leave_req)
+            results.append({"id": leave_id, "status": new_status})
+
+        if updates:
+            if action == 'forward':
+                cursor.executemany("UPDATE leave_requests SET status = %s WHERE id = %s AND status = %s", updates)
+            else:
+                cursor.executemany(f"""
+                    UPDATE leave_requests SET status = %s, {LEAVE_ACTION_UPDATES[stage]}
+                    WHERE id = %s AND status = %s
+                """, updates)
+            cursor.executemany("""
+                INSERT INTO leave_request_events (leave_id, from_status, to_status, action, actor_id, actor_name, remarks)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, events)
+            bump_rollups(cursor, rollup_deltas)
+        conn.commit()
+
+    for leave_req, result in zip(touched, (r for r in results if r['status'] != 'error')):
+        invalidate_leave_inbox(leave_req['class_teacher_id'], leave_req['department'])
+        if _leave_calendar:
+            _leave_calendar.set_status(leave_req['id'], result['status'])
+    return results
+
+def single_leave_transition(user_id: int, action: str, request_id: int, remarks: Optional[str]) -> dict:
+    with get_db_connection() as conn:
+        result = apply_leave_transitions(conn, user_id, action, [request_id], remarks)[0]
+    if result['status'] == 'error':
+        raise HTTPException(status_code=result['code'], detail=result['detail'])
+    return result
+
+def approval_action(status: str, prefix: str = '') -> str:
+    if status not in ('approved', 'rejected'):
+        raise HTTPException(status_code=400, detail="Status must be approved or rejected")
+    return prefix + ('approve' if status == 'approved' else 'reject')
+
+class LeaveBulkAction(BaseModel):
+    ids: List[int]
+    action: str  # approve, reject, forward, hod_approve, hod_reject
+    remarks: Optional[str] = None
 
 @api_router.put("/leave/{request_id}/approve")
 async def approve_leave_request(
@@ -1560,29 +4010,8 @@ async def approve_leave_request(
     token: dict = Depends(require_role('Teacher'))
 ):
     """Class teacher approves/rejects a leave request"""
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            # Verify this teacher owns this request
-            cursor.execute("""
-                SELECT * FROM leave_requests WHERE id = %s AND class_teacher_id = %s
-            """, (request_id, token['user_id']))
-            leave_req = cursor.fetchone()
-            
-            if not leave_req:
-                raise HTTPException(status_code=404, detail="Leave request not found")
-            
-            # Get teacher name for signature
-            cursor.execute("SELECT name FROM users WHERE id = %s", (token['user_id'],))
-            teacher = cursor.fetchone()
-            
-            cursor.execute("""
-                UPDATE leave_requests 
-                SET status = %s, teacher_remarks = %s, approved_by = %s, approved_at = NOW()
-                WHERE id = %s
-            """, (approval.status, approval.remarks, teacher['name'], request_id))
-            conn.commit()
-            
-            return {"message": f"Leave request {approval.status}"}
+    single_leave_transition(token['user_id'], approval_action(approval.status), request_id, approval.remarks)
+    return {"message": f"Leave request {approval.status}"}
 
 @api_router.put("/leave/{request_id}/forward-to-hod")
 async def forward_to_hod(
@@ -1590,13 +4019,8 @@ async def forward_to_hod(
     token: dict = Depends(require_role('Teacher'))
 ):
     """Class teacher forwards leave request to HOD for approval"""
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                UPDATE leave_requests SET status = 'forwarded_to_hod' WHERE id = %s AND class_teacher_id = %s
-            """, (request_id, token['user_id']))
-            conn.commit()
-            return {"message": "Leave request forwarded to HOD"}
+    single_leave_transition(token['user_id'], 'forward', request_id, None)
+    return {"message": "Leave request forwarded to HOD"}
 
 @api_router.put("/leave/{request_id}/hod-approve")
 async def hod_approve_leave(
@@ -1605,25 +4029,74 @@ async def hod_approve_leave(
     token: dict = Depends(verify_token)
 ):
     """HOD approves/rejects a forwarded leave request"""
+    single_leave_transition(token['user_id'], approval_action(approval.status, 'hod_'), request_id, approval.remarks)
+    return {"message": f"Leave request {approval.status} by HOD"}
+
+@api_router.post("/leave/bulk")
+async def bulk_leave_action(
+    bulk: LeaveBulkAction,
+    token: dict = Depends(require_role('Teacher'))
+):
+    """Approve, reject or forward many leave requests at once (class teacher or HOD)"""
+    with get_db_connection() as conn:
+        results = apply_leave_transitions(conn, token['user_id'], bulk.action, bulk.ids, bulk.remarks)
+    applied = sum(1 for r in results if r['status'] != 'error')
+    return {"message": f"{applied} of {len(results)} leave requests updated", "applied": applied, "results": results}
+
+@api_router.get("/leave/{request_id}/history")
+async def get_leave_history(
+    request_id: int,
+    token: dict = Depends(verify_token)
+):
+    """Audit trail of status changes for a leave request"""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # Verify user is HOD
-            cursor.execute("SELECT is_hod, hod_department, name FROM users WHERE id = %s", (token['user_id'],))
-            user = cursor.fetchone()
-            
-            if not user or not user.get('is_hod'):
-                raise HTTPException(status_code=403, detail="Only HODs can approve")
-            
-            dept_ids = resolve_department_identifiers(user['hod_department'], cursor)
+            cursor.execute("SELECT student_id, class_teacher_id, department FROM leave_requests WHERE id = %s", (request_id,))
+            leave_req = cursor.fetchone()
+            if not leave_req:
+                raise HTTPException(status_code=404, detail="Leave request not found")
+            if token['role'] != 'Admin' and token['user_id'] not in (leave_req['student_id'], leave_req['class_teacher_id']):
+                actor = get_leave_actor(cursor, token['user_id'])
+                if not (actor['is_hod'] and leave_req['department'] in actor['departments']):
+                    raise HTTPException(status_code=404, detail="Leave request not found")
             cursor.execute("""
-                UPDATE leave_requests 
-                SET status = %s, hod_remarks = %s, hod_approved_by = %s, hod_approved_at = NOW()
-                WHERE id = %s AND department IN %s
-            """, (f"hod_{approval.status}", approval.remarks, user['name'], request_id, tuple(dept_ids)))
+                SELECT from_status, to_status, action, actor_name, remarks, created_at
+                FROM leave_request_events WHERE leave_id = %s ORDER BY created_at, id
+            """, (request_id,))
+            return DBJSONResponse(cursor.fetchall())
+
+def fetch_leave_inbox_counts(cursor, user_id: int) -> dict:
+    actor = get_leave_actor(cursor, user_id)
+    keys = [('teacher', user_id)]
+    if actor['is_hod']:
+        keys.append(('department', tuple(sorted(actor['departments']))))
+    counts = {}
+    for key in keys:
+        cached = _leave_inbox_counts.get(key)
+        if not cached or time.time() - cached[0] >= LEAVE_INBOX_TTL:
+            column = 'class_teacher_id' if key[0] == 'teacher' else 'department'
+            value = key[1] if key[0] == 'teacher' else key[1] or ('',)
+            op = '=' if key[0] == 'teacher' else 'IN'
+            cursor.execute(f"""
+                SELECT status, COUNT(*) as count FROM leave_requests
+                WHERE {column} {op} %s GROUP BY status
+            """, (value,))
+            cached = (time.time(), {r['status']: r['count'] for r in cursor.fetchall()})
+            _leave_inbox_counts[key] = cached
+        counts[key[0]] = cached[1]
+    return {
+        "class_teacher": counts['teacher'],
+        "class_teacher_pending": counts['teacher'].get('pending', 0),
+        "hod": counts.get('department'),
+        "hod_pending": counts['department'].get('forwarded_to_hod', 0) if 'department' in counts else None,
+    }
 
-            conn.commit()
-            
-            return {"message": f"Leave request {approval.status} by HOD"}
+@api_router.get("/leave/inbox-counts")
+async def get_leave_inbox_counts(token: dict = Depends(require_role('Teacher'))):
+    """Per-status request counts for the class teacher inbox (and the HOD inbox, for HODs)"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            return fetch_leave_inbox_counts(cursor, token['user_id'])
 
 @api_router.get("/leave/{request_id}/pdf")
 async def get_leave_pdf_data(
@@ -1664,6 +4137,132 @@ async def get_leave_pdf_data(
                 "remarks": leave_req.get('teacher_remarks') or leave_req.get('hod_remarks')
             }
 
+# ---- Leave letter PDF ----
+# Rendered server-side by a minimal PDF writer (standard Helvetica fonts, no dependencies) and
+# cached by (request id, status, approval timestamps), so a re-decision produces a new letter.
+LEAVE_PDF_CACHE_SIZE = 256
+_leave_pdf_cache = OrderedDict()  # cache key -> PDF bytes
+PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT = 595, 842  # A4 in points
+
+def _pdf_text(value) -> str:
+    # The standard fonts use WinAnsiEncoding, i.e. cp1252
+    text = str(value if value is not None else '-').encode('cp1252', 'replace').decode('cp1252')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', '').replace('\n', ' ')
+
+def build_pdf(lines: List[tuple]) -> bytes:
+    """Single-page PDF from (x, y, font_size, bold, text) tuples"""
+    stream = []
+    for x, y, size, bold, text in lines:
+        stream.append(f"BT /{'F2' if bold else 'F1'} {size} Tf {x} {y} Td ({_pdf_text(text)}) Tj ET")
+    # Rule under the letterhead
+    stream.append(f"0.6 w 56 {PDF_PAGE_HEIGHT - 120} m {PDF_PAGE_WIDTH - 56} {PDF_PAGE_HEIGHT - 120} l S")
+    content = "\n".join(stream).encode('cp1252')
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] "
+        f"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def render_leave_letter(leave_req: dict) -> bytes:
+    hod_decided = leave_req['status'] == 'hod_approved'
+    approved_by = leave_req.get('hod_approved_by') if hod_decided else leave_req.get('approved_by')
+    approved_at = leave_req.get('hod_approved_at') if hod_decided else leave_req.get('approved_at')
+    remarks = leave_req.get('hod_remarks') if hod_decided else leave_req.get('teacher_remarks')
+
+    top = PDF_PAGE_HEIGHT - 72
+    lines = [
+        (56, top, 18, True, "JAIN (Deemed-to-be University)"),
+        (56, top - 22, 11, False, f"Department of {leave_req['department'] or '-'}"),
+        (56, top - 70, 15, True, "Leave Approval Letter"),
+        (56, top - 90, 10, False, f"Reference: LR-{leave_req['id']:06d}"),
+    ]
+    y = top - 125
+    fields = [
+        ("Student", leave_req['student_name']),
+        ("USN", leave_req['usn']),
+        ("Year / Section", f"{leave_req.get('year') or '-'} / {leave_req.get('section') or '-'}"),
+        ("Leave type", str(leave_req['leave_type'] or '-').title()),
+        ("From", leave_req['start_date']),
+        ("To", leave_req['end_date']),
+    ]
+    for label, value in fields:
+        lines.append((56, y, 11, True, label))
+        lines.append((180, y, 11, False, value))
+        y -= 20
+
+    y -= 10
+    lines.append((56, y, 11, True, "Reason"))
+    for chunk in textwrap.wrap(str(leave_req['reason'] or '-'), 85)[:12]:
+        y -= 16
+        lines.append((56, y, 11, False, chunk))
+
+    y -= 36
+    lines.append((56, y, 11, False, f"This leave has been approved by {approved_by or '-'}"
+                                    f"{' (HOD)' if hod_decided else ' (Class Teacher)'} on {approved_at or '-'}."))
+    if remarks:
+        for chunk in textwrap.wrap(f"Remarks: {remarks}", 85)[:6]:
+            y -= 16
+            lines.append((56, y, 11, False, chunk))
+    lines.append((56, 72, 9, False, "This is a system-generated letter from JAIN ERP and does not require a signature."))
+    return build_pdf(lines)
+
+@api_router.get("/leave/{request_id}/letter.pdf")
+async def download_leave_letter(
+    request: Request,
+    request_id: int,
+    token: dict = Depends(verify_token)
+):
+    """Approved leave letter as a PDF (rendered once per approval, then cached)"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT lr.*, u.name as student_name, u.idno as usn
+                FROM leave_requests lr
+                JOIN users u ON lr.student_id = u.id
+                WHERE lr.id = %s AND (lr.student_id = %s OR lr.class_teacher_id = %s)
+            """, (request_id, token['user_id'], token['user_id']))
+            leave_req = cursor.fetchone()
+
+    if not leave_req:
+        raise HTTPException(status_code=404, detail="Leave request not found")
+    if leave_req['status'] not in ['approved', 'hod_approved']:
+        raise HTTPException(status_code=400, detail="Leave request not yet approved")
+
+    cache_key = (request_id, leave_req['status'], leave_req.get('approved_at'), leave_req.get('hod_approved_at'))
+    etag = compute_etag('leave-letter', *cache_key)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'private, max-age=300',
+        'Content-Disposition': f'inline; filename="leave-letter-{request_id}.pdf"',
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    pdf = _leave_pdf_cache.get(cache_key)
+    if pdf is None:
+        pdf = render_leave_letter(leave_req)
+        _leave_pdf_cache[cache_key] = pdf
+        if len(_leave_pdf_cache) > LEAVE_PDF_CACHE_SIZE:
+            _leave_pdf_cache.popitem(last=False)
+    else:
+        _leave_pdf_cache.move_to_end(cache_key)
+    return Response(content=pdf, media_type="application/pdf", headers=headers)
+
 # ==========================================
 # HOD ROLE & DEPARTMENT OVERSIGHT
 # ==========================================
@@ -1685,14 +4284,24 @@ class AttendanceSessionStart(BaseModel):
 
 class AttendanceMark(BaseModel):
     otp: str
-    lat: float
-    lng: float
+    lat: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    lng: float = Field(ge=-180, le=180, allow_inf_nan=False)
 
 class ManualAttendance(BaseModel):
     session_id: int
     student_id: int
     status: str = 'present'
 
+class ManualAttendanceEntry(BaseModel):
+    student_id: int
+    status: str = 'present'
+
+class BulkManualAttendance(BaseModel):
+    session_id: int
+    marks: List[ManualAttendanceEntry]
+
+ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'excused')
+
 @api_router.post("/hod/assign")
 async def assign_hod(
     assignment: HODAssignment,
@@ -1718,6 +4327,7 @@ async def assign_hod(
                 WHERE id = %s AND role = 'Teacher'
             """, (assignment.department, assignment.teacher_id))
             conn.commit()
+            _leave_actors.clear()
             
             return {"message": f"HOD assigned for {assignment.department}"}
 
@@ -1730,7 +4340,7 @@ async def get_all_hods(token: dict = Depends(require_role('Admin'))):
                 SELECT id, name, email, hod_department 
                 FROM users WHERE is_hod = TRUE
             """)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.get("/hod/check")
 async def check_hod(
@@ -1748,70 +4358,54 @@ async def check_hod(
             return cursor.fetchone()
 
 
+def fetch_department_overview(cursor, user_id: int) -> dict:
+    # Verify user is HOD
+    cursor.execute("SELECT is_hod, hod_department FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    
+    if not user or not user.get('is_hod'):
+        raise HTTPException(status_code=403, detail="Only HODs can access this")
+    
+    dept = user['hod_department']
+    dept_ids = resolve_department_identifiers(dept, cursor)
+    dept_tuple = tuple(dept_ids)
+    
+    # Resolve full department name for display
+    display_name = dept
+    cursor.execute("SELECT name FROM departments WHERE code = %s OR name = %s", (dept, dept))
+    dept_res = cursor.fetchone()
+    if dept_res:
+        display_name = dept_res['name']
+
+    # Get counts
+    rollups = load_kpi_rollups(cursor.connection)
+    student_count = rollup_total(rollups, 'users:Student', dept_ids)
+    teacher_count = rollup_total(rollups, 'users:Teacher', dept_ids)
+    course_count = rollup_total(rollups, 'courses', dept_ids)
+    pending_leaves = rollup_total(rollups, 'leaves:forwarded_to_hod', dept_ids)
+    
+    # Get teachers list
+    cursor.execute("""
+        SELECT id, name, email FROM users 
+        WHERE department IN %s AND role = 'Teacher'
+    """, (dept_tuple,))
+    teachers = cursor.fetchall()
+    
+    return {
+        "department": display_name,
+        "student_count": student_count,
+        "teacher_count": teacher_count,
+        "course_count": course_count,
+        "pending_leaves": pending_leaves,
+        "teachers": teachers
+    }
+
 @api_router.get("/hod/department-overview")
 async def get_department_overview(token: dict = Depends(verify_token)):
     """HOD gets overview of their department"""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # Verify user is HOD
-            cursor.execute("SELECT is_hod, hod_department FROM users WHERE id = %s", (token['user_id'],))
-            user = cursor.fetchone()
-            
-            if not user or not user.get('is_hod'):
-                raise HTTPException(status_code=403, detail="Only HODs can access this")
-            
-            dept = user['hod_department']
-            dept_ids = resolve_department_identifiers(dept, cursor)
-            dept_tuple = tuple(dept_ids)
-            
-            # Resolve full department name for display
-            display_name = dept
-            cursor.execute("SELECT name FROM departments WHERE code = %s OR name = %s", (dept, dept))
-            dept_res = cursor.fetchone()
-            if dept_res:
-                display_name = dept_res['name']
-
-            # Get counts
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM users 
-                WHERE department IN %s AND role = 'Student'
-            """, (dept_tuple,))
-            student_count = cursor.fetchone()['count']
-            
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM users 
-                WHERE department IN %s AND role = 'Teacher'
-            """, (dept_tuple,))
-            teacher_count = cursor.fetchone()['count']
-            
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM courses 
-                WHERE department IN %s
-            """, (dept_tuple,))
-            course_count = cursor.fetchone()['count']
-            
-            # Get pending leave requests
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM leave_requests 
-                WHERE department IN %s AND status = 'forwarded_to_hod'
-            """, (dept_tuple,))
-            pending_leaves = cursor.fetchone()['count']
-            
-            # Get teachers list
-            cursor.execute("""
-                SELECT id, name, email FROM users 
-                WHERE department IN %s AND role = 'Teacher'
-            """, (dept_tuple,))
-            teachers = cursor.fetchall()
-            
-            return {
-                "department": display_name,
-                "student_count": student_count,
-                "teacher_count": teacher_count,
-                "course_count": course_count,
-                "pending_leaves": pending_leaves,
-                "teachers": teachers
-            }
+            return fetch_department_overview(cursor, token['user_id'])
 
 
 
@@ -1900,18 +4494,21 @@ async def summon_student(
             
             return {"message": f"Summon notification sent to {student['name']}"}
 
+def fetch_notifications(cursor, user_id: int) -> List[dict]:
+    cursor.execute("""
+        SELECT * FROM notifications 
+        WHERE user_id = %s 
+        ORDER BY created_at DESC
+        LIMIT 50
+    """, (user_id,))
+    return cursor.fetchall()
+
 @api_router.get("/notifications")
 async def get_notifications(token: dict = Depends(verify_token)):
     """Get notifications for the logged-in user"""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM notifications 
-                WHERE user_id = %s 
-                ORDER BY created_at DESC
-                LIMIT 50
-            """, (token['user_id'],))
-            return cursor.fetchall()
+            return DBJSONResponse(fetch_notifications(cursor, token['user_id']))
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(
@@ -1932,15 +4529,189 @@ async def mark_notification_read(
 # GEO-FENCED OTP ATTENDANCE
 # ==========================================
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate Haversine distance between two points in meters"""
-    R = 6371000 # Earth radius in meters
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# Expected students per session, snapshotted when the session starts so absentees and
+# per-session counts come from the roster instead of re-deriving enrolment from users.
+SCHEMA_STATEMENTS.append("""
+    CREATE TABLE IF NOT EXISTS attendance_rosters (
+        session_id INT NOT NULL,
+        student_id INT NOT NULL,
+        PRIMARY KEY (session_id, student_id),
+        INDEX idx_rosters_student (student_id, session_id)
+    )
+""")
+
+def get_session_summary(cursor, session_id: int, closed: bool) -> dict:
+    """Roster-based counts for a session; unmarked students count as absent once it has closed"""
+    cursor.execute("""
+        SELECT COUNT(*) as roster_size,
+               COALESCE(SUM(l.status IN ('present', 'late')), 0) as present,
+               COALESCE(SUM(l.status = 'absent'), 0) as marked_absent,
+               COALESCE(SUM(l.is_manual), 0) as manual,
+               COALESCE(SUM(l.id IS NULL), 0) as unmarked
+        FROM attendance_rosters r
+        LEFT JOIN attendance_logs l ON l.session_id = r.session_id AND l.student_id = r.student_id
+        WHERE r.session_id = %s
+    """, (session_id,))
+    counts = {k: int(v) for k, v in cursor.fetchone().items()}
+    cursor.execute("""
+        SELECT COUNT(*) as count
+        FROM attendance_logs l
+        LEFT JOIN attendance_rosters r ON r.session_id = l.session_id AND r.student_id = l.student_id
+        WHERE l.session_id = %s AND r.student_id IS NULL
+    """, (session_id,))
+    counts['outside_roster'] = cursor.fetchone()['count']
+    counts['absent'] = counts['marked_absent'] + (counts['unmarked'] if closed else 0)
+    counts['closed'] = closed
+    return counts
+
+def get_session_absentees(cursor, session_id: int) -> List[dict]:
+    """Roster students with no log, or marked absent"""
+    cursor.execute("""
+        SELECT u.id as student_id, u.name as student_name, u.idno as usn, l.status
+        FROM attendance_rosters r
+        JOIN users u ON u.id = r.student_id
+        LEFT JOIN attendance_logs l ON l.session_id = r.session_id AND l.student_id = r.student_id
+        WHERE r.session_id = %s AND (l.id IS NULL OR l.status = 'absent')
+        ORDER BY u.idno
+    """, (session_id,))
+    return cursor.fetchall()
+
+# ---- Session sweeper ----
+# Expired sessions are moved to attendance_sessions_archive once they are older than
+# SESSION_ARCHIVE_AFTER_HOURS (about a semester), so attendance_sessions holds the current
+# term. Current-term queries read attendance_sessions directly; the attendance_sessions_all
+# view (a UNION ALL, which MySQL materializes rather than merging) is only used when a caller
+# asks for history with include_archived, and single-session lookups try the live table first.
+# active_otps holds one row per live OTP; its primary key guarantees no two active sessions
+# share a code, and /attendance/mark resolves the OTP with a single key lookup.
+SESSION_COLUMNS = "id, teacher_id, course_id, otp, lat, lng, radius_meters, expires_at, created_at"
+SCHEMA_STATEMENTS.extend([
+    """
+    CREATE TABLE IF NOT EXISTS attendance_sessions_archive (
+        id INT PRIMARY KEY,
+        teacher_id INT NOT NULL,
+        course_id INT NOT NULL,
+        otp VARCHAR(6) NOT NULL,
+        lat DECIMAL(10, 7),
+        lng DECIMAL(10, 7),
+        radius_meters INT DEFAULT 20,
+        expires_at DATETIME NOT NULL,
+        created_at DATETIME,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_sessions_archive_course (course_id),
+        INDEX idx_sessions_archive_teacher (teacher_id)
+    )
+    """,
+    f"""
+    CREATE OR REPLACE VIEW attendance_sessions_all AS
+        SELECT {SESSION_COLUMNS} FROM attendance_sessions
+        UNION ALL
+        SELECT {SESSION_COLUMNS} FROM attendance_sessions_archive
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS active_otps (
+        otp VARCHAR(6) PRIMARY KEY,
+        session_id INT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        INDEX idx_active_otps_expires (expires_at)
+    )
+    """,
+])
+
+SESSION_ARCHIVE_AFTER_HOURS = int(os.environ.get('SESSION_ARCHIVE_AFTER_HOURS', 24 * 180))
+SESSION_SWEEP_SECONDS = int(os.environ.get('SESSION_SWEEP_SECONDS', 300))  # 0 disables the thread
+SESSION_SWEEP_BATCH = 1000
+SWEEPER_STATS = {'runs': 0, 'archived': 0, 'otps_released': 0, 'last_run': None, 'last_result': None}
+
+def claim_otp(cursor, session_id: int, expires_at: datetime) -> str:
+    """Reserve a 6-digit OTP that no other active session is using"""
+    for _ in range(20):
+        otp = ''.join(random.choices(string.digits, k=6))
+        # A stale claim the sweeper has not reached yet can be taken over
+        cursor.execute("DELETE FROM active_otps WHERE otp = %s AND expires_at <= %s", (otp, datetime.now()))
+        try:
+            cursor.execute("INSERT INTO active_otps (otp, session_id, expires_at) VALUES (%s, %s, %s)",
+                           (otp, session_id, expires_at))
+            return otp
+        except pymysql.err.IntegrityError:
+            continue
+    raise HTTPException(status_code=503, detail="Could not allocate a unique OTP, please retry")
+
+def sweep_attendance_sessions() -> dict:
+    """Release expired OTPs and archive old sessions in batches; returns row counts for the run"""
+    started = time.perf_counter()
+    now = datetime.now()
+    cutoff = now - timedelta(hours=SESSION_ARCHIVE_AFTER_HOURS)
+    archived = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM active_otps WHERE expires_at <= %s", (now,))
+            otps_released = cursor.rowcount
+            conn.commit()
+            while True:
+                cursor.execute("""
+                    SELECT id FROM attendance_sessions WHERE expires_at < %s ORDER BY id LIMIT %s FOR UPDATE
+                """, (cutoff, SESSION_SWEEP_BATCH))
+                ids = tuple(r['id'] for r in cursor.fetchall())
+                if not ids:
+                    break
+                cursor.execute(f"""
+                    INSERT IGNORE INTO attendance_sessions_archive ({SESSION_COLUMNS})
+                    SELECT {SESSION_COLUMNS} FROM attendance_sessions WHERE id IN %s
+                """, (ids,))
+                cursor.execute("DELETE FROM attendance_sessions WHERE id IN %s", (ids,))
+                conn.commit()
+                archived += len(ids)
+                if len(ids) < SESSION_SWEEP_BATCH:
+                    break
+
+    result = {"archived": archived, "otps_released": otps_released,
+              "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+    with _metrics_lock:
+        SWEEPER_STATS['runs'] += 1
+        SWEEPER_STATS['archived'] += archived
+        SWEEPER_STATS['otps_released'] += otps_released
+        SWEEPER_STATS['last_run'] = now.isoformat()
+        SWEEPER_STATS['last_result'] = result
+    logger.info(f"Session sweep: archived {archived} sessions, released {otps_released} OTPs in {result['duration_ms']}ms")
+    return result
+
+def _session_sweeper_loop():
+    while True:
+        time.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            sweep_attendance_sessions()
+        except Exception as e:
+            logger.error(f"Session sweep failed: {e}")
+
+@app.on_event("startup")
+def start_session_sweeper():
+    # Long-running servers only; serverless deployments call POST /admin/sweep-sessions from a cron
+    if SESSION_SWEEP_SECONDS > 0:
+        threading.Thread(target=_session_sweeper_loop, name="session-sweeper", daemon=True).start()
+
+@api_router.post("/admin/sweep-sessions")
+async def run_session_sweep(token: dict = Depends(require_role('Admin'))):
+    """Run the expired-session sweeper now and report what it moved"""
+    return sweep_attendance_sessions()
+
+def sessions_table(include_archived: bool) -> str:
+    return "attendance_sessions_all" if include_archived else "attendance_sessions"
+
+def find_session(cursor, session_id: int, columns: str) -> Optional[dict]:
+    """Primary-key lookup in the live table, then the archive (never through the view)"""
+    for table in ("attendance_sessions", "attendance_sessions_archive"):
+        cursor.execute(f"SELECT {columns} FROM {table} WHERE id = %s", (session_id,))
+        session = cursor.fetchone()
+        if session:
+            return session
+    return None
+
+def get_owned_session(cursor, session_id: int, teacher_id: int) -> dict:
+    session = find_session(cursor, session_id, "id, teacher_id, expires_at")
+    if not session or session['teacher_id'] != teacher_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
 
 @api_router.post("/attendance/start-session")
 async def start_attendance_session(
@@ -1948,7 +4719,6 @@ async def start_attendance_session(
     token: dict = Depends(require_role('Teacher'))
 ):
     """Teacher starts an attendance session"""
-    otp = ''.join(random.choices(string.digits, k=6))
     # 60 seconds expiry by default
     expires_at = datetime.now() + timedelta(seconds=60)
     
@@ -1963,86 +4733,284 @@ async def start_attendance_session(
             cursor.execute("""
                 INSERT INTO attendance_sessions 
                 (teacher_id, course_id, otp, lat, lng, radius_meters, expires_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (token['user_id'], session.course_id, otp, session.lat, session.lng, session.radius, expires_at))
+                VALUES (%s, %s, '', %s, %s, %s, %s)
+            """, (token['user_id'], session.course_id, session.lat, session.lng, session.radius, expires_at))
             session_id = cursor.lastrowid
+            otp = claim_otp(cursor, session_id, expires_at)
+            cursor.execute("UPDATE attendance_sessions SET otp = %s WHERE id = %s", (otp, session_id))
+            cursor.execute("""
+                INSERT INTO attendance_rosters (session_id, student_id)
+                SELECT %s, id FROM users WHERE role = 'Student' AND department = %s AND year = %s
+            """, (session_id, course['department'], course['year']))
+            roster_size = cursor.rowcount
             conn.commit()
             
             return {
                 "session_id": session_id, 
                 "otp": otp, 
                 "expires_at": str(expires_at),
-                "course_name": course['name']
+                "course_name": course['name'],
+                "roster_size": roster_size
             }
 
+# ---- Geofence ----
+# /attendance/mark requests are micro-batched: while one batch is being written, new marks
+# queue up and are resolved together (one OTP lookup, one vectorized distance check, one
+# executemany per table). Every attempt that resolves to a session is stored with its raw
+# coordinates so location clusters can be analysed afterwards.
+SCHEMA_STATEMENTS.append("""
+    CREATE TABLE IF NOT EXISTS attendance_mark_attempts (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        session_id INT NOT NULL,
+        student_id INT NOT NULL,
+        lat DECIMAL(10, 7) NOT NULL,
+        lng DECIMAL(10, 7) NOT NULL,
+        distance_m INT,
+        accepted BOOLEAN DEFAULT FALSE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_mark_attempts_session (session_id),
+        INDEX idx_mark_attempts_student (student_id, created_at)
+    )
+""")
+
+EARTH_RADIUS_M = 6371000
+MARK_BATCH_SIZE = int(os.environ.get('MARK_BATCH_SIZE', 64))
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Vectorized Haversine distance in meters; accepts scalars or NumPy arrays"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.subtract(lng2, lng1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def resolve_mark_batch(cursor, marks: List[tuple]) -> list:
+    """Resolve a batch of (student_id, AttendanceMark); returns a result dict or HTTPException per mark"""
+    now = datetime.now()
+    results = [None] * len(marks)
+    cursor.execute("""
+        SELECT o.otp, s.id, s.teacher_id, s.lat, s.lng, s.radius_meters, c.name as course_name
+        FROM active_otps o
+        JOIN attendance_sessions s ON o.session_id = s.id
+        JOIN courses c ON s.course_id = c.id
+        WHERE o.otp IN %s AND o.expires_at > %s AND s.expires_at > %s
+    """, (tuple({m.otp for _, m in marks}), now, now))
+    sessions = {r['otp']: r for r in cursor.fetchall()}
+
+    matched = [i for i, (_, m) in enumerate(marks) if m.otp in sessions]
+    for i, _ in enumerate(marks):
+        if marks[i][1].otp not in sessions:
+            results[i] = HTTPException(status_code=400, detail="Invalid or expired OTP")
+    if not matched:
+        return results
+
+    rows = [sessions[marks[i][1].otp] for i in matched]
+    dist = haversine_m(
+        np.array([marks[i][1].lat for i in matched], dtype=np.float64),
+        np.array([marks[i][1].lng for i in matched], dtype=np.float64),
+        np.array([float(r['lat']) for r in rows], dtype=np.float64),
+        np.array([float(r['lng']) for r in rows], dtype=np.float64),
+    )
+    in_range = dist <= np.array([r['radius_meters'] for r in rows], dtype=np.float64)
+
+    cursor.execute("""
+        SELECT session_id, student_id FROM attendance_logs WHERE session_id IN %s AND student_id IN %s
+    """, (tuple({r['id'] for r in rows}), tuple({marks[i][0] for i in matched})))
+    already = {(r['session_id'], r['student_id']) for r in cursor.fetchall()}
+
+    attempts, logs, violations = [], [], []
+    for k, i in enumerate(matched):
+        student_id, mark = marks[i]
+        session = rows[k]
+        meters = int(dist[k])
+        attempts.append((session['id'], student_id, mark.lat, mark.lng, meters, bool(in_range[k])))
+        if not in_range[k]:
+            # Record failed attempt notification for teacher
+            violations.append((session['teacher_id'], 'Radius Violation',
+                               f"Student {student_id} attempted to mark attendance for {session['course_name']} "
+                               f"from {meters}m away (Radius: {session['radius_meters']}m)", 'warning'))
+            results[i] = HTTPException(status_code=400, detail=f"Out of range: {meters}m. Authorized radius is {session['radius_meters']}m.")
+        elif (session['id'], student_id) in already:
+            results[i] = HTTPException(status_code=400, detail="Attendance already marked for this session")
+        else:
+            already.add((session['id'], student_id))
+            logs.append((session['id'], student_id))
+            results[i] = {"message": "Attendance marked successfully"}
+
+    cursor.executemany("""
+        INSERT INTO attendance_mark_attempts (session_id, student_id, lat, lng, distance_m, accepted)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, attempts)
+    if violations:
+        cursor.executemany("""
+            INSERT INTO notifications (user_id, title, message, type) VALUES (%s, %s, %s, %s)
+        """, violations)
+    if logs:
+        cursor.executemany("""
+            INSERT IGNORE INTO attendance_logs (session_id, student_id, status, marked_at)
+            VALUES (%s, %s, 'present', NOW())
+        """, logs)
+    return results
+
+def process_mark_batch(marks: List[tuple]) -> list:
+    """Runs resolve_mark_batch in one transaction; a mark that breaks the batch fails on its own"""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                results = resolve_mark_batch(cursor, marks)
+                conn.commit()
+        return results
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+        # The database itself is unreachable: splitting the batch would not help
+        logger.error(f"Attendance mark batch failed: {e}")
+        return [HTTPException(status_code=500, detail="Could not record attendance")] * len(marks)
+    except Exception as e:
+        if len(marks) == 1:
+            logger.error(f"Attendance mark failed for student {marks[0][0]}: {e}")
+            return [HTTPException(status_code=500, detail="Could not record attendance")]
+        # Nothing was committed, so each mark can be retried alone
+        return [process_mark_batch([item])[0] for item in marks]
+
+class MarkBatcher:
+    """Coalesces concurrent marks: the first caller runs a batch, later arrivals join the next one.
+
+    Adds no wait when idle; under a rush each DB round-trip serves up to MARK_BATCH_SIZE students.
+    State is kept per event loop.
+    """
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._states = weakref.WeakKeyDictionary()
+
+    async def submit(self, student_id: int, mark: AttendanceMark):
+        loop = asyncio.get_running_loop()
+        state = self._states.setdefault(loop, {'pending': [], 'running': False})
+        future = loop.create_future()
+        state['pending'].append(((student_id, mark), future))
+        if not state['running']:
+            state['running'] = True
+            loop.create_task(self._drain(state))
+        result = await future
+        if isinstance(result, HTTPException):
+            raise result
+        return result
+
+    async def _drain(self, state):
+        try:
+            while state['pending']:
+                batch = state['pending'][:self.batch_size]
+                del state['pending'][:self.batch_size]
+                try:
+                    results = await run_in_threadpool(process_mark_batch, [item for item, _ in batch])
+                except Exception as e:
+                    logger.error(f"Attendance mark batch failed: {e}")
+                    results = [HTTPException(status_code=500, detail="Could not record attendance")] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            state['running'] = False
+
+mark_batcher = MarkBatcher(MARK_BATCH_SIZE)
+
 @api_router.post("/attendance/mark")
 async def mark_attendance(
     mark: AttendanceMark,
     token: dict = Depends(require_role('Student'))
 ):
     """Student marks their attendance with OTP and Geo-fencing"""
-    now = datetime.now()
+    return await mark_batcher.submit(token['user_id'], mark)
+
+@api_router.get("/attendance/session/{session_id}/location-clusters")
+async def get_location_clusters(
+    session_id: int,
+    precision_m: float = 1.0,
+    min_students: int = 3,
+    token: dict = Depends(require_role('Admin', 'Teacher'))
+):
+    """Groups of students who marked from the same spot, e.g. a shared spoofed GPS location.
+
+    Attempts are snapped to a `precision_m` grid around the classroom; clusters with at least
+    `min_students` distinct students are returned, far-away and zero-spread ones first.
+    """
+    if precision_m <= 0:
+        raise HTTPException(status_code=400, detail="precision_m must be positive")
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            # Find active session by OTP
+            session = find_session(cursor, session_id, "teacher_id, lat, lng, radius_meters")
+            if not session or (token['role'] == 'Teacher' and session['teacher_id'] != token['user_id']):
+                raise HTTPException(status_code=404, detail="Session not found")
             cursor.execute("""
-                SELECT s.*, c.name as course_name 
-                FROM attendance_sessions s
-                JOIN courses c ON s.course_id = c.id
-                WHERE s.otp = %s AND s.expires_at > %s
-            """, (mark.otp, now))
-            session = cursor.fetchone()
-            
-            if not session:
-                raise HTTPException(status_code=400, detail="Invalid or expired OTP")
-            
-            # Verify distance
-            dist = calculate_distance(mark.lat, mark.lng, float(session['lat']), float(session['lng']))
-            if dist > session['radius_meters']:
-                # Record failed attempt notification for teacher
-                cursor.execute("""
-                    INSERT INTO notifications (user_id, title, message, type)
-                    VALUES (%s, 'Radius Violation', 'Student %s attempted to mark attendance for %s from %dm away (Radius: %dm)', 'warning')
-                """, (session['teacher_id'], token['user_id'], session['course_name'], int(dist), session['radius_meters']))
-                conn.commit()
-                raise HTTPException(status_code=400, detail=f"Out of range: {int(dist)}m. Authorized radius is {session['radius_meters']}m.")
-            
-            # Mark attendance
-            try:
-                cursor.execute("""
-                    INSERT INTO attendance_logs (session_id, student_id, status, marked_at)
-                    VALUES (%s, %s, 'present', NOW())
-                """, (session['id'], token['user_id']))
-                conn.commit()
-            except pymysql.err.IntegrityError:
-                raise HTTPException(status_code=400, detail="Attendance already marked for this session")
-            
-            return {"message": "Attendance marked successfully"}
+                SELECT student_id, lat, lng FROM attendance_mark_attempts WHERE session_id = %s
+            """, (session_id,))
+            attempts = cursor.fetchall()
+
+    response = {"session_id": session_id, "attempts": len(attempts), "clusters": []}
+    if not attempts:
+        return response
+
+    lat0, lng0 = float(session['lat']), float(session['lng'])
+    lat = np.array([float(a['lat']) for a in attempts])
+    lng = np.array([float(a['lng']) for a in attempts])
+    students = np.array([a['student_id'] for a in attempts], dtype=np.int64)
+
+    # Local equirectangular projection (meters from the session centre) is exact enough at campus scale
+    y = np.radians(lat - lat0) * EARTH_RADIUS_M
+    x = np.radians(lng - lng0) * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+    cells = np.floor(np.column_stack((x, y)) / precision_m).astype(np.int64)
+    _, cluster, attempt_counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cluster = cluster.ravel()
+
+    pairs = np.unique(np.column_stack((cluster, students)), axis=0)
+    student_counts = np.bincount(pairs[:, 0], minlength=attempt_counts.size)
+    centre_lat = np.bincount(cluster, weights=lat) / attempt_counts
+    centre_lng = np.bincount(cluster, weights=lng) / attempt_counts
+    mean_x = np.bincount(cluster, weights=x) / attempt_counts
+    mean_y = np.bincount(cluster, weights=y) / attempt_counts
+    spread = np.sqrt(np.bincount(cluster, weights=(x - mean_x[cluster]) ** 2 + (y - mean_y[cluster]) ** 2) / attempt_counts)
+    distance = haversine_m(centre_lat, centre_lng, lat0, lng0)
+
+    flagged = np.nonzero(student_counts >= min_students)[0]
+    clusters = [{
+        "lat": round(float(centre_lat[c]), 7),
+        "lng": round(float(centre_lng[c]), 7),
+        "students": int(student_counts[c]),
+        "attempts": int(attempt_counts[c]),
+        "distance_m": int(distance[c]),
+        "spread_m": round(float(spread[c]), 2),
+        "far_away": bool(distance[c] > session['radius_meters']),
+        "identical": bool(spread[c] == 0),
+        "student_ids": pairs[pairs[:, 0] == c, 1].tolist(),
+    } for c in flagged]
+    clusters.sort(key=lambda c: (not c['far_away'], not c['identical'], -c['students']))
+    response["clusters"] = clusters
+    return response
+
+def fetch_active_sessions(cursor, token: dict) -> List[dict]:
+    now = datetime.now()
+    if token['role'] == 'Teacher':
+        cursor.execute("""
+            SELECT s.*, c.name as course_name, c.code as course_code
+            FROM attendance_sessions s
+            JOIN courses c ON s.course_id = c.id
+            WHERE s.teacher_id = %s AND s.expires_at > %s
+        """, (token['user_id'], now))
+    else:
+        # Sessions whose roster includes this student
+        cursor.execute("""
+            SELECT s.id, s.course_id, c.name as course_name, c.code as course_code, s.expires_at, s.radius_meters
+            FROM attendance_rosters r
+            JOIN attendance_sessions s ON r.session_id = s.id
+            JOIN courses c ON s.course_id = c.id
+            WHERE r.student_id = %s AND s.expires_at > %s
+        """, (token['user_id'], now))
+    return cursor.fetchall()
 
 @api_router.get("/attendance/active-sessions")
 async def get_active_sessions(token: dict = Depends(verify_token)):
     """Get active sessions (Teacher sees their own, Student sees their relevant ones)"""
-    now = datetime.now()
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            if token['role'] == 'Teacher':
-                cursor.execute("""
-                    SELECT s.*, c.name as course_name, c.code as course_code
-                    FROM attendance_sessions s
-                    JOIN courses c ON s.course_id = c.id
-                    WHERE s.teacher_id = %s AND s.expires_at > %s
-                """, (token['user_id'], now))
-            else:
-                # Get student's department/year
-                cursor.execute("SELECT department, year FROM users WHERE id = %s", (token['user_id'],))
-                student = cursor.fetchone()
-                cursor.execute("""
-                    SELECT s.id, s.course_id, c.name as course_name, c.code as course_code, s.expires_at, s.radius_meters
-                    FROM attendance_sessions s
-                    JOIN courses c ON s.course_id = c.id
-                    WHERE c.department = %s AND c.year = %s AND s.expires_at > %s
-                """, (student['department'], student['year'], now))
-            return cursor.fetchall()
+            return DBJSONResponse(fetch_active_sessions(cursor, token))
 
 @api_router.get("/attendance/session/{session_id}/logs")
 async def get_session_logs(
@@ -2058,7 +5026,41 @@ async def get_session_logs(
                 JOIN users u ON l.student_id = u.id
                 WHERE l.session_id = %s
             """, (session_id,))
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
+
+@api_router.get("/attendance/session/{session_id}/summary")
+async def get_attendance_session_summary(
+    session_id: int,
+    include_absentees: bool = False,
+    token: dict = Depends(require_role('Teacher'))
+):
+    """Present / absent / manual counts for a session, from its roster snapshot"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            session = get_owned_session(cursor, session_id, token['user_id'])
+            summary = get_session_summary(cursor, session_id, closed=session['expires_at'] <= datetime.now())
+            if include_absentees:
+                summary['absentees'] = get_session_absentees(cursor, session_id)
+            return DBJSONResponse(summary)
+
+@api_router.post("/attendance/session/{session_id}/close")
+async def close_attendance_session(
+    session_id: int,
+    token: dict = Depends(require_role('Teacher'))
+):
+    """Teacher ends a session early; returns the final counts and the absentee list"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            session = get_owned_session(cursor, session_id, token['user_id'])
+            # Expiry is always compared against the app clock, so close with it too (not the DB's NOW())
+            now = datetime.now()
+            if session['expires_at'] > now:
+                cursor.execute("UPDATE attendance_sessions SET expires_at = %s WHERE id = %s", (now, session_id))
+                cursor.execute("DELETE FROM active_otps WHERE session_id = %s", (session_id,))
+                conn.commit()
+            summary = get_session_summary(cursor, session_id, closed=True)
+            summary['absentees'] = get_session_absentees(cursor, session_id)
+            return DBJSONResponse(summary)
 
 @api_router.post("/attendance/manual-mark")
 async def manual_mark_attendance(
@@ -2076,59 +5078,90 @@ async def manual_mark_attendance(
             conn.commit()
             return {"message": "Attendance record updated"}
 
+@api_router.post("/attendance/manual-mark/bulk")
+async def bulk_manual_mark_attendance(
+    bulk: BulkManualAttendance,
+    token: dict = Depends(require_role('Teacher'))
+):
+    """Teacher marks many students in one session at once (e.g. after a GPS failure)"""
+    if not bulk.marks:
+        raise HTTPException(status_code=400, detail="No students to mark")
+    invalid = sorted({m.status for m in bulk.marks} - set(ATTENDANCE_STATUSES))
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid status {invalid}; expected one of {list(ATTENDANCE_STATUSES)}")
+
+    # Last entry wins if a student is listed twice
+    statuses = {m.student_id: m.status for m in bulk.marks}
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM attendance_sessions WHERE id = %s AND teacher_id = %s",
+                           (bulk.session_id, token['user_id']))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=403, detail="Unauthorized for this session")
+
+            cursor.executemany("""
+                INSERT INTO attendance_logs (session_id, student_id, status, is_manual, manual_by, marked_at)
+                VALUES (%s, %s, %s, TRUE, %s, NOW())
+                ON DUPLICATE KEY UPDATE status = VALUES(status), is_manual = TRUE, manual_by = VALUES(manual_by)
+            """, [(bulk.session_id, student_id, status, token['user_id']) for student_id, status in statuses.items()])
+            conn.commit()
+            return {"message": f"Attendance updated for {len(statuses)} students", "updated": len(statuses)}
+
 @api_router.get("/attendance/my-stats")
-async def get_my_attendance_stats(token: dict = Depends(require_role('Student'))):
-    """Student views their attendance summary by course"""
+async def get_my_attendance_stats(include_archived: bool = False, token: dict = Depends(require_role('Student'))):
+    """Student views their attendance summary by course (current term unless include_archived)"""
+    sessions = sessions_table(include_archived)
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT c.id as course_id, c.name as course_name, c.code as course_code,
                        COUNT(DISTINCT s.id) as total_sessions,
-                       COUNT(DISTINCT l.id) as attended_sessions
+                       COUNT(DISTINCT CASE WHEN l.status != 'absent' THEN l.id END) as attended_sessions
                 FROM courses c
-                LEFT JOIN attendance_sessions s ON c.id = s.course_id
+                LEFT JOIN {sessions} s ON c.id = s.course_id
                 LEFT JOIN attendance_logs l ON s.id = l.session_id AND l.student_id = %s
                 WHERE c.department = (SELECT department FROM users WHERE id = %s)
                   AND c.year = (SELECT year FROM users WHERE id = %s)
                 GROUP BY c.id
             """, (token['user_id'], token['user_id'], token['user_id']))
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.get("/attendance/all")
-async def get_all_attendance(token: dict = Depends(verify_token)):
-    """Generic attendance history"""
+async def get_all_attendance(include_archived: bool = False, token: dict = Depends(verify_token)):
+    """Generic attendance history (current term unless include_archived)"""
+    sessions = sessions_table(include_archived)
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             if token['role'] == 'Teacher':
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT l.*, u.name as student_name, u.idno as usn, c.name as course_name, l.marked_at as date
                     FROM attendance_logs l
                     JOIN users u ON l.student_id = u.id
-                    JOIN attendance_sessions s ON l.session_id = s.id
+                    JOIN {sessions} s ON l.session_id = s.id
                     JOIN courses c ON s.course_id = c.id
                     WHERE s.teacher_id = %s
                     ORDER BY l.marked_at DESC
                 """, (token['user_id'],))
             elif token['role'] == 'Student':
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT l.*, c.name as course_name, c.code as course_code, l.marked_at as date
                     FROM attendance_logs l
-                    JOIN attendance_sessions s ON l.session_id = s.id
+                    JOIN {sessions} s ON l.session_id = s.id
                     JOIN courses c ON s.course_id = c.id
                     WHERE l.student_id = %s
                     ORDER BY l.marked_at DESC
                 """, (token['user_id'],))
             else: # Admin
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT l.*, u.name as student_name, u.idno as usn, c.name as course_name, l.marked_at as date
                     FROM attendance_logs l
                     JOIN users u ON l.student_id = u.id
-                    JOIN attendance_sessions s ON l.session_id = s.id
+                    JOIN {sessions} s ON l.session_id = s.id
                     JOIN courses c ON s.course_id = c.id
                     ORDER BY l.marked_at DESC
                     LIMIT 500
                 """)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 # ==========================================
 # EXAM HALL LOCATOR
@@ -2167,6 +5200,7 @@ async def create_exam(
             """, (exam.name, exam.course_id, exam.exam_date, exam.start_time, 
                   exam.end_time, exam.is_visible))
             conn.commit()
+            bump_table_version('exam_schedules')
             return {"message": "Exam created", "id": cursor.lastrowid}
 
 @api_router.get("/exams")
@@ -2182,7 +5216,7 @@ async def get_exams(
                 LEFT JOIN courses c ON e.course_id = c.id
                 ORDER BY e.exam_date DESC
             """)
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.put("/exams/{exam_id}/toggle-visibility")
 async def toggle_exam_visibility(
@@ -2196,6 +5230,7 @@ async def toggle_exam_visibility(
                 UPDATE exam_schedules SET is_visible = NOT is_visible WHERE id = %s
             """, (exam_id,))
             conn.commit()
+            bump_table_version('exam_schedules')
             return {"message": "Visibility toggled"}
 
 @api_router.post("/exams/halls")
@@ -2219,7 +5254,7 @@ async def get_exam_halls(token: dict = Depends(require_role('Admin'))):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM exam_halls ORDER BY building, floor, name")
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.post("/exams/{exam_id}/generate-seating")
 async def generate_seating_arrangement(
@@ -2328,7 +5363,7 @@ async def get_exam_seating(
                 WHERE es.exam_id = %s
                 ORDER BY eh.building, eh.floor, es.seat_number
             """, (exam_id,))
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
 
 @api_router.get("/exams/my-seat")
 async def get_my_exam_seat(token: dict = Depends(verify_token)):
@@ -2347,25 +5382,231 @@ async def get_my_exam_seat(token: dict = Depends(verify_token)):
                   AND e.exam_date >= CURDATE()
                 ORDER BY e.exam_date, e.start_time
             """, (token['user_id'],))
-            return cursor.fetchall()
+            return DBJSONResponse(cursor.fetchall())
+
+def fetch_upcoming_exams(cursor) -> List[dict]:
+    cursor.execute("""
+        SELECT e.*, c.name as course_name, c.code as course_code
+        FROM exam_schedules e
+        JOIN courses c ON e.course_id = c.id
+        WHERE e.is_visible = TRUE AND e.exam_date >= CURDATE()
+        ORDER BY e.exam_date, e.start_time
+    """)
+    return cursor.fetchall()
 
 @api_router.get("/exams/upcoming")
-async def get_upcoming_exams(token: dict = Depends(verify_token)):
+async def get_upcoming_exams(request: Request, token: dict = Depends(verify_token)):
     """Get upcoming visible exams for students"""
+    # CURDATE() in the query: the date is part of the ETag
+    etag = table_etag(('exam_schedules', 'courses'), datetime.now().date())
+    if etag_matches(request, etag):
+        return not_modified(etag)
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT e.*, c.name as course_name, c.code as course_code
-                FROM exam_schedules e
-                JOIN courses c ON e.course_id = c.id
-                WHERE e.is_visible = TRUE AND e.exam_date >= CURDATE()
-                ORDER BY e.exam_date, e.start_time
-            """)
-            return cursor.fetchall()
+            return conditional_response(request, etag, fetch_upcoming_exams(cursor))
+
+# ==========================================
+# BOOTSTRAP
+# ==========================================
+
+# First paint of each dashboard in one round-trip: the same query helpers the GET endpoints
+# use run concurrently in the threadpool, each part on its own pooled connection. Every
+# statement a part issues is capped at BOOTSTRAP_STATEMENT_TIMEOUT_MS by the database itself,
+# so a slow query is aborted server-side rather than left running behind a client timeout.
+# A part that fails or times out is reported under "errors" and the rest is still returned.
+BOOTSTRAP_STATEMENT_TIMEOUT_MS = int(os.environ.get('BOOTSTRAP_STATEMENT_TIMEOUT_MS', 5000))
+
+BOOTSTRAP_PARTS = {
+    'me': lambda cursor, token: fetch_current_user(cursor, token['user_id']),
+    'stats': fetch_dashboard_stats,
+    'notifications': lambda cursor, token: fetch_notifications(cursor, token['user_id']),
+    'timetable_today': lambda cursor, token: today_timetable(token['user_id'])[1],
+    'upcoming_exams': lambda cursor, token: fetch_upcoming_exams(cursor),
+    'active_sessions': fetch_active_sessions,
+    'courses': fetch_courses,
+    'grades': fetch_grades,
+    'leave_inbox_counts': lambda cursor, token: fetch_leave_inbox_counts(cursor, token['user_id']),
+    'department_overview': lambda cursor, token: fetch_department_overview(cursor, token['user_id']),
+    'hod_leave_requests': lambda cursor, token: fetch_hod_leave_requests(cursor, token['user_id']),
+    'parent_dashboard': lambda cursor, token: get_parent_dashboard(cursor, token['user_id'])[1],
+    'departments': lambda cursor, token: fetch_departments(cursor),
+}
+BOOTSTRAP_ROLE_PARTS = {
+    'Student': ('me', 'stats', 'notifications', 'timetable_today', 'upcoming_exams', 'active_sessions',
+                'courses', 'grades'),
+    'Teacher': ('me', 'stats', 'notifications', 'active_sessions', 'courses', 'leave_inbox_counts'),
+    'HOD': ('me', 'stats', 'notifications', 'active_sessions', 'courses', 'leave_inbox_counts',
+            'department_overview', 'hod_leave_requests'),
+    'Parent': ('me', 'stats', 'notifications', 'parent_dashboard'),
+    'Admin': ('me', 'stats', 'notifications', 'departments'),
+}
+
+def run_bootstrap_part(name: str, token: dict) -> bytes:
+    """Run one part on this worker thread under the statement limit and return its JSON body"""
+    limit = _statement_time_limit.set(BOOTSTRAP_STATEMENT_TIMEOUT_MS)
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                result = BOOTSTRAP_PARTS[name](cursor, token)
+    finally:
+        _statement_time_limit.reset(limit)
+    return orjson.dumps(result, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+async def gather_bootstrap_part(name: str, token: dict):
+    try:
+        return name, await run_in_threadpool(run_bootstrap_part, name, token), None
+    except HTTPException as e:
+        return name, None, {"status": e.status_code, "detail": e.detail}
+    except pymysql.err.OperationalError as e:
+        if e.args and e.args[0] in QUERY_TIMEOUT_ERRORS:
+            logger.warning(f"Bootstrap part {name} timed out for user {token['user_id']}")
+            return name, None, {"status": 504, "detail": "Timed out"}
+        logger.error(f"Bootstrap part {name} failed for user {token['user_id']}: {e}")
+        return name, None, {"status": 500, "detail": "Failed to load"}
+    except Exception as e:
+        logger.error(f"Bootstrap part {name} failed for user {token['user_id']}: {e}")
+        return name, None, {"status": 500, "detail": "Failed to load"}
+
+@api_router.get("/bootstrap")
+async def bootstrap(token: dict = Depends(verify_token)):
+    """Everything the caller's dashboard needs on first paint, in one response"""
+    role = token['role']
+    if role == 'Teacher':
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                if get_leave_actor(cursor, token['user_id'])['is_hod']:
+                    role = 'HOD'
+    parts = BOOTSTRAP_ROLE_PARTS.get(role)
+    if not parts:
+        raise HTTPException(status_code=403, detail="No dashboard for this role")
+
+    results = await asyncio.gather(*(gather_bootstrap_part(name, token) for name in parts))
+
+    # Part bodies are already JSON; splice them in rather than decoding and re-encoding
+    data = b",".join(orjson.dumps(name) + b":" + body for name, body, _ in results if body is not None)
+    errors = {name: error for name, _, error in results if error}
+    content = (b'{"role":' + orjson.dumps(role) + b',"data":{' + data + b'},"errors":' + orjson.dumps(errors) + b'}')
+    return Response(content=content, media_type="application/json", headers={'Cache-Control': 'private, no-store'})
+
+# ==========================================
+# BATCH READS
+# ==========================================
+
+# /batch runs several internal GETs in one HTTP round-trip. Each item is routed through the
+# app's own router (so query/path parameters, dependencies and error handlers behave exactly
+# as for a direct call) on a worker thread, with at most BATCH_CONCURRENCY running at once so
+# one batch holds a bounded number of pooled connections. The token is verified once for the
+# batch and shared with the items; each item is recorded in /metrics under its own route.
+BATCH_MAX_REQUESTS = 20
+BATCH_CONCURRENCY = 4
+
+class BatchItem(BaseModel):
+    id: str
+    path: str                            # e.g. "/api/grades" or "/api/leave/hod-requests?status=pending"
+    if_none_match: Optional[str] = None  # ETag from an earlier response; a match yields status 304
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+def run_batch_item(route, scope: dict) -> tuple:
+    """Run one routed GET to completion on this worker thread; returns (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(MetricsMiddleware(route.handle)(scope, receive, send))
+    start = next(m for m in messages if m['type'] == 'http.response.start')
+    body = b"".join(m.get('body', b"") for m in messages if m['type'] == 'http.response.body')
+    return start['status'], {k.decode().lower(): v.decode() for k, v in start.get('headers', [])}, body
+
+async def dispatch_batch_item(item: BatchItem, parent: Request, limit: asyncio.Semaphore) -> bytes:
+    """JSON fragment {"status", "etag", "body"} for one batch item"""
+    url = urlsplit(item.path)
+    if not url.path.startswith('/api/') or url.path.rstrip('/') == '/api/batch' or url.scheme or url.netloc:
+        return orjson.dumps({"status": 400, "body": {"detail": "Only internal /api/ paths can be batched"}})
+
+    headers = [(b"authorization", parent.headers.get('authorization', '').encode())]
+    if item.if_none_match:
+        headers.append((b"if-none-match", item.if_none_match.encode()))
+    scope = {
+        "type": "http", "asgi": parent.scope.get("asgi", {"version": "3.0"}), "http_version": "1.1",
+        "method": "GET", "scheme": parent.scope.get("scheme", "http"), "server": parent.scope.get("server"),
+        "client": parent.scope.get("client"), "root_path": "", "path": url.path,
+        "raw_path": url.path.encode(), "query_string": url.query.encode(), "headers": headers,
+        "app": parent.scope.get("app"), "state": {},
+        "starlette.exception_handlers": parent.scope.get("starlette.exception_handlers", ({}, {})),
+    }
+    route = None
+    for candidate in app.router.routes:
+        match, child_scope = candidate.matches(scope)
+        if match == Match.FULL:
+            route = candidate
+            scope.update(child_scope)
+            break
+        if match == Match.PARTIAL and route is None:
+            route = False  # path exists, but not for GET
+    if not route:
+        status, detail = (405, "Method Not Allowed") if route is False else (404, "Not Found")
+        return orjson.dumps({"status": status, "body": {"detail": detail}})
+
+    try:
+        async with limit:
+            status, response_headers, body = await run_in_threadpool(run_batch_item, route, scope)
+    except Exception as e:
+        logger.error(f"Batch item {item.path} failed: {e}")
+        return orjson.dumps({"status": 500, "body": {"detail": "Internal Server Error"}})
+
+    head = {"status": status}
+    if response_headers.get('etag'):
+        head["etag"] = response_headers['etag']
+    if status == 304 or not body:
+        body = b"null"
+    elif not response_headers.get('content-type', '').startswith('application/json'):
+        head["status"], body = 415, orjson.dumps({"detail": "Only JSON responses can be batched"})
+    # The item body is already JSON; splice it in rather than decoding and re-encoding
+    return orjson.dumps(head)[:-1] + b',"body":' + body + b'}'
+
+@api_router.post("/batch")
+async def batch(batch_request: BatchRequest, request: Request, token: dict = Depends(verify_token)):
+    """Run up to BATCH_MAX_REQUESTS internal GETs concurrently; results are keyed by item id"""
+    items = batch_request.requests
+    if not items:
+        raise HTTPException(status_code=400, detail="No requests given")
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    if len({item.id for item in items}) != len(items):
+        raise HTTPException(status_code=400, detail="Request ids must be unique")
+
+    credentials = request.headers.get('authorization', '').partition(' ')[2]
+    auth = _shared_auth.set((credentials, token))
+    try:
+        limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+        results = await asyncio.gather(*(dispatch_batch_item(item, request, limit) for item in items))
+    finally:
+        _shared_auth.reset(auth)
+
+    content = b"{" + b",".join(orjson.dumps(item.id) + b":" + result for item, result in zip(items, results)) + b"}"
+    return Response(content=content, media_type="application/json", headers={'Cache-Control': 'private, no-store'})
 
 # Include the router
 app.include_router(api_router)
 
+# Scrapers authenticate with METRICS_TOKEN as a bearer token; an Admin JWT also works.
+# Without either the endpoint is closed: it exposes route names, latencies and SQL fingerprints.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Prometheus scrape endpoint"""
+    if not (METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode())):
+        if verify_token(credentials).get('role') != 'Admin':
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+    return Response(content=render_prometheus_metrics(), media_type="text/plain; version=0.0.4")
+
 
 
 logging.basicConfig(
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark: FastAPI's default encoding (jsonable_encoder + stdlib json) vs
+DBJSONResponse (orjson with DB-type fast paths) on DictCursor-shaped rows.
+
+    python benchmarks/json_bench.py [--rows 10000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server import DBJSONResponse
+
+
+def make_rows(n: int):
+    """Rows shaped like get_users / get_grades / get_exam_seating results"""
+    base = datetime(2025, 1, 6, 9, 30)
+    return [{
+        'id': i,
+        'student_id': 10000 + i,
+        'student_name': f"Student {i}",
+        'usn': f"JUUG25BTECH{i:05d}",
+        'department': 'CSE',
+        'course_name': 'Data Structures',
+        'score': Decimal('87.50'),
+        'max_score': 100,
+        'graded_at': base + timedelta(minutes=i),
+        'exam_date': date(2025, 3, 1),
+        'start_time': timedelta(hours=9, minutes=30),
+        'hall_name': 'H-101',
+        'floor': 1,
+        'seat_number': i,
+    } for i in range(n)]
+
+
+def bench(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    stdlib = bench(lambda: JSONResponse(jsonable_encoder(rows)).body, args.repeat)
+    fast = bench(lambda: DBJSONResponse(rows).body, args.repeat)
+
+    print(f"{args.rows} rows")
+    print(f"jsonable_encoder + json : {stdlib:8.2f} ms")
+    print(f"DBJSONResponse (orjson) : {fast:8.2f} ms")
+    print(f"Speed-up                : {stdlib / fast:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for api/server.py against a local, seeded database.
+
+    python benchmarks/seed_data.py --reset --scale large
+    python benchmarks/load_test.py --start-server --concurrency 64 --duration 60
+    python benchmarks/load_test.py --start-server --compare benchmarks/results/baseline.json
+
+Drives a weighted mix of student / teacher / HOD / parent / admin traffic
+with an async HTTP client and reports p50/p95/p99 latency and throughput per
+endpoint. Results are written as JSON so runs can be compared for regressions.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import jwt
+
+sys.path.append(str(Path(__file__).parent))
+from seed_data import add_db_arguments, connect
+
+API_DIR = Path(__file__).parent.parent / 'api'
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+# (path, weight) per role; weights approximate what each dashboard fetches on load
+SCENARIOS = {
+    'student': [
+        ('/api/auth/me', 10), ('/api/dashboard/stats', 10), ('/api/timetable/today', 10),
+        ('/api/notifications', 8), ('/api/exams/upcoming', 6), ('/api/attendance/active-sessions', 8),
+        ('/api/attendance/my-stats', 4), ('/api/grades', 4), ('/api/classwork', 4),
+        ('/api/timetable/slots-config', 2), ('/api/leave/my-requests', 2),
+    ],
+    'teacher': [
+        ('/api/auth/me', 6), ('/api/dashboard/stats', 6), ('/api/courses', 6), ('/api/notifications', 4),
+        ('/api/attendance/active-sessions', 4), ('/api/attendance/all', 2), ('/api/grades', 3),
+        ('/api/leave/requests', 3), ('/api/classwork', 3), ('/api/submissions', 2),
+    ],
+    'hod': [
+        ('/api/auth/me', 4), ('/api/hod/department-overview', 6), ('/api/leave/hod-requests', 4),
+        ('/api/notifications', 2),
+    ],
+    'parent': [
+        ('/api/auth/me', 4), ('/api/dashboard/stats', 6), ('/api/grades', 4), ('/api/attendance', 2),
+    ],
+    'admin': [
+        ('/api/dashboard/stats', 4), ('/api/users', 1), ('/api/departments', 3), ('/api/courses', 3),
+        ('/api/timetable/class-teachers', 2), ('/api/exams', 2), ('/api/hod/list', 2),
+    ],
+}
+DEFAULT_MIX = 'student=75,teacher=10,hod=2,parent=10,admin=3'
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(','):
+        role, _, weight = part.partition('=')
+        if role.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown role in --mix: {role}")
+        weights[role.strip()] = float(weight)
+    return weights
+
+
+def sample_users(args):
+    """Pick up to --users-per-role accounts per role and mint JWTs for them (avoids the login rate limit)"""
+    queries = {
+        'student': "SELECT id, username, email, role FROM users WHERE role = 'Student'",
+        'teacher': "SELECT id, username, email, role FROM users WHERE role = 'Teacher' AND (is_hod = FALSE OR is_hod IS NULL)",
+        'hod': "SELECT id, username, email, role FROM users WHERE role = 'Teacher' AND is_hod = TRUE",
+        'parent': "SELECT id, username, email, role FROM users WHERE role = 'Parent'",
+        'admin': "SELECT id, username, email, role FROM users WHERE role = 'Admin'",
+    }
+    expiry = datetime.now(timezone.utc) + timedelta(hours=6)
+    conn = connect(args)
+    users = {}
+    try:
+        with conn.cursor() as cursor:
+            for role, query in queries.items():
+                cursor.execute(query + " ORDER BY RAND() LIMIT %s", (args.users_per_role,))
+                users[role] = [
+                    jwt.encode({'user_id': u['id'], 'username': u['username'], 'email': u['email'] or '',
+                                'role': u['role'], 'exp': expiry}, args.jwt_secret, algorithm="HS256")
+                    for u in cursor.fetchall()
+                ]
+    finally:
+        conn.close()
+    return users
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    env = dict(os.environ,
+               DB_HOST=args.db_host, DB_PORT=str(args.db_port), DB_USERNAME=args.db_user,
+               DB_PASSWORD=args.db_password, DB_DATABASE=args.db_name, DB_SSL='false',
+               JWT_SECRET=args.jwt_secret)
+    cmd = [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(args.workers), '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, cwd=API_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("Server did not become healthy within 30s")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def drive(base_url, users, mix, args):
+    rng = random.Random(args.seed)
+    roles = [r for r in mix if users.get(r)]
+    role_weights = [mix[r] for r in roles]
+    samples = {}   # "GET /path" -> list of (latency_ms, status)
+    deadline = time.perf_counter() + args.duration
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        async def worker():
+            while time.perf_counter() < deadline:
+                role = rng.choices(roles, role_weights)[0]
+                token = rng.choice(users[role])
+                paths, weights = zip(*SCENARIOS[role])
+                path = rng.choices(paths, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, headers={'Authorization': f'Bearer {token}'})
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                samples.setdefault(f"GET {path}", []).append(((time.perf_counter() - start) * 1000, status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        latencies = sorted(v[0] for v in values)
+        errors = sum(1 for _, status in values if status == 0 or status >= 400)
+        endpoints[name] = {
+            'requests': len(values),
+            'errors': errors,
+            'throughput_rps': round(len(values) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+        }
+    total = sum(e['requests'] for e in endpoints.values())
+    return {
+        'total_requests': total,
+        'total_errors': sum(e['errors'] for e in endpoints.values()),
+        'throughput_rps': round(total / elapsed, 2),
+        'duration_s': round(elapsed, 2),
+        'endpoints': endpoints,
+    }
+
+
+def print_report(summary):
+    print(f"\n{'endpoint':<42} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, e in summary['endpoints'].items():
+        print(f"{name:<42} {e['requests']:>7} {e['errors']:>5} {e['throughput_rps']:>8.1f} "
+              f"{e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f}")
+    print(f"\nTotal: {summary['total_requests']} requests, {summary['total_errors']} errors, "
+          f"{summary['throughput_rps']:.1f} req/s over {summary['duration_s']}s")
+
+
+def compare(summary, baseline_path, threshold):
+    """Flag endpoints whose p95 grew (or throughput dropped) by more than `threshold`"""
+    baseline = json.loads(Path(baseline_path).read_text())['summary']
+    regressions = []
+    print(f"\nComparison against {baseline_path} (threshold {threshold:.0%}):")
+    for name, current in summary['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = current['p95_ms'] / before['p95_ms'] - 1
+        marker = 'REGRESSION' if change > threshold else ''
+        print(f"  {name:<42} p95 {before['p95_ms']:>8.1f} -> {current['p95_ms']:>8.1f} ms ({change:+.0%}) {marker}")
+        if marker:
+            regressions.append(name)
+    if baseline['throughput_rps']:
+        change = summary['throughput_rps'] / baseline['throughput_rps'] - 1
+        print(f"  overall throughput {baseline['throughput_rps']:.1f} -> {summary['throughput_rps']:.1f} req/s ({change:+.0%})")
+        if change < -threshold:
+            regressions.append('throughput')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_db_arguments(parser)
+    parser.add_argument('--base-url', help="Target an already running server instead of --start-server")
+    parser.add_argument('--start-server', action='store_true', help="Spawn uvicorn server:app against the local DB")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers when using --start-server")
+    parser.add_argument('--jwt-secret', default=os.environ.get('JWT_SECRET', 'loadtest-secret'))
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--users-per-role', type=int, default=200)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Role weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='', help="Free-form tag stored with the results")
+    parser.add_argument('--out', help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', help="Baseline results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative p95 regression")
+    args = parser.parse_args()
+
+    if not args.base_url and not args.start_server:
+        parser.error("pass --base-url or --start-server")
+
+    mix = parse_mix(args.mix)
+    users = sample_users(args)
+    proc = None
+    if args.start_server:
+        proc, base_url = start_server(args)
+    else:
+        base_url = args.base_url.rstrip('/')
+
+    try:
+        print(f"Load: {args.concurrency} concurrent clients for {args.duration}s against {base_url}")
+        samples, elapsed = asyncio.run(drive(base_url, users, mix, args))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    summary = summarize(samples, elapsed)
+    print_report(summary)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        'label': args.label,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': {k: getattr(args, k) for k in ('concurrency', 'duration', 'workers', 'users_per_role', 'mix', 'seed')},
+        'summary': summary,
+    }, indent=2))
+    print(f"Results written to {out}")
+
+    if args.compare and compare(summary, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: BaseHTTPMiddleware stack vs pure-ASGI middleware stack.
+
+Drives the ASGI apps in-process (no sockets) so the numbers reflect
+middleware overhead only.
+
+    python benchmarks/middleware_bench.py [--requests 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from slowapi.middleware import SlowAPIMiddleware
+
+from server import SECURITY_HEADERS, SecurityHeadersMiddleware, limiter
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The previous implementation, kept here as the baseline."""
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        for key, value in SECURITY_HEADERS.items():
+            response.headers[key] = value
+        return response
+
+
+async def ping(request):
+    return JSONResponse({"status": "healthy"})
+
+
+def build_app(legacy: bool):
+    app = Starlette(routes=[Route("/api/health", ping)])
+    app.state.limiter = limiter
+    if legacy:
+        app.add_middleware(SlowAPIMiddleware)
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+    else:
+        # server.py enforces limits with @limiter.limit only, so no limiter middleware here
+        app.add_middleware(SecurityHeadersMiddleware)
+    return app
+
+
+async def run(app, n: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/api/health", "raw_path": b"/api/health",
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 5000), "server": ("bench", 80),
+    }
+
+    async def send(message):
+        pass
+
+    async def one_request():
+        sent = False
+        disconnected = asyncio.Event()
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        await app(dict(scope), receive, send)
+
+    # Warm-up (builds middleware stack, route caches)
+    for _ in range(200):
+        await one_request()
+
+    start = time.perf_counter()
+    for _ in range(n):
+        await one_request()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    legacy_rps = asyncio.run(run(build_app(legacy=True), args.requests))
+    asgi_rps = asyncio.run(run(build_app(legacy=False), args.requests))
+
+    print(f"BaseHTTPMiddleware stack : {legacy_rps:10.0f} req/s")
+    print(f"Pure ASGI stack          : {asgi_rps:10.0f} req/s")
+    print(f"Speed-up                 : {asgi_rps / legacy_rps:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+-- Local MySQL/MariaDB stand-in for the production TiDB schema.
+-- Reconstructed from the queries in api/server.py; used by the benchmark
+-- seeder and load test only.
+
+CREATE TABLE IF NOT EXISTS departments (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    code VARCHAR(20) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    name VARCHAR(255),
+    idno VARCHAR(50),
+    department VARCHAR(100),
+    year VARCHAR(10),
+    section VARCHAR(10) DEFAULT 'A',
+    parent_id INT,
+    is_hod BOOLEAN DEFAULT FALSE,
+    hod_department VARCHAR(100),
+    must_change_password BOOLEAN DEFAULT FALSE,
+    reset_token VARCHAR(64),
+    reset_token_expires DATETIME,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_users_role (role),
+    INDEX idx_users_class (department, year, section),
+    INDEX idx_users_parent (parent_id)
+);
+
+CREATE TABLE IF NOT EXISTS courses (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    code VARCHAR(50) NOT NULL,
+    department VARCHAR(100),
+    year VARCHAR(10),
+    teacher_id INT,
+    teacher_name VARCHAR(255),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_courses_teacher (teacher_id),
+    INDEX idx_courses_class (department, year)
+);
+
+CREATE TABLE IF NOT EXISTS grades (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    student_id INT NOT NULL,
+    course_id INT,
+    course_name VARCHAR(255),
+    title VARCHAR(255),
+    marks INT,
+    max_marks INT DEFAULT 100,
+    graded_by INT,
+    date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_grades_student (student_id),
+    INDEX idx_grades_course (course_id),
+    INDEX idx_grades_graded_by (graded_by)
+);
+
+CREATE TABLE IF NOT EXISTS attendance (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    course_id INT,
+    course_name VARCHAR(255),
+    department VARCHAR(100),
+    year VARCHAR(10),
+    date DATE,
+    records JSON,
+    taken_by INT
+);
+
+CREATE TABLE IF NOT EXISTS classwork (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    course_id INT,
+    department VARCHAR(100),
+    year VARCHAR(10),
+    type VARCHAR(50) DEFAULT 'Assignment',
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    due_date DATETIME,
+    max_marks INT DEFAULT 100,
+    uploaded_by INT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_classwork_department (department, created_at),
+    INDEX idx_classwork_uploaded_by (uploaded_by)
+);
+
+CREATE TABLE IF NOT EXISTS submissions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    classwork_id INT NOT NULL,
+    student_id INT NOT NULL,
+    student_name VARCHAR(255),
+    content LONGTEXT,
+    status VARCHAR(20) DEFAULT 'Submitted',
+    submitted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_submission (classwork_id, student_id),
+    INDEX idx_submissions_student (student_id)
+);
+
+CREATE TABLE IF NOT EXISTS timetable_slots (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    department VARCHAR(100) NOT NULL,
+    year VARCHAR(10) NOT NULL,
+    section VARCHAR(10) NOT NULL,
+    day_of_week VARCHAR(10) NOT NULL,
+    slot_number INT NOT NULL,
+    course_id INT,
+    teacher_id INT,
+    room VARCHAR(50),
+    UNIQUE KEY uq_timetable_slot (department, year, section, day_of_week, slot_number),
+    INDEX idx_timetable_teacher (teacher_id, day_of_week, slot_number)
+);
+
+CREATE TABLE IF NOT EXISTS class_teachers (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    department VARCHAR(100) NOT NULL,
+    year VARCHAR(10) NOT NULL,
+    section VARCHAR(10) NOT NULL,
+    teacher_id INT NOT NULL,
+    UNIQUE KEY uq_class_teacher (department, year, section)
+);
+
+CREATE TABLE IF NOT EXISTS leave_requests (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    student_id INT NOT NULL,
+    student_name VARCHAR(255),
+    department VARCHAR(100),
+    year VARCHAR(10),
+    section VARCHAR(10),
+    leave_type VARCHAR(20),
+    start_date DATE,
+    end_date DATE,
+    reason TEXT,
+    status VARCHAR(30) DEFAULT 'pending',
+    class_teacher_id INT,
+    teacher_remarks TEXT,
+    approved_by VARCHAR(255),
+    approved_at DATETIME,
+    hod_remarks TEXT,
+    hod_approved_by VARCHAR(255),
+    hod_approved_at DATETIME,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_leave_student (student_id),
+    INDEX idx_leave_class_teacher (class_teacher_id, status),
+    INDEX idx_leave_department (department, status)
+);
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    title VARCHAR(255),
+    message TEXT,
+    type VARCHAR(20),
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_notifications_user (user_id, created_at)
+);
+
+CREATE TABLE IF NOT EXISTS attendance_sessions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    teacher_id INT NOT NULL,
+    course_id INT NOT NULL,
+    otp VARCHAR(6) NOT NULL,
+    lat DECIMAL(10, 7),
+    lng DECIMAL(10, 7),
+    radius_meters INT DEFAULT 20,
+    expires_at DATETIME NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_sessions_otp (otp, expires_at),
+    INDEX idx_sessions_course (course_id),
+    INDEX idx_sessions_teacher (teacher_id, expires_at)
+);
+
+CREATE TABLE IF NOT EXISTS attendance_logs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    session_id INT NOT NULL,
+    student_id INT NOT NULL,
+    status VARCHAR(20) DEFAULT 'present',
+    is_manual BOOLEAN DEFAULT FALSE,
+    manual_by INT,
+    marked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_attendance_log (session_id, student_id),
+    INDEX idx_logs_student (student_id)
+);
+
+CREATE TABLE IF NOT EXISTS exam_schedules (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    course_id INT,
+    exam_date DATE,
+    start_time TIME,
+    end_time TIME,
+    is_visible BOOLEAN DEFAULT FALSE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS exam_halls (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    building VARCHAR(100),
+    floor INT,
+    capacity INT
+);
+
+CREATE TABLE IF NOT EXISTS exam_seating (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    exam_id INT NOT NULL,
+    student_id INT NOT NULL,
+    hall_id INT NOT NULL,
+    seat_number INT,
+    `row_number` INT,
+    INDEX idx_seating_exam (exam_id),
+    INDEX idx_seating_student (student_id)
+);
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Seed a local MySQL/MariaDB database with synthetic university data for
+benchmarking api/server.py.
+
+    python benchmarks/seed_data.py --reset --scale large
+    python benchmarks/seed_data.py --students 5000 --teachers 150 --days 30 --grade-mean 62
+    python benchmarks/seed_data.py --xlsx-only --xlsx-files 3 --xlsx-rows 2000
+
+Writes departments, users (students, teachers, HODs and parents linked via
+parent_id), courses, timetable_slots, class_teachers, attendance
+sessions/logs, grades, classwork, submissions, leave_requests and exams.
+It can also emit matching .xlsx admission files for POST /users/bulk-upload.
+
+IDs are assigned explicitly, so the target database should be empty
+(use --reset to drop and recreate the schema).
+"""
+import argparse
+import os
+import random
+import string
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import bcrypt
+import pymysql
+
+SCHEMA_FILE = Path(__file__).parent / 'schema.sql'
+
+SCALES = {
+    'small': {'students': 2000, 'teachers': 100, 'days': 20},
+    'medium': {'students': 8000, 'teachers': 250, 'days': 45},
+    'large': {'students': 20000, 'teachers': 500, 'days': 90},  # a full term
+}
+
+DEPARTMENTS = [
+    ("Computer Science and Engineering", "CSE"),
+    ("Information Science and Engineering", "ISE"),
+    ("Electronics and Communication Engineering", "ECE"),
+    ("Mechanical Engineering", "ME"),
+    ("Civil Engineering", "CIVIL"),
+    ("Artificial Intelligence and Machine Learning", "AIML"),
+    ("Data Science", "DS"),
+    ("Electrical and Electronics Engineering", "EEE"),
+]
+YEARS = ["1", "2", "3", "4"]
+DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+SLOT_STARTS = ["08:45", "09:45", "11:00", "12:50", "13:50", "14:50"]
+COURSES_PER_CLASS = 5
+CAMPUS = (12.9716, 77.5946)
+DEFAULT_PASSWORD = "123456789"
+ASSESSMENTS = [("Internal {n}", 50), ("Assignment {n}", 20), ("Quiz {n}", 10), ("Lab {n}", 25)]
+CLASSWORK_TYPES = ["Assignment", "Lab", "Project", "Quiz"]
+LEAVE_TYPES = ["sick", "personal", "emergency"]
+DEFAULT_LEAVE_MIX = 'pending=40,approved=25,rejected=5,forwarded_to_hod=15,hod_approved=10,hod_rejected=5'
+
+
+def connect(args, database=True):
+    return pymysql.connect(
+        host=args.db_host, port=args.db_port, user=args.db_user, password=args.db_password,
+        database=args.db_name if database else None, autocommit=False,
+        cursorclass=pymysql.cursors.DictCursor,
+    )
+
+
+def add_db_arguments(parser):
+    parser.add_argument('--db-host', default=os.environ.get('DB_HOST', '127.0.0.1'))
+    parser.add_argument('--db-port', type=int, default=int(os.environ.get('DB_PORT', 3306)))
+    parser.add_argument('--db-user', default=os.environ.get('DB_USERNAME', 'root'))
+    parser.add_argument('--db-password', default=os.environ.get('DB_PASSWORD', ''))
+    parser.add_argument('--db-name', default=os.environ.get('DB_DATABASE', 'jain_erp_bench'))
+
+
+def apply_schema(args, reset=False):
+    conn = connect(args, database=False)
+    try:
+        with conn.cursor() as cursor:
+            if reset:
+                cursor.execute(f"DROP DATABASE IF EXISTS `{args.db_name}`")
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.db_name}`")
+            cursor.execute(f"USE `{args.db_name}`")
+            for statement in SCHEMA_FILE.read_text().split(';'):
+                lines = [l for l in statement.splitlines() if not l.strip().startswith('--')]
+                if ''.join(lines).strip():
+                    cursor.execute('\n'.join(lines))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def parse_weights(spec):
+    """'a=3,b=1' -> (['a', 'b'], [3.0, 1.0])"""
+    pairs = [part.split('=') for part in spec.split(',') if part]
+    return [k.strip() for k, _ in pairs], [float(v) for _, v in pairs]
+
+
+def bulk_insert(cursor, table, columns, rows, batch_size=2000):
+    """executemany in batches; PyMySQL rewrites each batch into one multi-row INSERT"""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    batch, total = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def school_days(days, end=None):
+    """The last `days` teaching days (Mon-Sat) up to and including `end`"""
+    current = end or date.today()
+    result = []
+    while len(result) < days:
+        if current.weekday() < 6:
+            result.append(current)
+        current -= timedelta(days=1)
+    return list(reversed(result))
+
+
+class Dataset:
+    """Everything generated so far, kept in memory so later tables can reference earlier ids"""
+    def __init__(self, rng):
+        self.rng = rng
+        self.next_user_id = 1
+        self.teachers = []         # dicts: id, name, department
+        self.students = []         # dicts: id, name, usn, department, year, section
+        self.classes = {}          # (dept, year, section) -> [student ids]
+        self.courses = []          # dicts: id, name, code, department, year, teacher_id
+        self.timetable = []        # dicts: department, year, section, day, slot, course_id, teacher_id
+        self.class_teachers = {}   # (dept, year, section) -> teacher dict
+
+    def user_id(self):
+        uid = self.next_user_id
+        self.next_user_id += 1
+        return uid
+
+
+def seed_departments(cursor, data):
+    return bulk_insert(cursor, 'departments', ['id', 'name', 'code'],
+                       [(i, name, code) for i, (name, code) in enumerate(DEPARTMENTS, start=1)])
+
+
+def seed_users(cursor, data, args, hashed):
+    codes = [code for _, code in DEPARTMENTS]
+    rows = [(data.user_id(), 'admin', 'admin@jainuniversity.ac.in', hashed, 'Admin', 'Administrator',
+             None, None, None, None, None, False, None)]
+
+    for i in range(args.teachers):
+        dept = codes[i % len(codes)]
+        teacher = {'id': data.user_id(), 'name': f"Teacher {i + 1}", 'department': dept}
+        is_hod = i < len(codes)  # first teacher of every department is its HOD
+        data.teachers.append(teacher)
+        rows.append((teacher['id'], f"teacher{i + 1}", f"teacher{i + 1}@jainuniversity.ac.in", hashed,
+                     'Teacher', teacher['name'], None, dept, None, None, None, is_hod, dept if is_hod else None))
+
+    for i in range(args.students):
+        dept = codes[i % len(codes)]
+        year = YEARS[(i // len(codes)) % len(YEARS)]
+        class_index = i // (len(codes) * len(YEARS))
+        section = string.ascii_uppercase[class_index // args.class_size % 26]
+        usn = f"JU{year}{dept}{i + 1:05d}"
+        student = {'id': data.user_id(), 'name': f"Student {i + 1}", 'usn': usn,
+                   'department': dept, 'year': year, 'section': section}
+        data.students.append(student)
+        data.classes.setdefault((dept, year, section), []).append(student['id'])
+        rows.append((student['id'], f"student{i + 1}", f"{usn.lower()}@jainuniversity.ac.in", hashed,
+                     'Student', student['name'], usn, dept, year, section, None, False, None))
+
+    # One parent per student, linked through parent_id (matches create_user / bulk_upload_students)
+    for student in data.students:
+        digits = ''.join(filter(str.isdigit, student['usn']))[-5:]
+        username = f"{student['name'].replace(' ', '.').lower()}{digits}"
+        rows.append((data.user_id(), username, f"parent.{student['usn'].lower()}@jainuniversity.ac.in", hashed,
+                     'Parent', f"Parent of {student['name']}", None, None, None, None, student['id'], False, None))
+
+    return bulk_insert(cursor, 'users', ['id', 'username', 'email', 'password', 'role', 'name', 'idno',
+                                         'department', 'year', 'section', 'parent_id', 'is_hod', 'hod_department'], rows)
+
+
+def seed_courses(cursor, data):
+    by_dept = {}
+    for t in data.teachers:
+        by_dept.setdefault(t['department'], []).append(t)
+    rows, course_id = [], 1
+    for dept in sorted({d for d, _, _ in data.classes}):
+        pool = by_dept.get(dept) or data.teachers
+        for year in YEARS:
+            for n in range(COURSES_PER_CLASS):
+                teacher = pool[(int(year) * COURSES_PER_CLASS + n) % len(pool)]
+                course = {'id': course_id, 'name': f"{dept} Subject {year}.{n + 1}", 'code': f"{dept}{year}{n + 1:02d}",
+                          'department': dept, 'year': year, 'teacher_id': teacher['id']}
+                data.courses.append(course)
+                rows.append((course_id, course['name'], course['code'], dept, year, teacher['id'], teacher['name']))
+                course_id += 1
+    return bulk_insert(cursor, 'courses', ['id', 'name', 'code', 'department', 'year', 'teacher_id', 'teacher_name'], rows)
+
+
+def seed_timetable(cursor, data):
+    """Round-robin the class's courses over the week, skipping slots where the teacher is already busy"""
+    courses_by_class = {}
+    for c in data.courses:
+        courses_by_class.setdefault((c['department'], c['year']), []).append(c)
+    busy = set()
+    rows = []
+    for (dept, year, section) in sorted(data.classes):
+        courses = courses_by_class.get((dept, year), [])
+        if not courses:
+            continue
+        i = 0
+        for day in DAYS_OF_WEEK:
+            for slot in range(1, len(SLOT_STARTS) + 1):
+                for _ in range(len(courses)):
+                    course = courses[i % len(courses)]
+                    i += 1
+                    if (course['teacher_id'], day, slot) not in busy:
+                        busy.add((course['teacher_id'], day, slot))
+                        entry = {'department': dept, 'year': year, 'section': section, 'day': day,
+                                 'slot': slot, 'course_id': course['id'], 'teacher_id': course['teacher_id']}
+                        data.timetable.append(entry)
+                        rows.append((dept, year, section, day, slot, course['id'], course['teacher_id'], f"R{slot}{len(rows) % 40:02d}"))
+                        break
+    return bulk_insert(cursor, 'timetable_slots', ['department', 'year', 'section', 'day_of_week',
+                                                   'slot_number', 'course_id', 'teacher_id', 'room'], rows)
+
+
+def seed_class_teachers(cursor, data):
+    non_hod = [t for t in data.teachers[len(DEPARTMENTS):]] or data.teachers
+    for i, key in enumerate(sorted(data.classes)):
+        data.class_teachers[key] = non_hod[i % len(non_hod)]
+    rows = [key + (teacher['id'],) for key, teacher in data.class_teachers.items()]
+    return bulk_insert(cursor, 'class_teachers', ['department', 'year', 'section', 'teacher_id'], rows)
+
+
+def seed_attendance(cursor, data, args):
+    """One session per timetable slot (up to --sessions-per-day per class) for every teaching day"""
+    rng = data.rng
+    by_class_day = {}
+    for entry in data.timetable:
+        by_class_day.setdefault((entry['department'], entry['year'], entry['section'], entry['day']), []).append(entry)
+
+    session_rows, log_rows = [], []
+    session_id = 1
+    for day in school_days(args.days):
+        day_name = day.strftime('%A')
+        for key, students in data.classes.items():
+            for entry in by_class_day.get(key + (day_name,), [])[:args.sessions_per_day]:
+                hh, mm = map(int, SLOT_STARTS[entry['slot'] - 1].split(':'))
+                opened = datetime(day.year, day.month, day.day, hh, mm)
+                session_rows.append((session_id, entry['teacher_id'], entry['course_id'],
+                                     f"{rng.randrange(10 ** 6):06d}", CAMPUS[0], CAMPUS[1], 20,
+                                     opened + timedelta(seconds=60), opened))
+                for student_id in students:
+                    if rng.random() < args.attendance_rate:
+                        log_rows.append((session_id, student_id, 'present', opened + timedelta(seconds=rng.randrange(60))))
+                session_id += 1
+
+    sessions = bulk_insert(cursor, 'attendance_sessions', ['id', 'teacher_id', 'course_id', 'otp', 'lat', 'lng',
+                                                           'radius_meters', 'expires_at', 'created_at'], session_rows)
+    logs = bulk_insert(cursor, 'attendance_logs', ['session_id', 'student_id', 'status', 'marked_at'], log_rows)
+    return sessions, logs
+
+
+def students_of(data, department, year):
+    return [sid for (d, y, _), ids in data.classes.items() if d == department and y == year for sid in ids]
+
+
+def seed_grades(cursor, data, args):
+    """Per-student ability plus per-assessment noise, so courses get realistic spreads and an at-risk tail"""
+    rng = data.rng
+    ability = {s['id']: rng.gauss(0, args.grade_ability_sd) for s in data.students}
+    start = datetime.combine(school_days(args.days)[0], datetime.min.time())
+
+    def rows():
+        for course in data.courses:
+            students = students_of(data, course['department'], course['year'])
+            for n in range(args.grades_per_course):
+                template, max_marks = ASSESSMENTS[n % len(ASSESSMENTS)]
+                title = template.format(n=n // len(ASSESSMENTS) + 1)
+                graded_at = start + timedelta(days=rng.randrange(max(args.days, 1)), minutes=rng.randrange(600))
+                for sid in students:
+                    pct = min(100.0, max(0.0, rng.gauss(args.grade_mean, args.grade_sd) + ability[sid]))
+                    yield (sid, course['id'], course['name'], title, round(pct * max_marks / 100),
+                           max_marks, course['teacher_id'], graded_at)
+
+    return bulk_insert(cursor, 'grades', ['student_id', 'course_id', 'course_name', 'title', 'marks',
+                                          'max_marks', 'graded_by', 'date'], rows(), args.batch_size)
+
+
+def seed_classwork(cursor, data, args):
+    rng = data.rng
+    names = {s['id']: s['name'] for s in data.students}
+    start = datetime.combine(school_days(args.days)[0], datetime.min.time())
+    body = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * (args.submission_bytes // 57 + 1))[:args.submission_bytes]
+    classwork_rows, submission_rows = [], []
+    classwork_id = 1
+    for course in data.courses:
+        students = students_of(data, course['department'], course['year'])
+        for n in range(args.classwork_per_course):
+            created = start + timedelta(days=rng.randrange(max(args.days, 1)), minutes=rng.randrange(600))
+            kind = CLASSWORK_TYPES[n % len(CLASSWORK_TYPES)]
+            classwork_rows.append((classwork_id, course['id'], course['department'], course['year'], kind,
+                                   f"{kind} {n + 1} - {course['code']}", f"Complete {kind.lower()} {n + 1}.",
+                                   created + timedelta(days=7), 100, course['teacher_id'], created))
+            for sid in students:
+                if rng.random() < args.submission_rate:
+                    submission_rows.append((classwork_id, sid, names[sid], body, 'Submitted',
+                                            created + timedelta(hours=rng.randrange(1, 24 * 7))))
+            classwork_id += 1
+
+    classwork = bulk_insert(cursor, 'classwork', ['id', 'course_id', 'department', 'year', 'type', 'title', 'description',
+                                                  'due_date', 'max_marks', 'uploaded_by', 'created_at'], classwork_rows)
+    submissions = bulk_insert(cursor, 'submissions', ['classwork_id', 'student_id', 'student_name', 'content',
+                                                      'status', 'submitted_at'], submission_rows, args.batch_size)
+    return classwork, submissions
+
+
+def seed_leave_requests(cursor, data, args):
+    rng = data.rng
+    statuses, weights = parse_weights(args.leave_mix)
+    hods = {t['department']: t for t in data.teachers[:len(DEPARTMENTS)]}
+    window = school_days(args.days)
+    rows = []
+    for student in rng.sample(data.students, int(len(data.students) * args.leave_rate)):
+        key = (student['department'], student['year'], student['section'])
+        teacher = data.class_teachers.get(key)
+        start = rng.choice(window) + timedelta(days=rng.randrange(0, 21))
+        end = start + timedelta(days=min(int(rng.expovariate(1 / args.leave_mean_days)), 10))
+        created = datetime.combine(start, datetime.min.time()) - timedelta(days=rng.randrange(1, 5))
+        status = rng.choices(statuses, weights)[0]
+        approved = created + timedelta(hours=rng.randrange(2, 48))
+        teacher_done = status in ('approved', 'rejected')
+        hod_done = status.startswith('hod_')
+        hod = hods.get(student['department'])
+        rows.append((student['id'], student['name'], student['department'], student['year'], student['section'],
+                     rng.choice(LEAVE_TYPES), start, end, "Synthetic leave request", status,
+                     teacher['id'] if teacher else None,
+                     teacher['name'] if teacher_done and teacher else None, approved if teacher_done else None,
+                     hod['name'] if hod_done and hod else None, approved if hod_done else None, created))
+    return bulk_insert(cursor, 'leave_requests', ['student_id', 'student_name', 'department', 'year', 'section',
+                                                  'leave_type', 'start_date', 'end_date', 'reason', 'status',
+                                                  'class_teacher_id', 'approved_by', 'approved_at',
+                                                  'hod_approved_by', 'hod_approved_at', 'created_at'], rows)
+
+
+def write_admission_files(args):
+    """Excel files in the format bulk_upload_students expects (Student Name, USN, Department, Year, Section).
+
+    USNs use a JUADM prefix so they never collide with seeded students.
+    """
+    from openpyxl import Workbook
+
+    out_dir = Path(args.xlsx_out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    codes = [code for _, code in DEPARTMENTS]
+    paths = []
+    for f in range(args.xlsx_files):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Admissions')
+        sheet.append(['Student Name', 'USN', 'Department', 'Year', 'Section'])
+        for i in range(args.xlsx_rows):
+            dept = codes[i % len(codes)]
+            sheet.append([f"Admission {f + 1} {i + 1}", f"JUADM{f + 1:02d}{dept}{i + 1:05d}", dept, '1',
+                          string.ascii_uppercase[i // (len(codes) * args.class_size) % 26]])
+        path = out_dir / f"admissions_{f + 1:02d}_{args.xlsx_rows}.xlsx"
+        workbook.save(path)
+        paths.append(path)
+    return paths
+
+
+def seed_exams(cursor, data):
+    halls = [(i, f"H-{100 + i}", f"Block {'ABCD'[i % 4]}", i % 5, 60) for i in range(1, 41)]
+    bulk_insert(cursor, 'exam_halls', ['id', 'name', 'building', 'floor', 'capacity'], halls)
+    start = date.today() + timedelta(days=14)
+    exams = [(c['id'], f"End Semester - {c['code']}", c['id'], start + timedelta(days=c['id'] % 12),
+              '09:30:00', '12:30:00', True) for c in data.courses]
+    return bulk_insert(cursor, 'exam_schedules', ['id', 'name', 'course_id', 'exam_date', 'start_time',
+                                                  'end_time', 'is_visible'], exams)
+
+
+def seed(args):
+    data = Dataset(random.Random(args.seed))
+    hashed = bcrypt.hashpw(DEFAULT_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    conn = connect(args)
+    counts = {}
+    try:
+        with conn.cursor() as cursor:
+            steps = [
+                ('departments', lambda: seed_departments(cursor, data)),
+                ('users', lambda: seed_users(cursor, data, args, hashed)),
+                ('courses', lambda: seed_courses(cursor, data)),
+                ('timetable_slots', lambda: seed_timetable(cursor, data)),
+                ('class_teachers', lambda: seed_class_teachers(cursor, data)),
+                ('attendance_sessions/logs', lambda: seed_attendance(cursor, data, args)),
+                ('grades', lambda: seed_grades(cursor, data, args)),
+                ('classwork/submissions', lambda: seed_classwork(cursor, data, args)),
+                ('leave_requests', lambda: seed_leave_requests(cursor, data, args)),
+                ('exam_schedules', lambda: seed_exams(cursor, data)),
+            ]
+            for name, step in steps:
+                started = time.perf_counter()
+                counts[name] = step()
+                conn.commit()
+                print(f"  {name:<26} {str(counts[name]):>18}  ({time.perf_counter() - started:.1f}s)")
+    finally:
+        conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_db_arguments(parser)
+    parser.add_argument('--reset', action='store_true', help="Drop and recreate the database first")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--students', type=int)
+    parser.add_argument('--teachers', type=int)
+    parser.add_argument('--days', type=int, help="Teaching days of attendance history")
+    parser.add_argument('--class-size', type=int, default=60)
+    parser.add_argument('--sessions-per-day', type=int, default=2, help="Attendance sessions per class per day")
+    parser.add_argument('--attendance-rate', type=float, default=0.85)
+    parser.add_argument('--grades-per-course', type=int, default=4, help="Assessments graded per course")
+    parser.add_argument('--grade-mean', type=float, default=68, help="Mean score (percent)")
+    parser.add_argument('--grade-sd', type=float, default=12, help="Per-assessment spread (percent)")
+    parser.add_argument('--grade-ability-sd', type=float, default=10, help="Spread of per-student ability (percent)")
+    parser.add_argument('--classwork-per-course', type=int, default=3)
+    parser.add_argument('--submission-rate', type=float, default=0.7)
+    parser.add_argument('--submission-bytes', type=int, default=512, help="Size of each submission's content")
+    parser.add_argument('--leave-rate', type=float, default=0.15, help="Fraction of students with a leave request")
+    parser.add_argument('--leave-mean-days', type=float, default=1.5)
+    parser.add_argument('--leave-mix', default=DEFAULT_LEAVE_MIX, help=f"Status weights (default: {DEFAULT_LEAVE_MIX})")
+    parser.add_argument('--batch-size', type=int, default=2000, help="Rows per multi-row INSERT")
+    parser.add_argument('--xlsx-out', help="Also write bulk-upload admission files to this directory")
+    parser.add_argument('--xlsx-only', action='store_true', help="Only write admission files; don't touch the DB")
+    parser.add_argument('--xlsx-files', type=int, default=1)
+    parser.add_argument('--xlsx-rows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    for key, value in SCALES[args.scale].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+
+    if args.xlsx_only or args.xlsx_out:
+        args.xlsx_out = args.xlsx_out or str(Path(__file__).parent / 'results' / 'admissions')
+        for path in write_admission_files(args):
+            print(f"  wrote {path}")
+        if args.xlsx_only:
+            return
+
+    print(f"Seeding {args.db_name}@{args.db_host}: {args.students} students, {args.teachers} teachers, {args.days} days")
+    apply_schema(args, reset=args.reset)
+    seed(args)
+
+
+if __name__ == '__main__':
+    main()
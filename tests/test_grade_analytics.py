@@ -0,0 +1,54 @@
+from datetime import date
+
+import pytest
+
+from server import AT_RISK_THRESHOLD, compute_grade_analytics
+
+
+def grade(student_id, marks, max_marks=100, course_id=1, day=date(2026, 10, 5)):
+    return {"student_id": student_id, "marks": marks, "max_marks": max_marks, "course_id": course_id,
+            "course_name": f"Course {course_id}", "date": day, "student_name": f"S{student_id}", "usn": f"U{student_id}"}
+
+
+def test_empty_and_zero_max_marks():
+    result = compute_grade_analytics([grade(1, 5, max_marks=0)])
+    assert result['entries'] == 0 and result['mean'] is None and result['at_risk'] == []
+
+
+def test_stats_are_over_student_averages():
+    rows = [grade(1, 80), grade(1, 40, max_marks=50),   # 80% and 80% -> 80
+            grade(2, 30), grade(2, 10),                 # 20
+            grade(3, 50)]                               # 50
+    result = compute_grade_analytics(rows)
+    assert result['entries'] == 5
+    assert result['students'] == 3
+    assert result['mean'] == 50.0
+    assert result['median'] == 50.0
+    assert sum(b['count'] for b in result['histogram']) == 3
+    assert result['histogram'][2] == {"range": "20-30", "count": 1}
+
+
+def test_at_risk_sorted_lowest_first():
+    rows = [grade(1, AT_RISK_THRESHOLD - 1), grade(2, 10), grade(3, 90)]
+    at_risk = compute_grade_analytics(rows)['at_risk']
+    assert [s['student_id'] for s in at_risk] == [2, 1]
+    assert at_risk[0] == {"student_id": 2, "name": "S2", "usn": "U2", "average": 10.0, "graded_items": 1}
+
+
+def test_by_course_and_weekly_trend():
+    rows = [grade(1, 90, course_id=1, day=date(2026, 10, 5)),   # Monday
+            grade(2, 70, course_id=1, day=date(2026, 10, 11)),  # Sunday, same week
+            grade(1, 40, course_id=None, day=date(2026, 10, 12))]
+    result = compute_grade_analytics(rows)
+    assert result['by_course'] == [
+        {"course_id": None, "course_name": "Course None", "mean": 40.0, "entries": 1},
+        {"course_id": 1, "course_name": "Course 1", "mean": 80.0, "entries": 2},
+    ]
+    assert result['trend'] == [{"week": "2026-10-05", "mean": 80.0, "entries": 2},
+                               {"week": "2026-10-12", "mean": 40.0, "entries": 1}]
+
+
+def test_percentiles():
+    result = compute_grade_analytics([grade(i, i * 10) for i in range(1, 11)])
+    assert result['percentiles']['p10'] == pytest.approx(19.0)
+    assert result['percentiles']['p90'] == pytest.approx(91.0)
@@ -0,0 +1,56 @@
+from datetime import date
+
+import pytest
+
+from server import LeaveCalendar
+
+CSE_2A = ("CSE", "2", "A")
+
+
+def leave(leave_id, start, end, status="pending", class_key=CSE_2A, student_id=1):
+    return {"id": leave_id, "student_id": student_id, "student_name": "S", "class_key": class_key,
+            "start": start, "end": end, "status": status, "leave_type": "sick"}
+
+
+@pytest.fixture
+def calendar():
+    calendar = LeaveCalendar(date(2026, 9, 1))
+    calendar.add(leave(1, date(2026, 10, 5), date(2026, 10, 7)))
+    calendar.add(leave(2, date(2026, 10, 10), date(2026, 10, 10), status="approved", student_id=2))
+    return calendar
+
+
+def overlapping_ids(calendar, start, end):
+    return [e['id'] for e in calendar._overlapping(calendar.by_class[CSE_2A], start, end)]
+
+
+@pytest.mark.parametrize("start,end,expected", [
+    (date(2026, 10, 1), date(2026, 10, 4), []),    # ends the day before
+    (date(2026, 10, 1), date(2026, 10, 5), [1]),   # ends on the first day
+    (date(2026, 10, 7), date(2026, 10, 9), [1]),   # starts on the last day
+    (date(2026, 10, 8), date(2026, 10, 9), []),    # starts the day after
+    (date(2026, 10, 6), date(2026, 10, 6), [1]),   # inside
+    (date(2026, 10, 1), date(2026, 10, 31), [1, 2]),
+    (date(2026, 10, 10), date(2026, 10, 10), [2]),  # single-day leave
+])
+def test_overlapping_edges(calendar, start, end, expected):
+    assert overlapping_ids(calendar, start, end) == expected
+
+
+def test_on_leave_by_class(calendar):
+    assert [e['id'] for e in calendar.on_leave(CSE_2A, date(2026, 10, 6))] == [1]
+    assert calendar.on_leave(("CSE", "2", "B"), date(2026, 10, 6)) == []
+
+
+def test_rejected_and_old_leaves_are_not_indexed(calendar):
+    calendar.add(leave(3, date(2026, 10, 6), date(2026, 10, 6), status="rejected"))
+    calendar.add(leave(4, date(2026, 8, 1), date(2026, 8, 31)))
+    assert 3 not in calendar.entries and 4 not in calendar.entries
+
+
+def test_status_change_and_readd(calendar):
+    calendar.set_status(1, "hod_rejected")
+    assert overlapping_ids(calendar, date(2026, 10, 6), date(2026, 10, 6)) == []
+    calendar.add(leave(2, date(2026, 10, 11), date(2026, 10, 12), status="approved", student_id=2))
+    assert overlapping_ids(calendar, date(2026, 10, 10), date(2026, 10, 10)) == []
+    assert overlapping_ids(calendar, date(2026, 10, 12), date(2026, 10, 12)) == [2]
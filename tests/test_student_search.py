@@ -0,0 +1,81 @@
+import server
+from server import StudentSearchIndex
+
+
+def student(student_id, name, username, idno, email=None):
+    return {"id": student_id, "name": name, "username": username, "idno": idno,
+            "email": email or f"{username}@jainuniversity.ac.in",
+            "department": "CSE", "year": "2", "section": "A", "parent_id": None}
+
+
+def build(*docs):
+    index = StudentSearchIndex()
+    for doc in docs:
+        index.add(doc)
+    return index
+
+
+def test_exact_name_ranks_first():
+    index = build(student(1, "Ananya Rao", "ananya.r", "JU25BTECH001"),
+                  student(2, "Ananya Reddy", "ananya.re", "JU25BTECH002"),
+                  student(3, "Rahul Rao", "rahul.r", "JU25BTECH003"))
+    results = index.search("ananya rao")
+    assert results[0]['id'] == 1
+    assert {r['id'] for r in results} >= {1, 2}
+
+
+def test_typo_still_finds_student():
+    index = build(student(1, "Tejaswini Sharma", "tejaswini.s", "JU25BTECH101"),
+                  student(2, "Priya Menon", "priya.m", "JU25BTECH102"))
+    assert index.search("tejaswni")[0]['id'] == 1
+    assert index.search("sharmaa")[0]['id'] == 1
+    assert [r['id'] for r in index.search("tejaswini sahrma")][:1] == [1]
+
+
+def test_shared_grams_carry_little_weight():
+    # Every USN starts "ju25btech"; only the distinctive digits should decide the match
+    docs = [student(i, f"Student {i}", f"user{i}", f"JU25BTECH{i:05d}") for i in range(1, 60)]
+    index = build(*docs)
+    for gram in ("ju2", "bte", "tec"):
+        assert len(index.grams[gram]) == len(docs)
+    results = index.search("ju25btech00042")
+    assert results[0]['id'] == 42
+    assert results[0]['score'] > results[-1]['score']
+
+
+def test_unrelated_query_returns_nothing():
+    index = build(student(1, "Ananya Rao", "ananya.r", "JU25BTECH001"))
+    assert index.search("zzqx") == []
+    assert index.search("") == []
+
+
+def test_rare_grams_pick_the_candidates():
+    docs = [student(i, f"Kumar {i}", f"kumar{i}", f"JU25BTECH{i:05d}") for i in range(1, 40)]
+    docs.append(student(100, "Kumar Swamy", "kswamy", "JU25BTECH99999"))
+    index = build(*docs)
+    assert [r['id'] for r in index.search("kumar swamy", limit=3)] == [100]
+    assert index.search("kumar swmy", limit=3)[0]['id'] == 100
+
+
+def test_unspecific_query_is_capped(monkeypatch):
+    monkeypatch.setattr(server, 'SEARCH_MAX_CANDIDATES', 5)
+    index = build(*[student(i, f"Kumar {i}", f"kumar{i}", f"JU25BTECH{i:05d}") for i in range(1, 40)])
+    assert len(index.search("kumar", limit=50)) == 5
+
+
+def test_rerank_prefers_whole_field_then_prefix_then_substring():
+    index = build(student(1, "Arun", "arun1", "JU25BTECH201"),
+                  student(2, "Arunima", "arunima", "JU25BTECH202"),
+                  student(3, "Karun", "karun", "JU25BTECH203"))
+    assert [r['id'] for r in index.search("arun")] == [1, 2, 3]
+
+
+def test_remove_and_readd_update_postings():
+    index = build(student(1, "Ananya Rao", "ananya.r", "JU25BTECH001"))
+    index.remove(1)
+    assert index.search("ananya") == []
+    assert index.grams == {}
+    index.add(student(1, "Ananya Iyer", "ananya.i", "JU25BTECH001"))
+    index.add(student(1, "Ananya Iyer", "ananya.i", "JU25BTECH001"))
+    assert [r['id'] for r in index.search("iyer")] == [1]
+    assert index.search("rao") == []
@@ -0,0 +1,56 @@
+from urllib.parse import unquote
+
+import pytest
+from fastapi import HTTPException
+
+from server import content_disposition, parse_range
+
+
+def test_ascii_filename():
+    assert content_disposition("report.pdf") == "inline; filename=\"report.pdf\"; filename*=UTF-8''report.pdf"
+
+
+def test_non_latin1_filename_is_encodable():
+    header = content_disposition("अध्याय 1 – नोट्स.pdf")
+    header.encode('latin-1')
+    fallback = header.split('"')[1]
+    assert fallback.endswith(".pdf") and fallback.isascii()
+    assert unquote(header.split("UTF-8''")[1]) == "अध्याय 1 – नोट्स.pdf"
+
+
+def test_crlf_and_quotes_cannot_break_the_header():
+    header = content_disposition('evil\r\nSet-Cookie: a=b"\\.txt')
+    assert '\r' not in header and '\n' not in header
+    fallback = header.split('filename="')[1].split('"; filename*=')[0]
+    assert '"' not in fallback and '\\' not in fallback
+    assert unquote(header.split("UTF-8''")[1]) == 'evilSet-Cookie: a=b"\\.txt'
+
+
+def test_empty_fallback_uses_download():
+    assert content_disposition("\r\n").startswith('inline; filename="download"')
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),       # suffix longer than the body
+    ("bytes=900-5000", (900, 999)),  # end clamped to the body
+    ("bytes=999-999", (999, 999)),
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "bytes=0-10,20-30", "items=0-10", "bytes=a-b"])
+def test_unsupported_ranges_serve_the_whole_body(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header,size", [("bytes=1000-", 1000), ("bytes=50-10", 1000), ("bytes=0-", 0)])
+def test_unsatisfiable_range(header, size):
+    with pytest.raises(HTTPException) as exc:
+        parse_range(header, size)
+    assert exc.value.status_code == 416
+    assert exc.value.headers['Content-Range'] == f"bytes */{size}"
@@ -0,0 +1,69 @@
+import pytest
+from fastapi import HTTPException
+
+from server import MAX_CLASSES_PER_DAY, MAX_SLOTS_PER_DAY, TeacherOccupancy
+
+CSE_2A = ("CSE", "2", "A")
+CSE_2B = ("CSE", "2", "B")
+
+
+def slot_row(teacher_id, day, slot, class_key=CSE_2A):
+    department, year, section = class_key
+    return {"teacher_id": teacher_id, "day_of_week": day, "slot_number": slot,
+            "department": department, "year": year, "section": section}
+
+
+def test_free_teacher_has_no_conflict():
+    assert TeacherOccupancy().conflict(7, "Monday", 1, CSE_2A) is None
+
+
+def test_same_cell_in_another_class_conflicts():
+    occupancy = TeacherOccupancy().load([slot_row(7, "Monday", 3, CSE_2A)])
+    assert "slot 3" in occupancy.conflict(7, "Monday", 3, CSE_2B)
+    assert occupancy.conflict(7, "Tuesday", 3, CSE_2B) is None
+    assert occupancy.conflict(8, "Monday", 3, CSE_2B) is None
+
+
+def test_daily_cap():
+    occupancy = TeacherOccupancy().load([slot_row(7, "Monday", s, CSE_2A) for s in range(1, MAX_CLASSES_PER_DAY + 1)])
+    assert "maximum" in occupancy.conflict(7, "Monday", MAX_SLOTS_PER_DAY, CSE_2B)
+    assert "maximum" in occupancy.conflict(7, "Monday", MAX_SLOTS_PER_DAY, CSE_2A)
+    assert occupancy.conflict(7, "Tuesday", 1, CSE_2B) is None
+
+
+def test_overwriting_own_cell_does_not_count_towards_cap():
+    occupancy = TeacherOccupancy().load([slot_row(7, "Monday", s, CSE_2A) for s in range(1, MAX_CLASSES_PER_DAY + 1)])
+    assert occupancy.conflict(7, "Monday", 1, CSE_2A) is None
+
+
+def test_clear_class_frees_its_cells_only():
+    occupancy = TeacherOccupancy().load([slot_row(7, "Monday", 1, CSE_2A), slot_row(7, "Monday", 2, CSE_2B)])
+    occupancy.clear_class(CSE_2A)
+    assert occupancy.conflict(7, "Monday", 1, CSE_2B) is None
+    assert occupancy.conflict(7, "Monday", 2, CSE_2A) is not None
+    assert occupancy.day_count(occupancy.masks[7], 0) == 1
+
+
+def test_reassigning_a_cell_moves_the_teacher_bit():
+    occupancy = TeacherOccupancy()
+    occupancy.assign(CSE_2A, 0, 1, 7)
+    occupancy.assign(CSE_2A, 0, 1, 8)
+    assert occupancy.masks[7] == 0
+    assert occupancy.conflict(8, "Monday", 1, CSE_2B) is not None
+
+
+def test_mask_excluding_class():
+    occupancy = TeacherOccupancy().load([slot_row(7, "Monday", 1, CSE_2A), slot_row(7, "Tuesday", 2, CSE_2B)])
+    assert occupancy.mask_excluding_class(7, CSE_2A) == TeacherOccupancy.bit(1, 2)
+
+
+def test_load_skips_out_of_grid_rows():
+    occupancy = TeacherOccupancy().load([slot_row(7, "Sunday", 1), slot_row(7, "Monday", MAX_SLOTS_PER_DAY + 1)])
+    assert occupancy.masks == {}
+
+
+@pytest.mark.parametrize("day,slot", [("Sunday", 1), ("Monday", 0), ("Monday", MAX_SLOTS_PER_DAY + 1)])
+def test_invalid_cell_is_rejected(day, slot):
+    with pytest.raises(HTTPException) as exc:
+        TeacherOccupancy().conflict(7, day, slot, CSE_2A)
+    assert exc.value.status_code == 400